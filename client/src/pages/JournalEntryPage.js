@@ -1,27 +1,45 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useCallback } from "react";
 import EntryList from "../components/EntryList";
 import { getEntries } from "../utils/api";
 
 function JournalEntryPage() {
   const [entries, setEntries] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
 
-  useEffect(() => {
-    const fetchEntries = async () => {
-      try {
-        const response = await getEntries();
-        setEntries(response.data);
-      } catch (error) {
-        console.error("Error fetching entries:", error);
-      }
-    };
+  // Loads one page; the server hands back next_cursor until the last one
+  const fetchEntries = useCallback(async (cursor = null) => {
+    setLoading(true);
+    try {
+      const response = await getEntries(cursor ? { cursor } : {});
+      setEntries((previous) =>
+        cursor ? [...previous, ...response.data.entries] : response.data.entries
+      );
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error("Error fetching entries:", error);
+    } finally {
+      setLoading(false);
+    }
+  }, []);
 
+  useEffect(() => {
     fetchEntries();
-  }, []);
+  }, [fetchEntries]);
 
   return (
     <div className="container">
       <h1 className="mb-4">Journal Entries</h1>
       <EntryList entries={entries} />
+      {nextCursor && (
+        <button
+          onClick={() => fetchEntries(nextCursor)}
+          className="btn btn-outline-primary mb-4"
+          disabled={loading}
+        >
+          {loading ? "Loading..." : "Load more"}
+        </button>
+      )}
     </div>
   );
 }
@@ -16,13 +16,30 @@ api.interceptors.request.use(
     if (token) {
       config.headers["Authorization"] = `Bearer ${token}`;
     }
+    // Echoed back so reads right after a write see it (read replicas)
+    const lastWrite = localStorage.getItem("lastWrite");
+    if (lastWrite) {
+      config.headers["X-Last-Write"] = lastWrite;
+    }
     return config;
   },
   (error) => Promise.reject(error)
 );
 
+// Keeping the token the server hands out with each write that changed data
+api.interceptors.response.use(
+  (response) => {
+    const lastWrite = response.headers["x-last-write"];
+    if (lastWrite) {
+      localStorage.setItem("lastWrite", lastWrite);
+    }
+    return response;
+  },
+  (error) => Promise.reject(error)
+);
+
 // API functions for entries
-export const getEntries = () => api.get("/entries");
+export const getEntries = (params = {}) => api.get("/entries", { params });
 export const getEntry = (id) => api.get(`/entries/${id}`);
 export const createEntry = (data) => api.post("/entries", data);
 export const updateEntry = (id, data) => api.put(`/entries/${id}`, data);
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# ASGI entry point serving the same /api/* routes as app.py.
+#
+#   cd server && uvicorn asgi:application --workers 4 --port 5555
+#
+# The hot read routes (entry list/detail, photo list, tag list) run natively on
+# async SQLAlchemy sessions, so a worker keeps serving while PostgreSQL answers.
+# Every other route (writes, auth, export, search) is handed to the unchanged
+# Flask app through asgiref's WSGI adapter. Both paths authenticate, rate
+# limit and admit requests the same way, keyed on the client address that
+# PROXY_FIX_X_FOR says to trust. Calls into synchronous code that may block
+# (the identity lookup, Redis-backed caches and limits) run in asgiref's threads.
+# Needs: asgiref, uvicorn and asyncpg (PostgreSQL) or aiosqlite (SQLite).
+
+import re
+from urllib.parse import parse_qsl
+
+import jwt as pyjwt
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.wrappers import Response
+
+from app import app
+from auth import identity_cache, token_blocklist
+from cache import response_cache, entry_key, entry_photos_key, TAGS_KEY
+from compression import compression
+from database import async_database_uri
+from models import Entry, Photo, Tag
+from passwords import TooManyAttempts
+from ratelimit import rate_limiter, admission, client_key, RateLimited, Overloaded
+from queries import EMBEDDABLE, eager_options, entry_list_statement, embed_statements, split_page
+from serializers import serialize_entry, serialize_entry_rows, serialize_photo, serialize_tag
+
+engine = create_async_engine(
+    async_database_uri(app.config['SQLALCHEMY_DATABASE_URI']),
+    **app.config['SQLALCHEMY_ENGINE_OPTIONS']
+)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+wsgi_app = WsgiToAsgi(app)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, payload):
+        self.status = status
+        self.payload = payload
+
+
+def json_response(payload, status=200):
+    # Same encoder settings as Flask's jsonify, so bodies (and ETags) match
+    with app.app_context():
+        response = app.json.response(payload)
+    response.status_code = status
+    return response
+
+
+def conditional_response(hit, headers):
+    # hit is the (etag, body) pair kept in the shared response cache
+    etag, body = hit
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional({'REQUEST_METHOD': 'GET', 'HTTP_IF_NONE_MATCH': headers.get('if-none-match', '')})
+
+
+def blocking(func):
+    # func run off the event loop; these calls share no thread-bound state
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def current_identity(headers, optional=False):
+    # Mirrors flask_jwt_extended's jwt_required() and the loaders in auth.py:
+    # access tokens only, not revoked, naming a user that exists. The
+    # blocklist and identity cache answer from memory nearly always.
+    auth = headers.get('authorization')
+    if not auth:
+        if optional:
+            return None
+        raise HTTPError(401, {"msg": "Missing Authorization Header"})
+
+    scheme, _, token = auth.partition(' ')
+    if scheme != 'Bearer' or not token:
+        raise HTTPError(422, {"msg": "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"})
+    with app.app_context():
+        try:
+            jwt_data = decode_token(token)
+        except pyjwt.ExpiredSignatureError:
+            raise HTTPError(401, {"msg": "Token has expired"})
+        except pyjwt.InvalidTokenError as e:
+            raise HTTPError(422, {"msg": str(e)})
+        if jwt_data.get('type') != 'access':
+            raise HTTPError(422, {"msg": "Only non-refresh tokens are allowed"})
+        if token_blocklist.is_revoked(jwt_data['jti']):
+            raise HTTPError(401, {"error": "Token has been revoked"})
+        identity = jwt_data[app.config['JWT_IDENTITY_CLAIM']]
+        if identity_cache.get(identity) is None:
+            raise HTTPError(401, {"error": "User not found"})
+        return identity
+
+
+async def list_entries(session, args, headers, client):
+    if await blocking(current_identity)(headers, optional=True) is None:
+        await blocking(rate_limiter.check)('RATELIMIT_ANONYMOUS_READ', client_key(client))
+    try:
+        stmt, limit, include = entry_list_statement(args)
+    except ValueError as e:
+        raise HTTPError(400, {"error": str(e)})
+
+    rows, next_cursor = split_page((await session.execute(stmt)).all(), limit)
+    embedded = {name: (await session.execute(embed_stmt)).all()
+                for name, embed_stmt in embed_statements([row.id for row in rows], include).items()}
+    return json_response({"entries": serialize_entry_rows(rows, embedded), "next_cursor": next_cursor})
+
+
+async def get_entry(session, args, headers, client, id):
+    await blocking(current_identity)(headers, optional=True)
+    hit, generation = await blocking(response_cache.get)(entry_key(id))
+    if hit is None:
+        entry = await session.get(Entry, id, options=eager_options(EMBEDDABLE))
+        if entry is None:
+            raise HTTPError(404, {"error": "Entry not found"})
+        body = json_response(serialize_entry(entry, EMBEDDABLE)).get_data()
+        hit = await blocking(response_cache.store)(entry_key(id), body, generation)
+    return conditional_response(hit, headers)
+
+
+async def get_entry_photos(session, args, headers, client, id):
+    await blocking(current_identity)(headers)
+    hit, generation = await blocking(response_cache.get)(entry_photos_key(id))
+    if hit is None:
+        if await session.get(Entry, id) is None:
+            raise HTTPError(404, {"error": "Entry not found"})
+        photos = (await session.scalars(select(Photo).filter_by(entry_id=id))).all()
+        body = json_response([serialize_photo(photo) for photo in photos]).get_data()
+        hit = await blocking(response_cache.store)(entry_photos_key(id), body, generation)
+    return conditional_response(hit, headers)
+
+
+async def get_tags(session, args, headers, client):
+    await blocking(current_identity)(headers)
+    hit, generation = await blocking(response_cache.get)(TAGS_KEY)
+    if hit is None:
+        tags = (await session.scalars(select(Tag))).all()
+        body = json_response([serialize_tag(tag, with_created_at=True) for tag in tags]).get_data()
+        hit = await blocking(response_cache.store)(TAGS_KEY, body, generation)
+    return conditional_response(hit, headers)
+
+
+# (pattern, handler) for the GET routes served natively; the rest go to Flask
+ASYNC_ROUTES = [
+    (re.compile(r'^/api/entries$'), list_entries),
+    (re.compile(r'^/api/entries/(?P<id>\d+)$'), get_entry),
+    (re.compile(r'^/api/entries/(?P<id>\d+)/photos$'), get_entry_photos),
+    (re.compile(r'^/api/tags$'), get_tags),
+]
+
+
+def client_address(scope, headers):
+    # The address Flask's request.remote_addr gives behind ProxyFix: the
+    # PROXY_FIX_X_FOR-th X-Forwarded-For value from the right, if trusted
+    trusted = app.config['PROXY_FIX_X_FOR']
+    if trusted:
+        forwarded = [value.strip() for value in headers.get('x-forwarded-for', '').split(',')]
+        if len(forwarded) >= trusted and forwarded[-trusted]:
+            return forwarded[-trusted]
+    return (scope.get('client') or (None,))[0]
+
+
+def limit_response(error):
+    # Same responses as the error handlers in factory.py
+    if isinstance(error, RateLimited):
+        response, retry_after = json_response({"error": "Too many requests"}, 429), error.retry_after
+    elif isinstance(error, TooManyAttempts):
+        response, retry_after = json_response({"error": "Too many concurrent attempts"}, 429), 1
+    else:
+        response, retry_after = json_response({"error": "Server busy, try again shortly"}, 503), 1
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+async def send_response(send, response, headers):
+    # CORS(app) allows every origin; keep the async routes consistent with it
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+    compression.compress_response(response, headers.get('Accept-Encoding'))
+    body = response.get_data()
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        for pattern, handler in ASYNC_ROUTES:
+            match = pattern.match(scope['path'])
+            if match is None:
+                continue
+
+            args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+            headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+            kwargs = {name: int(value) for name, value in match.groupdict().items()}
+            client = client_address(scope, headers)
+            # The same limits as Flask's before_request hooks apply; a full
+            # process sheds at once, as the event loop must not wait for a slot
+            try:
+                await blocking(rate_limiter.check)('RATELIMIT_DEFAULT', client_key(client))
+                with admission.admit(client, wait=False):
+                    async with Session() as session:
+                        response = await handler(session, args, headers, client, **kwargs)
+            except HTTPError as e:
+                response = json_response(e.payload, e.status)
+            except (RateLimited, Overloaded, TooManyAttempts) as e:
+                response = limit_response(e)
+            return await send_response(send, response, headers)
+
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,205 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify
+from sqlalchemy import delete, func, select
+from models import db, User, RevokedToken
+from cache import MemoryBackend
+from db_utils import insert_ignore
+from replicas import primary_reads
+
+# Authentication without database queries on the common path: the user a
+# token names comes from a per-process identity cache, and the revocation
+# check consults a Bloom filter of revoked token ids before the table.
+
+
+class IdentityCache:
+    # User columns by id for the JWT user lookup. Entries expire after
+    # IDENTITY_CACHE_TTL seconds and are dropped when this process changes the
+    # user; other workers see the change once their copy expires. Unknown ids
+    # are cached too, so a deleted user's tokens don't query on every request.
+
+    def __init__(self):
+        self.backend = MemoryBackend(10000, 60)
+
+    def init_app(self, app):
+        self.backend = MemoryBackend(app.config.get('IDENTITY_CACHE_SIZE', 10000),
+                                     app.config.get('IDENTITY_CACHE_TTL', 60))
+        app.extensions['identity_cache'] = self
+
+    def get(self, user_id):
+        # Returns a dict of id, username, email and created_at, or None
+        user = self.backend.get(user_id)
+        if user is None:
+            # Not stored if this process invalidates the user meanwhile
+            generation = self.backend.generation(user_id)
+            with primary_reads():
+                row = db.session.execute(
+                    select(User.id, User.username, User.email, User.created_at).where(User.id == user_id)
+                ).first()
+            user = dict(row._mapping) if row is not None else {}
+            self.backend.set(user_id, user, generation)
+        return user or None
+
+    def invalidate(self, user_id):
+        self.backend.delete(user_id)
+
+
+class BloomFilter:
+    # Bit array sized for `capacity` items at `error_rate` false positives
+    # (about 1.8 bytes per item at 0.1%); the k positions come from one
+    # BLAKE2b digest by double hashing
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenBlocklist:
+    # Revoked jtis live in the revoked_tokens table. Each process keeps a
+    # Bloom filter of them, so a token that was never revoked (nearly every
+    # request) is accepted without a query; a filter hit is confirmed against
+    # the table. New rows from other processes are picked up by id at most
+    # every TOKEN_BLOCKLIST_SYNC_SECONDS. A full reload every
+    # TOKEN_BLOCKLIST_RELOAD_SECONDS drops expired tokens and catches rows
+    # whose transaction committed out of id order.
+
+    def __init__(self):
+        self.capacity = 100000
+        self.error_rate = 0.001
+        self.sync_seconds = 2.0
+        self.reload_seconds = 300.0
+        self._filter = None
+        self._last_id = 0
+        self._loaded_at = 0.0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.capacity = app.config.get('TOKEN_BLOCKLIST_CAPACITY', self.capacity)
+        self.error_rate = app.config.get('TOKEN_BLOCKLIST_ERROR_RATE', self.error_rate)
+        self.sync_seconds = app.config.get('TOKEN_BLOCKLIST_SYNC_SECONDS', self.sync_seconds)
+        self.reload_seconds = app.config.get('TOKEN_BLOCKLIST_RELOAD_SECONDS', self.reload_seconds)
+        self._filter = None
+        app.extensions['token_blocklist'] = self
+
+    def warm(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        last_id = db.session.scalar(select(func.max(RevokedToken.id))) or 0
+        jtis = db.session.scalars(
+            select(RevokedToken.jti).where(RevokedToken.id <= last_id, RevokedToken.expires_at > datetime.utcnow())
+        ).all()
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        self._filter, self._last_id = bloom, last_id
+        self._loaded_at = self._synced_at = time.monotonic()
+
+    def _sync(self):
+        rows = db.session.execute(
+            select(RevokedToken.id, RevokedToken.jti).where(RevokedToken.id > self._last_id).order_by(RevokedToken.id)
+        ).all()
+        for row in rows:
+            self._filter.add(row.jti)
+            self._last_id = row.id
+        self._synced_at = time.monotonic()
+        if self._filter.count > self._filter.capacity:
+            # Past capacity the false positive rate climbs; resize
+            self._load()
+
+    def is_revoked(self, jti):
+        # Reads the primary: a replica may not have a revocation yet
+        with primary_reads():
+            with self._lock:
+                now = time.monotonic()
+                if self._filter is None or now - self._loaded_at >= self.reload_seconds:
+                    self._load()
+                elif now - self._synced_at >= self.sync_seconds:
+                    self._sync()
+                maybe = jti in self._filter
+            if not maybe:
+                return False
+            return db.session.scalar(select(RevokedToken.id).filter_by(jti=jti)) is not None
+
+    def revoke(self, jwt_data):
+        # Adds the token to the table in the caller's transaction and to this
+        # process' filter straight away
+        exp = jwt_data.get('exp')
+        insert_ignore(db.session, RevokedToken, [{
+            "jti": jwt_data['jti'],
+            "token_type": jwt_data['type'],
+            "user_id": jwt_data.get(current_app.config['JWT_IDENTITY_CLAIM']),
+            "revoked_at": datetime.utcnow(),
+            "expires_at": datetime.utcfromtimestamp(exp) if exp is not None else datetime(9999, 12, 31),
+        }])
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jwt_data['jti'])
+
+    def purge_expired(self):
+        # Expired tokens are rejected on their own; their rows can go
+        result = db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+        db.session.commit()
+        return result.rowcount
+
+
+identity_cache = IdentityCache()
+token_blocklist = TokenBlocklist()
+
+
+def init_jwt(jwt):
+    # Wires the cache and blocklist into flask-jwt-extended: every
+    # @jwt_required() route checks revocation and loads `current_user`
+
+    @jwt.token_in_blocklist_loader
+    def check_revoked(jwt_header, jwt_data):
+        return token_blocklist.is_revoked(jwt_data['jti'])
+
+    @jwt.user_lookup_loader
+    def load_user(jwt_header, jwt_data):
+        return identity_cache.get(jwt_data[current_app.config['JWT_IDENTITY_CLAIM']])
+
+    @jwt.revoked_token_loader
+    def revoked_token(jwt_header, jwt_data):
+        return jsonify({"error": "Token has been revoked"}), 401
+
+    @jwt.user_lookup_error_loader
+    def unknown_user(jwt_header, jwt_data):
+        return jsonify({"error": "User not found"}), 401
+
+
+def auth_config_from_env():
+    return {
+        'JWT_ACCESS_TOKEN_EXPIRES': timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', 15))),
+        'JWT_REFRESH_TOKEN_EXPIRES': timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', 30))),
+        'IDENTITY_CACHE_TTL': int(os.getenv('IDENTITY_CACHE_TTL', 60)),
+        'IDENTITY_CACHE_SIZE': int(os.getenv('IDENTITY_CACHE_SIZE', 10000)),
+        'TOKEN_BLOCKLIST_CAPACITY': int(os.getenv('TOKEN_BLOCKLIST_CAPACITY', 100000)),
+        'TOKEN_BLOCKLIST_ERROR_RATE': float(os.getenv('TOKEN_BLOCKLIST_ERROR_RATE', 0.001)),
+        'TOKEN_BLOCKLIST_SYNC_SECONDS': float(os.getenv('TOKEN_BLOCKLIST_SYNC_SECONDS', 2)),
+        'TOKEN_BLOCKLIST_RELOAD_SECONDS': float(os.getenv('TOKEN_BLOCKLIST_RELOAD_SECONDS', 300)),
+    }
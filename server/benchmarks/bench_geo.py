@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Map viewport and nearby query latency over a large entries table. Entries are
+# scattered around the gazetteer cities, so a city-sized viewport holds a few
+# hundred of them whatever the table size.
+#
+#   cd server && python benchmarks/bench_geo.py --rows 100000 1000000
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+parser.add_argument('--queries', type=int, default=200)
+args = parser.parse_args()
+
+db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+os.environ['DATABASE_URI'] = f'sqlite:///{db_file}'
+os.environ['RATELIMIT_ENABLED'] = '0'  # one client issues every request
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert  # noqa: E402
+from app import app  # noqa: E402
+from models import db, User, Entry  # noqa: E402
+from geo import encode_geohash, _gazetteer  # noqa: E402
+
+random.seed(42)
+cities = sorted(set(_gazetteer().values()))
+client = app.test_client()
+
+
+def seed(total, existing):
+    start = datetime(2020, 1, 1)
+    batch = 50000
+    for offset in range(existing, total, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, total)):
+            lat, lng = random.choice(cities)
+            lat, lng = lat + random.gauss(0, 0.5), lng + random.gauss(0, 0.5)
+            lat, lng = max(min(lat, 90), -90), (lng + 180) % 360 - 180
+            rows.append({"location": f"Spot {i}", "date": start + timedelta(minutes=i), "user_id": 1,
+                         "latitude": lat, "longitude": lng, "geohash": encode_geohash(lat, lng)})
+        db.session.execute(insert(Entry), rows)
+    db.session.commit()
+
+
+def timed(urls):
+    timings, sizes = [], []
+    for url in urls:
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(response.get_json()['entries']))
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)], statistics.mean(sizes)
+
+
+with app.app_context():
+    db.create_all()
+    db.session.execute(insert(User).values(username='bench', email='bench@example.com', password_hash='x'))
+    db.session.commit()
+
+    print(f"{'rows':>9} {'query':<8} {'p50 ms':>8} {'p95 ms':>8} {'avg hits':>9}")
+    seeded = 0
+    for total in args.rows:
+        seed(total, seeded)
+        seeded = total
+        centers = [random.choice(cities) for _ in range(args.queries)]
+        bbox_urls = [f'/api/entries/bbox?min_lat={lat - 0.05}&max_lat={lat + 0.05}'
+                     f'&min_lng={lng - 0.08}&max_lng={lng + 0.08}' for lat, lng in centers]
+        nearby_urls = [f'/api/entries/nearby?lat={lat}&lng={lng}&radius_km=5' for lat, lng in centers]
+        for name, urls in (('bbox', bbox_urls), ('nearby', nearby_urls)):
+            p50, p95, hits = timed(urls)
+            print(f"{total:>9} {name:<8} {p50:>8.2f} {p95:>8.2f} {hits:>9.1f}")
+
+os.unlink(db_file)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Login throughput benchmark for the password hashing service.
+#
+#   cd server && python benchmarks/bench_login.py --workers 4 --clients 16 --logins 200
+#
+# Runs against a throwaway SQLite database through the Flask test client and
+# reports logins/sec overall and per hashing worker (one worker per core).
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='hashing processes (0 = inline)')
+parser.add_argument('--clients', type=int, default=16, help='concurrent login threads')
+parser.add_argument('--logins', type=int, default=200, help='total logins to perform')
+parser.add_argument('--method', default=None, help='werkzeug hash method, e.g. pbkdf2:sha256:600000')
+args = parser.parse_args()
+
+db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+os.environ['DATABASE_URI'] = f'sqlite:///{db_file.name}'
+os.environ['PASSWORD_HASH_WORKERS'] = str(args.workers)
+os.environ['AUTH_CONCURRENCY_LIMIT'] = str(args.clients)
+os.environ['RATELIMIT_ENABLED'] = '0'  # one client address issues every login
+if args.method:
+    os.environ['PASSWORD_HASH_METHOD'] = args.method
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+from passwords import password_hasher  # noqa: E402
+
+with app.app_context():
+    db.create_all()
+
+client = app.test_client()
+usernames = [f'bench_{i}' for i in range(args.clients)]
+for name in usernames:
+    client.post('/api/users/register', json={'username': name, 'email': f'{name}@example.com', 'password_hash': 'secret'})
+
+
+def login(i):
+    started = time.perf_counter()
+    response = client.post('/api/users/login', json={'username': usernames[i % len(usernames)], 'password': 'secret'})
+    return response.status_code, time.perf_counter() - started
+
+
+started = time.perf_counter()
+with ThreadPoolExecutor(max_workers=args.clients) as pool:
+    results = list(pool.map(login, range(args.logins)))
+elapsed = time.perf_counter() - started
+password_hasher.shutdown()
+os.unlink(db_file.name)
+
+latencies = sorted(latency for _, latency in results)
+failures = sum(1 for status, _ in results if status != 200)
+throughput = args.logins / elapsed
+cores = max(args.workers, 1)
+
+print(f"method:            {password_hasher.method}")
+print(f"hash workers:      {args.workers or 'inline'}")
+print(f"logins:            {args.logins} ({failures} failed)")
+print(f"throughput:        {throughput:.1f} logins/s")
+print(f"per core:          {throughput / cores:.1f} logins/s")
+print(f"p50 / p99 latency: {latencies[len(latencies) // 2] * 1000:.1f} / "
+      f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
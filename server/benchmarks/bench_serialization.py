@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# List-endpoint serialization benchmark: ORM hydration + strftime + pretty
+# stdlib JSON (the old entry_list path) against column tuples + row serializer
+# + the compact FastJSONProvider.
+#
+#   cd server && python benchmarks/bench_serialization.py --rows 10000 100000 1000000
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+parser.add_argument('--repeat', type=int, default=3, help='best of N runs')
+args = parser.parse_args()
+
+db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+os.environ['DATABASE_URI'] = f'sqlite:///{db_file}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select  # noqa: E402
+from app import app  # noqa: E402
+from models import db, User, Entry  # noqa: E402
+from queries import ENTRY_COLUMNS  # noqa: E402
+from serializers import serialize_entry_rows  # noqa: E402
+
+
+def legacy(limit):
+    entries = db.session.scalars(select(Entry).order_by(Entry.id).limit(limit)).all()
+    entries_list = [
+        {
+            "id": entry.id,
+            "location": str(entry.location),
+            "date": entry.date.strftime('%Y-%m-%d %H:%M:%S') if entry.date else None,
+            "description": str(entry.description),
+            "user_id": entry.user_id
+        } for entry in entries
+    ]
+    return json.dumps(entries_list, indent=2, sort_keys=True).encode()
+
+
+def fast(limit):
+    rows = db.session.execute(select(*ENTRY_COLUMNS).order_by(Entry.id).limit(limit)).all()
+    return app.json.dump_bytes(serialize_entry_rows(rows))
+
+
+def best_of(fn, limit):
+    timings = []
+    for _ in range(args.repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        body = fn(limit)
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(body)
+
+
+with app.app_context():
+    db.create_all()
+    db.session.execute(insert(User).values(username='bench', email='bench@example.com', password_hash='x'))
+    start = datetime(2020, 1, 1)
+    batch = 50000
+    for offset in range(0, max(args.rows), batch):
+        db.session.execute(insert(Entry), [
+            {"location": f"City {i % 1000}", "date": start + timedelta(minutes=i),
+             "description": f"Day {i} of the trip", "user_id": 1}
+            for i in range(offset, min(offset + batch, max(args.rows)))
+        ])
+    db.session.commit()
+
+    print(f"{'rows':>9} {'path':<7} {'seconds':>8} {'rows/s':>11} {'MB':>7}")
+    for limit in args.rows:
+        for name, fn in (('legacy', legacy), ('fast', fast)):
+            seconds, size = best_of(fn, limit)
+            print(f"{limit:>9} {name:<7} {seconds:>8.3f} {limit / seconds:>11.0f} {size / 1e6:>7.1f}")
+
+os.unlink(db_file)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# Import time of the WSGI app, which every gunicorn worker (and every `flask`
+# command) pays before doing anything. Runs `python -X importtime -c "import
+# app"` a few times in fresh interpreters, prints the slowest top-level
+# imports of the best run and fails when it is over budget, or when a module
+# kept out of the web process (Alembic, Pillow, boto3) is imported again.
+#
+#   cd server && python benchmarks/import_time.py
+#   cd server && python benchmarks/import_time.py --budget-ms 300 --runs 10
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--module', default='app', help='module to import, from server/')
+parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to time; the fastest counts')
+parser.add_argument('--budget-ms', type=float, default=450.0)
+parser.add_argument('--forbid', nargs='*', default=['alembic', 'flask_migrate', 'PIL', 'boto3'],
+                    help='top-level packages the import must not pull in')
+parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+args = parser.parse_args()
+
+
+def measure(env):
+    # [(self us, cumulative us, depth, name)] in the order Python reports them
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {args.module}'],
+                            cwd=SERVER_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((int(own), int(cumulative), len(indent) // 2, name))
+    return rows
+
+
+def main():
+    env = dict(os.environ)
+    # Any database will do, nothing connects at import
+    env.setdefault('DATABASE_URI', f'sqlite:///{os.path.join(tempfile.gettempdir(), "import_time.db")}')
+
+    runs = [measure(env) for _ in range(args.runs)]
+    totals = [next(cumulative for _, cumulative, _, name in rows if name == args.module) for rows in runs]
+    best = runs[totals.index(min(totals))]
+
+    print(f"import {args.module}: best {min(totals) / 1000:.1f} ms, "
+          f"median {sorted(totals)[len(totals) // 2] / 1000:.1f} ms over {args.runs} runs")
+    print(f"{'cumulative':>12} {'self':>9}  module")
+    # What the module imports directly, each with everything it pulled in
+    direct = sorted((row for row in best if row[2] == 1), key=lambda row: -row[1])
+    for own, cumulative, _, name in direct[:args.top]:
+        print(f"{cumulative / 1000:10.1f}ms {own / 1000:7.1f}ms  {name}")
+
+    failures = []
+    if min(totals) / 1000 > args.budget_ms:
+        failures.append(f"import {args.module} took {min(totals) / 1000:.1f} ms, budget {args.budget_ms:.0f} ms")
+    imported = {name.split('.')[0] for _, _, _, name in best}
+    for package in args.forbid:
+        if package in imported:
+            failures.append(f"{package} is imported by 'import {args.module}'")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
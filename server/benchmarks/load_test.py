@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Compares the WSGI (gunicorn) and ASGI (uvicorn) serving modes.
+#
+#   cd server && python benchmarks/load_test.py --entries 20000 --concurrency 32
+#   cd server && python benchmarks/load_test.py --database-uri postgresql://... --no-seed
+#
+# Each mode is started as a real server on localhost and hammered with
+# keep-alive HTTP GETs from a thread pool; requests/sec and p50/p99 latency are
+# reported per path and mode.
+
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def commands(args):
+    return {
+        'wsgi': ['gunicorn', '--workers', str(args.workers), '--threads',
+                 str(max(args.concurrency // args.workers, 1)), '--bind', f'127.0.0.1:{args.port}', 'app:app'],
+        'asgi': ['uvicorn', '--workers', str(args.workers), '--port', str(args.port), '--log-level', 'warning',
+                 'asgi:application'],
+    }
+
+
+def seed(uri, count):
+    os.environ['DATABASE_URI'] = uri
+    sys.path.insert(0, SERVER_DIR)
+    from sqlalchemy import insert
+    from app import app
+    from models import db, User, Entry
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User).values(username='load', email='load@example.com', password_hash='x'))
+        start = datetime(2020, 1, 1)
+        rows = [{"location": f"Place {i % 500}", "date": start + timedelta(hours=i),
+                 "description": "Load test entry", "user_id": 1} for i in range(count)]
+        for offset in range(0, count, 5000):
+            db.session.execute(insert(Entry), rows[offset:offset + 5000])
+        db.session.commit()
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server did not start on port {port}')
+
+
+def drive(port, path, total, concurrency):
+    per_client = total // concurrency
+
+    def client(_):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        latencies, errors = [], 0
+        for _ in range(per_client):
+            started = time.perf_counter()
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - started)
+            errors += response.status >= 400
+        conn.close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for chunk, _ in results for latency in chunk)
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+        'errors': sum(errors for _, errors in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+    parser.add_argument('--database-uri', help='defaults to a throwaway SQLite file')
+    parser.add_argument('--no-seed', action='store_true', help='use the data already in --database-uri')
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per path and mode')
+    parser.add_argument('--port', type=int, default=5599)
+    parser.add_argument('--paths', nargs='+', default=['/api/entries?limit=50', '/api/entries/1'])
+    args = parser.parse_args()
+
+    db_file = None
+    uri = args.database_uri
+    if uri is None:
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        uri = f'sqlite:///{db_file}'
+    if not args.no_seed:
+        seed(uri, args.entries)
+
+    # One client address issues every request; measure the server, not the limiter
+    env = dict(os.environ, DATABASE_URI=uri, RATELIMIT_ENABLED='0', ADMISSION_PER_CLIENT='0')
+    modes = ['wsgi', 'asgi'] if args.mode == 'both' else [args.mode]
+    print(f"{'mode':<6} {'path':<32} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        for mode in modes:
+            server = subprocess.Popen(commands(args)[mode], cwd=SERVER_DIR, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port(args.port)
+                for path in args.paths:
+                    drive(args.port, path, args.concurrency * 5, args.concurrency)  # warm-up
+                    stats = drive(args.port, path, args.requests, args.concurrency)
+                    print(f"{mode:<6} {path:<32} {stats['rps']:>9.1f} {stats['p50']:>8.1f} "
+                          f"{stats['p99']:>8.1f} {stats['errors']:>7}")
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        if db_file:
+            os.unlink(db_file)
+
+
+if __name__ == '__main__':
+    main()
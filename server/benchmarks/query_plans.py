@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# Query plan regression check for the API routes. Seeds a throwaway
+# database, drives every route through the test client, records each SQL
+# statement a request issues and EXPLAINs it. Exits with status 1 when
+#
+#   - a statement reads a whole table (SQLite "SCAN <table>", PostgreSQL
+#     "Seq Scan" with enable_seqscan off) outside ALLOWED_SCANS, or
+#   - one request issues the same statement more than MAX_REPEATS times,
+#     the shape of an N+1 query.
+#
+#   cd server && python benchmarks/query_plans.py
+#   cd server && python benchmarks/query_plans.py --database-uri postgresql://... --verbose
+#
+# tests/test_query_plans.py runs the same check() on a small seed.
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert  # noqa: E402
+from models import db, User, Entry, Photo, Tag, EntryTag  # noqa: E402
+from passwords import password_hasher  # noqa: E402
+from geo import encode_geohash  # noqa: E402
+import jobs  # noqa: E402
+import stats  # noqa: E402
+import sync  # noqa: E402
+
+# Full reads these routes need by design: label -> tables
+ALLOWED_SCANS = {
+    'GET /api/tags': {'tags'},  # lists every tag
+    'GET /api/entries/export': {'entries'},  # exports every entry
+    'GET /api/sync': {'tags'},  # a first sync fetches every tag
+    'GET /api/tags/suggest': {'tags'},  # the first call loads the prefix index
+}
+# Identical statements one request may issue before it counts as N+1
+MAX_REPEATS = 2
+EXPLAINED = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+
+def seed(entry_count):
+    users = 100
+    password_hash = password_hasher.hash('secret')
+    db.session.execute(insert(User), [
+        {"username": f'user{i}', "email": f'user{i}@example.com',
+         "password_hash": password_hash, "created_at": datetime(2024, 1, 1)}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(insert(Tag), [{"name": f'tag{i}'} for i in range(50)])
+    start = datetime(2020, 1, 1)
+    cities = [(48.8566, 2.3522), (35.6762, 139.6503), (-33.8688, 151.2093), (40.7128, -74.0060)]
+    entries, photos, links = [], [], []
+    for i in range(1, entry_count + 1):
+        lat, lng = cities[i % len(cities)]
+        lat, lng = lat + (i % 97) / 1000, lng + (i % 89) / 1000
+        entries.append({"id": i, "location": f'City {i % 40}', "date": start + timedelta(hours=i),
+                        "description": f'Day {i} of the trip', "user_id": i % users + 1,
+                        "latitude": lat, "longitude": lng, "geohash": encode_geohash(lat, lng)})
+        photos += [{"entry_id": i, "url": f'http://example.com/{i}-{n}.jpg'} for n in range(2)]
+        links += [{"entry_id": i, "tag_id": (i + n) % 50 + 1} for n in range(3)]
+    for offset in range(0, entry_count, 5000):
+        db.session.execute(insert(Entry), entries[offset:offset + 5000])
+    for rows in (photos, links):
+        for offset in range(0, len(rows), 5000):
+            db.session.execute(insert(Photo if rows is photos else EntryTag), rows[offset:offset + 5000])
+    db.session.commit()
+    stats.rebuild_user_stats()
+    sync.rebuild_change_log()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+
+
+class Recorder:
+    def __init__(self):
+        self.statements = None
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.statements is not None and not executemany:
+            self.statements.append((statement, parameters))
+
+    @contextmanager
+    def record(self):
+        self.statements = []
+        try:
+            yield self.statements
+        finally:
+            self.statements = None
+
+
+def explain(statement, parameters):
+    # Returns (plan lines, tables read in full)
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql('SET enable_seqscan = off')
+            plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+            nodes, scans, stack = [], set(), [plan[0]['Plan']]
+            while stack:
+                node = stack.pop()
+                nodes.append(f"{node['Node Type']} {node.get('Relation Name', '')} {node.get('Index Name', '')}".strip())
+                if node['Node Type'] == 'Seq Scan':
+                    scans.add(node['Relation Name'])
+                stack.extend(node.get('Plans', []))
+            connection.rollback()
+            return nodes, scans
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    lines = [row[-1] for row in rows]
+    scans = {match.group(1) for line in lines if (match := re.fullmatch(r'SCAN (\w+)(?: AS \w+)?', line))}
+    # Subqueries and CTEs (anon_1, ...) are scanned too; only tables count
+    return lines, scans & set(db.metadata.tables)
+
+
+def shape(statement):
+    # Collapses IN lists so batched statements of any size compare equal
+    return re.sub(r'\((?:\s*(?:\?|%\(\w+\)s|__\[POSTCOMPILE_\w+\])\s*,?)+\)', '(...)', ' '.join(statement.split()))
+
+
+def image_bytes():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (30, 120, 200)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def scenarios(app, client):
+    # (label, callable returning the response); later steps use ids from earlier ones
+    state = {}
+
+    def login():
+        response = client.post('/api/users/login', json={'username': 'user1', 'password': 'secret'})
+        tokens = response.get_json()
+        state['auth'] = {'Authorization': f"Bearer {tokens['access_token']}"}
+        state['refresh'] = {'Authorization': f"Bearer {tokens['refresh_token']}"}
+        return response
+
+    def auth():
+        return state['auth']
+
+    def create_entry():
+        response = client.post('/api/entries', json={'location': 'Paris', 'date': '2024-05-01',
+                                                     'description': 'Louvre'}, headers=auth())
+        state['entry'] = response.get_json()['id']
+        return response
+
+    def add_photo():
+        response = client.post(f"/api/entries/{state['entry']}/photos", json={'url': 'http://example.com/x.jpg'},
+                               headers=auth())
+        state['photo'] = response.get_json()['id']
+        return response
+
+    def upload_photo():
+        response = client.post(f"/api/entries/{state['entry']}/photos", headers=auth(),
+                               data={'photo': (io.BytesIO(state['image']), 'a.jpg')},
+                               content_type='multipart/form-data')
+        state['upload'] = response.get_json()
+        return response
+
+    def full_sync():
+        response = client.get('/api/sync?limit=500', headers=auth())
+        state['sync'] = response.get_json()['next']
+        return response
+
+    def timeline(granularity, rollup):
+        app.config['TIMELINE_ROLLUP'] = rollup
+        return client.get(f'/api/entries/timeline?user_id=2&granularity={granularity}&ids=5')
+
+    def first_page_cursor():
+        return client.get('/api/entries?limit=20').get_json()['next_cursor']
+
+    steps = [
+        ('POST /api/users/register', lambda: client.post('/api/users/register', json={
+            'username': 'new', 'email': 'new@example.com', 'password_hash': 'pw'})),
+        ('POST /api/users/login', login),
+        ('POST /api/users/refresh', lambda: client.post('/api/users/refresh', headers=state['refresh'])),
+        ('GET /api/users/profile', lambda: client.get('/api/users/profile', headers=auth())),
+        ('PUT /api/users/profile', lambda: client.put('/api/users/profile', json={'username': 'user1'},
+                                                      headers=auth())),
+        ('GET /api/users/profile/stats', lambda: client.get('/api/users/profile/stats', headers=auth())),
+        ('GET /api/entries', lambda: client.get('/api/entries?limit=20')),
+        ('GET /api/entries?cursor', lambda: client.get(f'/api/entries?limit=20&cursor={first_page_cursor()}')),
+        ('GET /api/entries?user_id', lambda: client.get('/api/entries?user_id=2&limit=20')),
+        ('GET /api/entries?location', lambda: client.get('/api/entries?location=City%201&limit=20')),
+        ('GET /api/entries?tag', lambda: client.get('/api/entries?tag=tag7&limit=20')),
+        ('GET /api/entries?date_from', lambda: client.get('/api/entries?date_from=2020-03-01&date_to=2020-03-31')),
+        ('GET /api/entries?include', lambda: client.get('/api/entries?include=photos,tags&limit=50')),
+        ('GET /api/entries/search', lambda: client.get('/api/entries/search?q=trip')),
+        ('GET /api/entries/bbox', lambda: client.get('/api/entries/bbox?min_lat=48.8&max_lat=49&min_lng=2.3&max_lng=2.5')),
+        ('GET /api/entries/nearby', lambda: client.get('/api/entries/nearby?lat=48.86&lng=2.35&radius_km=5')),
+        ('GET /api/entries/timeline', lambda: timeline('week', True)),
+        ('GET /api/entries/timeline (entries)', lambda: timeline('month', False)),
+        ('GET /api/entries/export', lambda: client.get('/api/entries/export?format=ndjson', headers=auth())),
+        ('GET /api/entries/export?user_id', lambda: client.get('/api/entries/export?user_id=2', headers=auth())),
+        ('POST /api/entries', create_entry),
+        ('GET /api/entries/<id>', lambda: client.get(f"/api/entries/{state['entry']}", headers=auth())),
+        ('PUT /api/entries/<id>', lambda: client.put(f"/api/entries/{state['entry']}",
+                                                     json={'location': 'Lyon'}, headers=auth())),
+        ('POST /api/entries/<id>/photos', add_photo),
+        ('GET /api/entries/<id>/photos', lambda: client.get(f"/api/entries/{state['entry']}/photos", headers=auth())),
+        ('DELETE /api/entries/<id>/photos/<id>', lambda: client.delete(
+            f"/api/entries/{state['entry']}/photos/{state['photo']}", headers=auth())),
+        ('GET /api/tags', lambda: client.get('/api/tags', headers=auth())),
+        ('POST /api/tags', lambda: client.post('/api/tags', json={'name': 'fresh'}, headers=auth())),
+        ('POST /api/tags (existing)', lambda: client.post('/api/tags', json={'name': 'TAG7'}, headers=auth())),
+        ('GET /api/tags/suggest', lambda: client.get('/api/tags/suggest?prefix=tag1', headers=auth())),
+        ('POST /api/entries/<id>/tags', lambda: client.post(f"/api/entries/{state['entry']}/tags",
+                                                            json={'tag_id': 3}, headers=auth())),
+        ('DELETE /api/entries/<id>/tags/<id>', lambda: client.delete(f"/api/entries/{state['entry']}/tags/4",
+                                                                     headers=auth())),
+        ('POST /api/entries/batch', lambda: client.post('/api/entries/batch', json={'entries': [
+            {'location': 'Rome', 'date': '2024-06-01'} for _ in range(20)]}, headers=auth())),
+        ('POST /api/entries/photos/batch', lambda: client.post('/api/entries/photos/batch', json={'photos': [
+            {'entry_id': n, 'url': f'http://example.com/b{n}.jpg'} for n in range(1, 21)]}, headers=auth())),
+        ('POST /api/entries/tags/batch', lambda: client.post('/api/entries/tags/batch', json={'tags': [
+            {'entry_id': n, 'tag_id': 10} for n in range(1, 21)]
+            + [{'entry_id': state['entry'], 'tag_id': tag_id} for tag_id in (5, 6, 7)]}, headers=auth())),
+        ('DELETE /api/tags/<id>', lambda: client.delete('/api/tags/10', headers=auth())),
+    ]
+    state['image'] = image_bytes()
+    if state['image'] is not None:
+        steps += [
+            ('POST /api/entries/<id>/photos (upload)', upload_photo),
+            ('jobs: render thumbnails', lambda: jobs.drain()),
+            ('GET /api/entries/<id>/photos/<id>/file', lambda: client.get(
+                f"/api/entries/{state['entry']}/photos/{state['upload']['id']}/file", headers=auth())),
+            ('GET /media/<key>', lambda: client.get(state['upload']['url'])),
+        ]
+    steps += [
+        ('DELETE /api/entries/<id>', lambda: client.delete(f"/api/entries/{state['entry']}", headers=auth())),
+        ('jobs: release files', lambda: jobs.drain()),
+        ('GET /api/sync', full_sync),
+        ('GET /api/sync?since', lambda: client.get(f"/api/sync?since={state['sync']}", headers=auth())),
+        ('POST /api/users/logout', lambda: client.post('/api/users/logout', headers=auth())),
+    ]
+    return steps
+
+
+def issues(label, statements):
+    # Problems with one request's (statement, parameters) list, and its plans
+    found, plans = [], []
+    for statement_shape, count in Counter(shape(s) for s, _ in statements).items():
+        if count > MAX_REPEATS:
+            found.append(f'N+1: {count} x {statement_shape[:100]}')
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith(EXPLAINED):
+            continue
+        lines, scans = explain(statement, parameters)
+        for table in scans - ALLOWED_SCANS.get(label, set()):
+            found.append(f'full scan of {table}: {" ".join(statement.split())[:100]}')
+        plans.append(f'    {shape(statement)}\n      ' + '\n      '.join(lines))
+    return found, plans
+
+
+def check(app):
+    # Runs every scenario against the app's (seeded) database. Returns
+    # (label, status, statement count, issues, plans) per step.
+    recorder = Recorder()
+    results = []
+    with app.app_context():
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', recorder)
+        try:
+            client = app.test_client()
+            recorded = []
+            for label, step in scenarios(app, client):
+                with recorder.record() as statements:
+                    response = step()
+                status = getattr(response, 'status_code', '')
+                if hasattr(response, 'close'):
+                    response.close()
+                recorded.append((label, status, list(statements)))
+        finally:
+            event.remove(engine, 'before_cursor_execute', recorder)
+        for label, status, statements in recorded:
+            found, plans = issues(label, statements)
+            results.append((label, status, len(statements), found, plans))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', help='an empty database to seed; defaults to a throwaway SQLite file')
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--verbose', action='store_true', help='print every statement and its plan')
+    args = parser.parse_args()
+
+    db_file = None
+    if args.database_uri is None:
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URI'] = args.database_uri or f'sqlite:///{db_file}'
+    os.environ['RATELIMIT_ENABLED'] = '0'
+    os.environ['PHOTO_ROOT'] = tempfile.mkdtemp(prefix='query-plans-')
+    from app import app
+
+    with app.app_context():
+        db.create_all()
+        seed(args.entries)
+    problems = []
+    print(f"{'route':<44} {'status':>6} {'queries':>7}  issues")
+    for label, status, count, found, plans in check(app):
+        print(f'{label:<44} {status:>6} {count:>7}  {"; ".join(found) or "ok"}')
+        if args.verbose:
+            for plan in plans:
+                print(plan)
+        problems += [(label, issue) for issue in found]
+
+    if db_file is not None:
+        os.unlink(db_file)
+    if problems:
+        print(json.dumps(problems, indent=2))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
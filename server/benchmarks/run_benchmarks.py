@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# Throughput and latency of the API routes, with JSON baselines for
+# comparing commits. Seeds a throwaway database with seed.generate() unless
+# told otherwise, then drives each route through the Flask test client (one
+# request at a time) or over HTTP against gunicorn (--http, concurrent
+# keep-alive clients).
+#
+#   cd server && python benchmarks/run_benchmarks.py --users 2000 --save
+#   cd server && python benchmarks/run_benchmarks.py --users 2000 --compare benchmarks/baselines/<sha>.json
+#   cd server && python benchmarks/run_benchmarks.py --database-uri postgresql://... --no-seed --http
+#
+# --compare exits with status 1 when a route's p95 latency rose, or its
+# throughput fell, by more than --threshold. tests/test_benchmarks.py runs
+# the routes and the comparison against a small generated data set.
+
+import argparse
+import functools
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(SERVER_DIR, 'benchmarks', 'baselines')
+
+sys.path.insert(0, SERVER_DIR)
+
+from sqlalchemy import func, make_url, select  # noqa: E402
+from models import db, User, Entry, Photo, Tag  # noqa: E402
+
+
+def dataset(app, username=None):
+    # Row counts plus the ids and values request templates draw from
+    with app.app_context():
+        username = username or db.session.scalar(select(User.username).order_by(User.id).limit(1))
+        user_id = db.session.scalar(select(User.id).filter_by(username=username))
+        if user_id is None:
+            sys.exit('No user to log in as; seed the database or pass --username')
+        sample = db.session.execute(
+            select(Entry.id, Entry.latitude, Entry.longitude, Entry.location).order_by(func.random()).limit(200)
+        ).all()
+        return {
+            'counts': {model.__tablename__: db.session.scalar(select(func.count()).select_from(model))
+                       for model in (User, Entry, Photo, Tag)},
+            'username': username,
+            'user_id': user_id,
+            'user_ids': db.session.scalars(select(User.id).order_by(func.random()).limit(200)).all(),
+            'own_entries': db.session.scalars(select(Entry.id).filter_by(user_id=user_id).limit(200)).all(),
+            'entries': sample,
+            'tags': db.session.scalars(select(Tag.name).order_by(Tag.id).limit(20)).all(),
+            'tag_ids': db.session.scalars(select(Tag.id).order_by(Tag.id).limit(20)).all(),
+        }
+
+
+def routes(data, rng):
+    # (name, writes, request factory); a factory returns (method, path, JSON body)
+    from seed import WORDS
+
+    def entry():
+        return rng.choice(data['entries'])
+
+    def point():
+        row = next(row for row in iter(entry, None) if row.latitude is not None)
+        return row.latitude, row.longitude
+
+    def bbox():
+        lat, lng = point()
+        return f'/api/entries/bbox?min_lat={lat - 0.5}&max_lat={lat + 0.5}&min_lng={lng - 0.5}&max_lng={lng + 0.5}'
+
+    def nearby():
+        lat, lng = point()
+        return f'/api/entries/nearby?lat={lat}&lng={lng}&radius_km=10'
+
+    def new_entry():
+        return {'location': entry().location.split(',')[0], 'date': '2024-05-01', 'description': 'Benchmark entry'}
+
+    return [
+        ('GET /api/users/profile', False, lambda: ('GET', '/api/users/profile', None)),
+        ('GET /api/users/profile/stats', False, lambda: ('GET', '/api/users/profile/stats', None)),
+        ('GET /api/entries', False, lambda: ('GET', '/api/entries?limit=20', None)),
+        ('GET /api/entries?user_id', False,
+         lambda: ('GET', f"/api/entries?user_id={rng.choice(data['user_ids'])}&limit=20", None)),
+        ('GET /api/entries?tag', False, lambda: ('GET', f"/api/entries?tag={rng.choice(data['tags'])}&limit=20", None)),
+        ('GET /api/entries?include', False, lambda: ('GET', '/api/entries?include=photos,tags&limit=50', None)),
+        ('GET /api/entries/search', False,
+         lambda: ('GET', f"/api/entries/search?q={rng.choice(WORDS)}", None)),
+        ('GET /api/entries/bbox', False, lambda: ('GET', bbox(), None)),
+        ('GET /api/entries/nearby', False, lambda: ('GET', nearby(), None)),
+        ('GET /api/entries/<id>', False, lambda: ('GET', f'/api/entries/{entry().id}', None)),
+        ('GET /api/entries/<id>/photos', False,
+         lambda: ('GET', f"/api/entries/{rng.choice(data['own_entries'])}/photos", None)),
+        ('GET /api/entries/export?user_id', False,
+         lambda: ('GET', f"/api/entries/export?user_id={data['user_id']}", None)),
+        ('GET /api/tags', False, lambda: ('GET', '/api/tags', None)),
+        ('POST /api/entries', True, lambda: ('POST', '/api/entries', new_entry())),
+        ('PUT /api/entries/<id>', True, lambda: ('PUT', f"/api/entries/{rng.choice(data['own_entries'])}",
+                                                 {'description': 'Edited by the benchmark'})),
+        ('POST /api/entries/batch', True,
+         lambda: ('POST', '/api/entries/batch', {'entries': [new_entry() for _ in range(20)]})),
+        ('POST /api/entries/tags/batch', True, lambda: ('POST', '/api/entries/tags/batch', {'tags': [
+            {'entry_id': rng.choice(data['own_entries']), 'tag_id': rng.choice(data['tag_ids'])}
+            for _ in range(20)]})),
+    ]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[max(int(len(latencies) * p) - 1, 0)] * 1000
+
+    return {'requests': len(latencies), 'rps': len(latencies) / elapsed, 'p50': percentile(0.50),
+            'p95': percentile(0.95), 'p99': percentile(0.99), 'errors': errors}
+
+
+def run_test_client(app, factory, total, headers):
+    client = app.test_client()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(total):
+        method, path, body = factory()
+        request_started = time.perf_counter()
+        response = client.open(path, method=method, json=body, headers=headers)
+        response.get_data()
+        latencies.append(time.perf_counter() - request_started)
+        errors += response.status_code >= 400
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_http(port, concurrency, factory, total, headers):
+    per_client = max(total // concurrency, 1)
+
+    def client(_):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        latencies, errors = [], 0
+        for _ in range(per_client):
+            method, path, body = factory()
+            request_headers = dict(headers)
+            if body is not None:
+                body = json.dumps(body)
+                request_headers['Content-Type'] = 'application/json'
+            started = time.perf_counter()
+            conn.request(method, path, body=body, headers=request_headers)
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - started)
+            errors += response.status >= 400
+        conn.close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize([latency for chunk, _ in results for latency in chunk],
+                     sum(errors for _, errors in results), elapsed)
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server did not start on port {port}')
+
+
+def login(app, data, password):
+    response = app.test_client().post('/api/users/login',
+                                      json={'username': data['username'], 'password': password})
+    if response.status_code != 200:
+        sys.exit(f"Could not log in as {data['username']}: {response.get_json()}")
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def commit_id():
+    try:
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR, text=True).strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD'], cwd=SERVER_DIR).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{sha}-dirty' if dirty else sha
+
+
+def compare(results, baseline_path, threshold):
+    # Prints the change per route; returns the routes past the threshold
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {baseline_path} ({baseline['commit']}, {baseline['created_at']}):")
+    print(f"{'route':<36} {'req/s':>9} {'p95':>9}")
+    regressions = []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        rps_change = result['rps'] / before['rps'] - 1
+        p95_change = result['p95'] / before['p95'] - 1 if before['p95'] else 0.0
+        regressed = rps_change < -threshold or p95_change > threshold
+        print(f"{name:<36} {rps_change:>+9.1%} {p95_change:>+9.1%}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', help='defaults to a throwaway SQLite file')
+    parser.add_argument('--no-seed', action='store_true', help='use the data already in --database-uri')
+    parser.add_argument('--users', type=int, default=1000, help='users to generate (about 30 entries each)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the data and the request mix')
+    parser.add_argument('--username', help='account to log in as (default: the first generated user)')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--routes', nargs='+', help='only routes whose name contains one of these')
+    parser.add_argument('--read-only', action='store_true', help='skip routes that write')
+    parser.add_argument('--http', action='store_true', help='serve with gunicorn and load it over HTTP')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes (--http)')
+    parser.add_argument('--concurrency', type=int, default=16, help='HTTP clients (--http)')
+    parser.add_argument('--port', type=int, default=5598)
+    parser.add_argument('--save', nargs='?', const='', metavar='PATH',
+                        help='write the results as JSON (default: benchmarks/baselines/<commit>.json)')
+    parser.add_argument('--compare', metavar='PATH', help='a baseline written by --save')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed regression, as a fraction')
+    args = parser.parse_args()
+
+    db_file = None
+    if args.database_uri is None:
+        db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URI'] = args.database_uri or f'sqlite:///{db_file}'
+    # Measure the routes, not the limiter: every request comes from one address
+    os.environ['RATELIMIT_ENABLED'] = '0'
+    os.environ['ADMISSION_PER_CLIENT'] = '0'
+    os.environ['JOBS_EAGER'] = '1'
+    from app import app
+    import seed
+
+    if not args.no_seed:
+        started = time.perf_counter()
+        with app.app_context():
+            seed.generate(args.users, seed=args.seed)
+        print(f'Seeded {args.users} users in {time.perf_counter() - started:.1f}s')
+
+    rng = random.Random(args.seed)
+    data = dataset(app, args.username)
+    headers = login(app, data, args.password)
+    selected = [(name, factory) for name, writes, factory in routes(data, rng)
+                if not (writes and args.read_only)
+                and (not args.routes or any(part in name for part in args.routes))]
+
+    server = None
+    if args.http:
+        server = subprocess.Popen(
+            ['gunicorn', '--workers', str(args.workers),
+             '--threads', str(max(args.concurrency // args.workers, 1)),
+             '--bind', f'127.0.0.1:{args.port}', 'app:app'],
+            cwd=SERVER_DIR, env=dict(os.environ), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if args.http:
+        run = functools.partial(run_http, args.port, args.concurrency)
+    else:
+        run = functools.partial(run_test_client, app)
+
+    results = {}
+    print(f"{'route':<36} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        if server is not None:
+            wait_for_port(args.port)
+        for name, factory in selected:
+            run(factory, max(args.requests // 10, 1), headers)  # warm-up
+            stats = results[name] = run(factory, args.requests, headers)
+            print(f"{name:<36} {stats['rps']:>9.1f} {stats['p50']:>8.1f} {stats['p95']:>8.1f} "
+                  f"{stats['p99']:>8.1f} {stats['errors']:>7}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if db_file:
+            os.unlink(db_file)
+
+    if args.save is not None:
+        commit = commit_id()
+        path = args.save or os.path.join(BASELINE_DIR, f'{commit}.json')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'commit': commit,
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'dialect': make_url(os.environ['DATABASE_URI']).get_backend_name(),
+                'mode': f'http x{args.concurrency}' if args.http else 'test client',
+                'dataset': data['counts'],
+                'requests_per_route': args.requests,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+        print(f'\nSaved {path}')
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from models import db, Entry, Photo, Tag, EntryTag
+from db_utils import insert_ignore
+from geo import coordinate_columns
+import stats
+import sync
+
+MAX_BATCH_SIZE = 5000
+
+
+def _insert_returning_ids(model, rows):
+    # One multi-row INSERT ... RETURNING id; sort_by_parameter_order keeps the
+    # returned ids aligned with `rows` on every backend
+    if not rows:
+        return []
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    return db.session.scalars(stmt, rows).all()
+
+
+def _int_field(item, key):
+    value = item.get(key) if isinstance(item, dict) else None
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+def _text_error(item, key, label, column, required=True):
+    # Why item[key] can't go into `column` (missing, not a string, longer
+    # than the column allows), or None; the database may not check the length
+    value = item.get(key)
+    if value is None or value == '':
+        return f"{label} is required." if required else None
+    if not isinstance(value, str):
+        return f"{label} must be a string."
+    length = getattr(column.type, 'length', None)
+    if length is not None and len(value) > length:
+        return f"{label} must be at most {length} characters."
+    return None
+
+
+def _existing_ids(model, ids):
+    ids.discard(None)
+    if not ids:
+        return set()
+    return set(db.session.scalars(select(model.id).where(model.id.in_(ids))))
+
+
+def bulk_create_entries(items, user_id):
+    results = [None] * len(items)
+    rows, positions = [], []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {"index": index, "error": "Location is required."}
+            continue
+        error = (_text_error(item, 'location', "Location", Entry.location)
+                 or _text_error(item, 'description', "Description", Entry.description, required=False))
+        if error:
+            results[index] = {"index": index, "error": error}
+            continue
+        try:
+            entry_date = datetime.strptime(item.get('date') or '', '%Y-%m-%d')
+        except (TypeError, ValueError):
+            results[index] = {"index": index, "error": "Invalid date format. Use 'YYYY-MM-DD'."}
+            continue
+
+        try:
+            coordinates = coordinate_columns(item, item['location'])
+        except ValueError as e:
+            results[index] = {"index": index, "error": str(e)}
+            continue
+
+        rows.append({
+            "location": item['location'],
+            "date": entry_date,
+            "description": item.get('description'),
+            "user_id": user_id,
+            "created_at": datetime.utcnow(),
+            **coordinates
+        })
+        positions.append(index)
+
+    new_ids = _insert_returning_ids(Entry, rows)
+    for index, new_id in zip(positions, new_ids):
+        results[index] = {"index": index, "id": new_id}
+    stats.entries_added(user_id, rows)
+    sync.entries_saved(new_ids, user_id)
+    return results
+
+
+def bulk_create_photos(items):
+    results = [None] * len(items)
+    rows, positions = [], []
+    entry_ids = _existing_ids(Entry, {_int_field(item, 'entry_id') for item in items})
+
+    for index, item in enumerate(items):
+        error = _text_error(item, 'url', "Photo URL", Photo.url) if isinstance(item, dict) else "Photo URL is required."
+        if error:
+            results[index] = {"index": index, "error": error}
+            continue
+        if _int_field(item, 'entry_id') not in entry_ids:
+            results[index] = {"index": index, "error": "Entry not found"}
+            continue
+
+        rows.append({"url": item['url'], "entry_id": item['entry_id'], "uploaded_at": datetime.utcnow()})
+        positions.append(index)
+
+    new_ids = _insert_returning_ids(Photo, rows)
+    for index, row, new_id in zip(positions, rows, new_ids):
+        results[index] = {"index": index, "id": new_id, "entry_id": row['entry_id'], "url": row['url']}
+    stats.photos_added([row['entry_id'] for row in rows])
+    if rows:
+        sync.photos_saved([(new_id, row['entry_id']) for new_id, row in zip(new_ids, rows)])
+    return results
+
+
+def bulk_add_entry_tags(items):
+    results = [None] * len(items)
+    pairs = set()
+    entry_ids = _existing_ids(Entry, {_int_field(item, 'entry_id') for item in items})
+    tag_ids = _existing_ids(Tag, {_int_field(item, 'tag_id') for item in items})
+
+    for index, item in enumerate(items):
+        if _int_field(item, 'entry_id') not in entry_ids:
+            results[index] = {"index": index, "error": "Entry not found"}
+            continue
+        if _int_field(item, 'tag_id') not in tag_ids:
+            results[index] = {"index": index, "error": "Tag not found"}
+            continue
+
+        pairs.add((item['entry_id'], item['tag_id']))
+        results[index] = {"index": index, "entry_id": item['entry_id'], "tag_id": item['tag_id']}
+
+    # Only links that don't exist yet are inserted and counted in the stats
+    if pairs:
+        pairs -= set(db.session.execute(
+            select(EntryTag.entry_id, EntryTag.tag_id)
+            .where(EntryTag.entry_id.in_({e for e, _ in pairs}), EntryTag.tag_id.in_({t for _, t in pairs}))
+        ).tuples())
+    insert_ignore(db.session, EntryTag, [{"entry_id": e, "tag_id": t} for e, t in sorted(pairs)])
+    stats.tag_links_added(pairs)
+    if pairs:
+        sync.tag_links_saved(sorted(pairs))
+    return results
@@ -0,0 +1,212 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+from replicas import primary_reads
+
+
+class NullBackend:
+    # CACHE_BACKEND=none: nothing is stored, responses still carry ETags
+
+    def get(self, key):
+        return None
+
+    def generation(self, key):
+        return 0
+
+    def set(self, key, value, generation=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend:
+    # In-process LRU with a per-item TTL. Only one process sees its
+    # invalidations, so as a response cache it is for single-process
+    # deployments (one web worker, JOBS_EAGER) only.
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every delete; a value computed before one isn't stored
+        self._generation = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def generation(self, key):
+        return self._generation
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._items.clear()
+
+
+class RedisBackend:
+    # Shared cache across workers and the job worker. Each key has a hash of
+    # etag, body and the generation it was computed under, and a generation
+    # counter that delete() increments; a hash from an older generation (a
+    # fill that raced an invalidation) reads as a miss. Accepts any client
+    # exposing redis-py's hash, counter and pipeline calls.
+
+    def __init__(self, client, ttl=300, prefix='tj:cache:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _generation_key(self, key):
+        return f'{self.prefix}gen:{key}'
+
+    def get(self, key):
+        fields, generation = (self.client.pipeline()
+                              .hmget(self.prefix + key, 'etag', 'body', 'gen')
+                              .get(self._generation_key(key))
+                              .execute())
+        etag, body, stored = fields
+        if etag is None or int(stored) != int(generation or 0):
+            return None
+        return etag.decode(), body
+
+    def generation(self, key):
+        return int(self.client.get(self._generation_key(key)) or 0)
+
+    def set(self, key, value, generation=None):
+        etag, body = value
+        if generation is None:
+            generation = self.generation(key)
+        (self.client.pipeline()
+         .hset(self.prefix + key, mapping={'etag': etag, 'body': body, 'gen': generation})
+         .expire(self.prefix + key, self.ttl)
+         .execute())
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        pipe = self.client.pipeline()
+        for key in keys:
+            # Outlives any value filled under the old generation
+            pipe.incr(self._generation_key(key)).expire(self._generation_key(key), 2 * self.ttl)
+        pipe.delete(*(self.prefix + key for key in keys)).execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend or NullBackend()
+
+    def init_app(self, app):
+        # CACHE_BACKEND=redis needs the optional `redis` package
+        ttl = int(app.config.get('CACHE_TTL', 300))
+        backend = app.config.get('CACHE_BACKEND')
+        if backend == 'redis':
+            import redis
+            client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+            self.backend = RedisBackend(client, ttl=ttl)
+        elif backend == 'memory':
+            self.backend = MemoryBackend(int(app.config.get('CACHE_MAX_ENTRIES', 1024)), ttl)
+        else:
+            self.backend = NullBackend()
+        app.extensions['response_cache'] = self
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def get(self, key):
+        # (etag, body) or None, plus the generation to pass to store() after
+        # computing the body on a miss
+        hit = self.backend.get(key)
+        return hit, (self.backend.generation(key) if hit is None else None)
+
+    def store(self, key, body, generation):
+        hit = (hashlib.blake2b(body, digest_size=16).hexdigest(), body)
+        self.backend.set(key, hit, generation)
+        return hit
+
+    def cached(self, key_func):
+        # Caches the body of successful GET responses under key_func(**view_args)
+        # and answers If-None-Match with 304 using the stored strong ETag
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                key = key_func(**kwargs)
+                hit, generation = self.get(key)
+                if hit is None:
+                    # Filled from the primary: a lagging replica could cache an old version
+                    with primary_reads():
+                        response = view(*args, **kwargs)
+                    response, status = response if isinstance(response, tuple) else (response, 200)
+                    if status != 200:
+                        return response, status
+                    hit = self.store(key, response.get_data(), generation)
+
+                etag, body = hit
+                response = Response(body, mimetype='application/json')
+                response.set_etag(etag)
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+
+def entry_key(id):
+    return f'entry:{id}'
+
+
+def entry_photos_key(id):
+    return f'entry:{id}:photos'
+
+
+TAGS_KEY = 'tags'
+
+
+def cache_config_from_env():
+    return {
+        'CACHE_BACKEND': os.getenv('CACHE_BACKEND', 'none'),
+        'CACHE_REDIS_URL': os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+        'CACHE_TTL': int(os.getenv('CACHE_TTL', 300)),
+        'CACHE_MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 1024)),
+    }
+
+
+response_cache = ResponseCache()
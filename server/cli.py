@@ -0,0 +1,93 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup, ScriptInfo
+
+from models import db
+from auth import token_blocklist
+import geo
+import jobs
+import stats
+import sync
+
+
+class MigrateGroup(click.Group):
+    # `flask db ...` from Flask-Migrate, imported when a db command runs.
+    # Alembic is about half of the app's import time and no request needs it.
+
+    def _commands(self, ctx):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as db_cli
+
+        app = ctx.ensure_object(ScriptInfo).load_app()
+        if 'migrate' not in app.extensions:
+            Migrate(app, db)
+        return db_cli
+
+    def list_commands(self, ctx):
+        return self._commands(ctx).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._commands(ctx).get_command(ctx, name)
+
+
+# Backfill or repair the per-user stats: flask stats rebuild [--user-id N]
+stats_cli = AppGroup('stats', help='Per-user journal statistics.')
+
+@stats_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+def rebuild_stats(user_id):
+    stats.rebuild_user_stats(user_id)
+    click.echo("User stats rebuilt" + (f" for user {user_id}" if user_id is not None else ""))
+
+# Change log upkeep: flask sync compact | flask sync rebuild
+sync_cli = AppGroup('sync', help='Change feed for delta sync.')
+
+@sync_cli.command('compact')
+@click.option('--tombstone-days', type=int, default=None, help='Defaults to SYNC_TOMBSTONE_DAYS.')
+def compact_changes(tombstone_days):
+    days = tombstone_days if tombstone_days is not None else current_app.config['SYNC_TOMBSTONE_DAYS']
+    click.echo(f"Deleted {sync.compact(days)} changes")
+
+@sync_cli.command('rebuild')
+def rebuild_changes():
+    sync.rebuild_change_log()
+    click.echo("Logged every entry, photo, tag and tag link as changed")
+
+# Geocode entries that have no coordinates yet: flask geo backfill
+geo_cli = AppGroup('geo', help='Entry coordinates.')
+
+@geo_cli.command('backfill')
+def backfill_geo():
+    click.echo(f"Geocoded {geo.backfill_coordinates()} entries")
+
+# Delete revoked tokens that have expired anyway: flask auth purge-revoked
+auth_cli = AppGroup('auth', help='Tokens and revocation.')
+
+@auth_cli.command('purge-revoked')
+def purge_revoked():
+    click.echo(f"Purged {token_blocklist.purge_expired()} expired revoked tokens")
+
+# Background jobs: flask jobs worker --processes 4
+jobs_cli = AppGroup('jobs', help='Background job queue.')
+
+@jobs_cli.command('worker')
+@click.option('--processes', type=int, default=1, help='Worker processes to run.')
+@click.option('--poll-interval', type=float, default=1.0, help='Seconds to wait when no job is due.')
+def jobs_worker(processes, poll_interval):
+    jobs.run_workers(current_app._get_current_object(), processes, poll_interval)
+
+@jobs_cli.command('drain')
+def jobs_drain():
+    config = current_app.config
+    click.echo(f"Ran {jobs.drain(config['JOBS_LEASE_SECONDS'], config['JOBS_RETRY_BASE_SECONDS'])} jobs")
+
+@jobs_cli.command('purge')
+@click.option('--older-than-days', type=int, default=7, help='Keep finished jobs newer than this.')
+def jobs_purge(older_than_days):
+    click.echo(f"Purged {jobs.purge(older_than_days)} finished jobs")
+
+
+def register_commands(app):
+    app.cli.add_command(MigrateGroup('db', help='Database migrations (Flask-Migrate).'))
+    for group in (stats_cli, sync_cli, geo_cli, auth_cli, jobs_cli):
+        app.cli.add_command(group)
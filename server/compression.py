@@ -0,0 +1,164 @@
+import mimetypes
+import os
+import zlib
+
+from flask import request, send_file
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml',
+    'image/svg+xml', 'text/',
+)
+# Streamed bodies are sync-flushed at least this often, so NDJSON/CSV exports
+# keep reaching the client progressively instead of all at the end
+STREAM_FLUSH_BYTES = 64 * 1024
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._zobj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._zobj.compress(data)
+
+    def flush(self):
+        return self._zobj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zobj.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class Compression:
+    def __init__(self):
+        self.min_size = 500
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        self.static_folder = None
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.gzip_level = app.config.get('COMPRESS_LEVEL', self.gzip_level)
+        self.brotli_quality = app.config.get('COMPRESS_BR_LEVEL', self.brotli_quality)
+        self.static_folder = app.static_folder
+        app.before_request(self._serve_precompressed_static)
+        app.after_request(self._after_request)
+        app.extensions['compression'] = self
+
+    def acceptable(self, accept_encoding):
+        # Supported codings the client accepts, best first (br wins ties)
+        accepted = parse_accept_header(accept_encoding or '', Accept)
+        options = (['br'] if brotli is not None else []) + ['gzip']
+        ranked = sorted(options, key=lambda coding: accepted.quality(coding), reverse=True)
+        return [coding for coding in ranked if accepted.quality(coding) > 0]
+
+    def negotiate(self, accept_encoding):
+        codings = self.acceptable(accept_encoding)
+        return codings[0] if codings else None
+
+    def _compressor(self, coding):
+        return _Brotli(self.brotli_quality) if coding == 'br' else _Gzip(self.gzip_level)
+
+    def _serve_precompressed_static(self):
+        # client/build assets are served from .br/.gz siblings when the build
+        # produced them; otherwise Flask sends the file untouched
+        if request.endpoint != 'static' or not self.static_folder:
+            return None
+        filename = safe_join(self.static_folder, request.view_args.get('filename', ''))
+        if filename is None or not os.path.isfile(filename):
+            return None
+        for coding in self.acceptable(request.headers.get('Accept-Encoding')):
+            compressed = filename + PRECOMPRESSED_SUFFIXES[coding]
+            if os.path.isfile(compressed):
+                response = send_file(compressed, mimetype=mimetypes.guess_type(filename)[0], conditional=True)
+                response.headers['Content-Encoding'] = coding
+                response.vary.add('Accept-Encoding')
+                return response
+        return None
+
+    def should_compress(self, response):
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return False
+        if 'Content-Encoding' in response.headers or response.direct_passthrough:
+            # Already encoded, or a file being sent as-is (static assets)
+            return False
+        if 'no-transform' in response.headers.get('Cache-Control', ''):
+            return False
+        if not response.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return False
+        if not response.is_streamed and (response.calculate_content_length() or 0) < self.min_size:
+            return False
+        return True
+
+    def compress_response(self, response, accept_encoding):
+        response.vary.add('Accept-Encoding')
+        if not self.should_compress(response):
+            return response
+        coding = self.negotiate(accept_encoding)
+        if coding is None:
+            return response
+
+        compressor = self._compressor(coding)
+        if response.is_streamed:
+            response.response = self._stream(response.response, compressor)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compressor.compress(response.get_data()) + compressor.finish())
+        response.headers['Content-Encoding'] = coding
+
+        # Different bytes per encoding: downgrade to a weak validator, which
+        # If-None-Match still matches against the uncompressed strong ETag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    @staticmethod
+    def _stream(chunks, compressor):
+        pending = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_BYTES:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+
+    def _after_request(self, response):
+        return self.compress_response(response, request.headers.get('Accept-Encoding'))
+
+
+def compression_config_from_env():
+    return {
+        'COMPRESS_MIN_SIZE': int(os.getenv('COMPRESS_MIN_SIZE', 500)),
+        'COMPRESS_LEVEL': int(os.getenv('COMPRESS_LEVEL', 6)),
+        'COMPRESS_BR_LEVEL': int(os.getenv('COMPRESS_BR_LEVEL', 4)),
+    }
+
+
+compression = Compression()
@@ -0,0 +1,36 @@
+import os
+
+from sqlalchemy.engine import make_url
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options_from_env(uri):
+    # Connection pool tuning shared by the WSGI and ASGI apps, read from .env:
+    # DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+    options = {
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+    if uri and make_url(uri).get_backend_name() != 'sqlite':
+        # SQLite uses a file lock rather than a sized connection pool
+        options.update({
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        })
+    return options
+
+
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def async_database_uri(uri):
+    # ASYNC_DATABASE_URI wins; otherwise swap in the async driver for the backend
+    if os.getenv('ASYNC_DATABASE_URI'):
+        return os.getenv('ASYNC_DATABASE_URI')
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}').render_as_string(hide_password=False)
@@ -0,0 +1,69 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def insert_ignore(session, model, rows):
+    # INSERT ... ON CONFLICT DO NOTHING, so callers can upsert on a primary
+    # key without reading the row first. Returns the number of rows inserted.
+    if not rows:
+        return 0
+
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(model).values(rows).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(model).values(rows).on_conflict_do_nothing()
+    else:
+        stmt = insert(model).prefix_with('IGNORE').values(rows)
+    return session.execute(stmt).rowcount
+
+
+def upsert_increment(session, model, keys, deltas):
+    # Adds `deltas` to the counter columns of the row identified by `keys`,
+    # creating it if needed, in one statement. Returns the new counter values.
+    dialect = session.get_bind().dialect.name
+    counters = [getattr(model, column) for column in deltas]
+
+    if dialect in ('postgresql', 'sqlite'):
+        insert_fn = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert_fn(model).values(**keys, **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: getattr(model, column) + delta for column, delta in deltas.items()}
+        ).returning(*counters)
+        return session.execute(stmt).one()
+
+    # Portable fallback: read-modify-write under a row lock
+    row = session.get(model, tuple(keys.values()), with_for_update=True)
+    if row is None:
+        row = model(**keys, **deltas)
+        session.add(row)
+    else:
+        for column, delta in deltas.items():
+            setattr(row, column, getattr(row, column) + delta)
+    session.flush()
+    return tuple(getattr(row, column) for column in deltas)
+
+
+def upsert_increment_many(session, model, keys, rows):
+    # upsert_increment for many rows in one statement: each row holds the
+    # `keys` columns plus the deltas to add. New values are not returned, so
+    # callers subtracting clean up rows left at zero themselves.
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    counters = [column for column in rows[0] if column not in keys]
+
+    if dialect in ('postgresql', 'sqlite'):
+        insert_fn = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert_fn(model).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: getattr(model, column) + getattr(stmt.excluded, column) for column in counters}
+        )
+        session.execute(stmt)
+        return
+
+    for row in rows:
+        upsert_increment(session, model, {key: row[key] for key in keys},
+                         {column: row[column] for column in counters})
@@ -0,0 +1,94 @@
+import os
+
+from flask import Response, current_app, request
+from werkzeug.wsgi import wrap_file
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class FileRange:
+    # A file limited to one byte range. Under gunicorn, wsgi.file_wrapper hands
+    # its fileno to os.sendfile, which starts at the current offset and sends
+    # Content-Length bytes, so the kernel copies straight from the page cache.
+    # Servers without sendfile iterate read(), which stops at the range end.
+    def __init__(self, path):
+        self._file = open(path, 'rb', buffering=0)
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.remaining = self.size
+
+    def select(self, start, length):
+        self._file.seek(start)
+        self.remaining = length
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+class StoredFileResponse(Response):
+    # Werkzeug's make_conditional does the Range/If-Range/304/416 work; only the
+    # final step, which would wrap the body in a slicing iterator, is replaced
+    # by seeking the FileRange, so ranged responses keep using sendfile
+    range_file = None
+
+    def _wrap_range_response(self, start, length):
+        if self.status_code == 206 and self.range_file is not None:
+            self.range_file.select(start, length)
+        else:
+            super()._wrap_range_response(start, length)
+
+
+def send_stored_file(storage, key, content_type, etag, last_modified=None, size=None,
+                     cache_control='private, max-age=31536000, immutable'):
+    # `etag` is used as a strong validator, so it must change whenever the bytes do
+    offload = current_app.config.get('PHOTO_OFFLOAD')
+    path = storage.path(key)
+
+    if offload == 'x-accel-redirect' or (offload == 'x-sendfile' and path is not None):
+        # The front-end server sends the file (and handles Range); Flask only
+        # answers conditional requests and sets the headers
+        response = StoredFileResponse(mimetype=content_type)
+        if offload == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = current_app.config['PHOTO_ACCEL_PREFIX'] + key
+        else:
+            response.headers['X-Sendfile'] = path
+        body, complete_length = None, None
+    elif path is not None:
+        if not os.path.isfile(path):
+            return None
+        body = FileRange(path)
+        response = StoredFileResponse(wrap_file(request.environ, body, STREAM_CHUNK_SIZE), mimetype=content_type,
+                                      direct_passthrough=True)
+        response.range_file = body
+        response.content_length = complete_length = body.size
+    else:
+        if not storage.exists(key):
+            return None
+        body = storage.open(key)
+        response = StoredFileResponse(iter(lambda: body.read(STREAM_CHUNK_SIZE), b''), mimetype=content_type,
+                                      direct_passthrough=True)
+        response.call_on_close(body.close)
+        complete_length = size
+        if size is not None:
+            response.content_length = size
+
+    if body is not None and complete_length is not None:
+        response.accept_ranges = 'bytes'
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    try:
+        return response.make_conditional(request, accept_ranges=body is not None, complete_length=complete_length)
+    except Exception:
+        response.close()
+        raise
@@ -0,0 +1,69 @@
+import csv
+import io
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import select
+from models import db, Entry, Photo, Tag, EntryTag
+from queries import ENTRY_COLUMNS
+from serializers import serialize_entry_row, serialize_photo_row
+
+EXPORT_CHUNK_SIZE = 1000
+CSV_FIELDS = ['id', 'location', 'latitude', 'longitude', 'date', 'description', 'user_id', 'photos', 'tags']
+
+
+def iter_entry_records(user_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # Streams entries through a server-side cursor, one chunk at a time.
+    # Photos and tags for each chunk are fetched with a single IN query apiece,
+    # so memory stays bounded by the chunk size rather than the table size.
+    stmt = select(*ENTRY_COLUMNS).order_by(Entry.id)
+    if user_id is not None:
+        stmt = stmt.where(Entry.user_id == user_id)
+
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    for rows in result.partitions():
+        entry_ids = [row.id for row in rows]
+
+        photos = defaultdict(list)
+        for photo in db.session.execute(
+            select(Photo.entry_id, Photo.id, Photo.url, Photo.thumbnail_url, Photo.preview_url)
+            .where(Photo.entry_id.in_(entry_ids)).order_by(Photo.entry_id, Photo.id)
+        ):
+            photos[photo.entry_id].append(serialize_photo_row(photo))
+
+        tags = defaultdict(list)
+        for tag in db.session.execute(
+            select(EntryTag.entry_id, Tag.name).join(Tag, Tag.id == EntryTag.tag_id)
+            .where(EntryTag.entry_id.in_(entry_ids)).order_by(Tag.name)
+        ):
+            tags[tag.entry_id].append(tag.name)
+
+        for row in rows:
+            record = serialize_entry_row(row)
+            record["photos"] = photos.get(row.id, [])
+            record["tags"] = tags.get(row.id, [])
+            yield record
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield current_app.json.dumps(record) + '\n'
+
+
+def csv_lines(records):
+    # Photos and tags are flattened into '|'-separated cells
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for record in records:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(dict(
+            record,
+            photos='|'.join(photo['url'] for photo in record['photos']),
+            tags='|'.join(record['tags']),
+        ))
+        yield buffer.getvalue()
@@ -0,0 +1,172 @@
+import os
+from pathlib import Path
+
+DOTENV_PATH = Path(__file__).resolve().parent.parent / '.env'
+
+# create_app builds a configured app; importing this module does nothing else.
+# Extensions, routes and commands are imported inside the function, and
+# nothing connects to the database until a request (or warmup.py) needs it.
+
+
+def create_app(config=None):
+    # Settings come from the environment (and the .env file); `config`
+    # overrides them before any extension reads its settings
+    from dotenv import load_dotenv
+    from flask import Flask
+
+    load_dotenv(DOTENV_PATH)
+
+    app = Flask(
+        __name__,
+        static_url_path='',
+        static_folder='../client/build',
+        template_folder='../client/build'
+    )
+    app.config.update(config_from_env())
+    app.config.update(config or {})
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        from database import engine_options_from_env
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env(app.config['SQLALCHEMY_DATABASE_URI'])
+    if 'SQLALCHEMY_BINDS' not in app.config:
+        from replicas import replica_binds
+        app.config['SQLALCHEMY_BINDS'] = replica_binds(app.config['REPLICA_DATABASE_URIS'])
+
+    init_extensions(app)
+    register_error_handlers(app)
+
+    # Behind a proxy (Render, nginx) every request comes from the proxy's
+    # address; trusting PROXY_FIX_X_FOR hops of X-Forwarded-For makes
+    # request.remote_addr the client, which rate limits and admission key on
+    if app.config['PROXY_FIX_X_FOR']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    from routes import register_blueprints
+    from cli import register_commands
+    register_blueprints(app)
+    register_commands(app)
+    return app
+
+
+def config_from_env():
+    from auth import auth_config_from_env
+    from cache import cache_config_from_env
+    from compression import compression_config_from_env
+    from geo import geo_config_from_env
+    from instrumentation import instrumentation_config_from_env
+    from jobs import job_config_from_env
+    from passwords import password_config_from_env
+    from photos import photo_config_from_env
+    from ratelimit import ratelimit_config_from_env
+    from replicas import replica_config_from_env
+    from stats import stats_config_from_env
+    from sync import sync_config_from_env
+    from tags import tag_config_from_env
+    from warmup import warmup_config_from_env
+
+    config = {
+        'SQLALCHEMY_DATABASE_URI': os.getenv('DATABASE_URI'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': os.getenv('SECRET_KEY'),
+        'JWT_SECRET_KEY': os.getenv('JWT_SECRET_KEY'),
+        # Proxies in front of the app whose X-Forwarded-For to trust; 0 (the
+        # default) trusts none, so the header can't be spoofed without a proxy
+        'PROXY_FIX_X_FOR': int(os.getenv('PROXY_FIX_X_FOR', 0)),
+    }
+    for section in (compression_config_from_env, instrumentation_config_from_env, auth_config_from_env,
+                    cache_config_from_env, password_config_from_env, geo_config_from_env, job_config_from_env,
+                    sync_config_from_env, tag_config_from_env, photo_config_from_env, ratelimit_config_from_env,
+                    replica_config_from_env, stats_config_from_env, warmup_config_from_env):
+        config.update(section())
+    return config
+
+
+def init_extensions(app):
+    from flask_cors import CORS
+    from flask_jwt_extended import JWTManager
+    from models import db
+    from auth import identity_cache, token_blocklist, init_jwt
+    from cache import response_cache
+    from compression import compression
+    from instrumentation import instrumentation
+    from json_provider import FastJSONProvider
+    from passwords import password_hasher, auth_limiter
+    from photos import photo_pipeline
+    from ratelimit import rate_limiter, admission
+    from replicas import replica_router, WRITE_HEADER
+    from tags import tag_index
+
+    # Enables CORS for all routes; browsers may read the read-your-writes token
+    CORS(app, expose_headers=[WRITE_HEADER])
+
+    app.json = FastJSONProvider(app)  # compact, orjson-encoded when available
+
+    # gzip/Brotli for API responses and streamed exports; precompressed .br/.gz
+    # siblings are preferred for client/build assets. Registered before
+    # instrumentation so its after_request hook runs last, on the final body.
+    compression.init_app(app)
+
+    # Per-request timings (Server-Timing), Prometheus /metrics and the opt-in slow-request profiler
+    instrumentation.init_app(app)
+
+    # Token expiry, the per-process identity cache and the revoked-token filter
+    # let @jwt_required() routes authenticate without touching the database
+    identity_cache.init_app(app)
+    token_blocklist.init_app(app)
+    init_jwt(JWTManager(app))
+
+    # Flask-Migrate is set up by `flask db` itself (see cli.py)
+    db.init_app(app)
+
+    # GET requests read from replicas when REPLICA_DATABASE_URIS is set; pool
+    # and replica metrics go to /metrics either way
+    replica_router.init_app(app)
+
+    # Response cache for the polled GET routes (CACHE_BACKEND=redis, or memory for one process)
+    response_cache.init_app(app)
+
+    # Password hashing runs in a process pool; PASSWORD_HASH_WORKERS=0 hashes inline
+    password_hasher.init_app(app)
+    auth_limiter.limit = app.config['AUTH_CONCURRENCY_LIMIT']
+
+    # Map queries use the geohash index unless GEO_POSTGIS=1 (needs the PostGIS
+    # extension); slow side effects (thumbnails, file cleanup) run on `flask jobs
+    # worker` unless JOBS_EAGER=1; GET /api/sync pages and tombstones are SYNC_*.
+    # Those modules read app.config when called.
+
+    # In-memory tag autocomplete, kept current from the change log (TAG_SUGGEST_*)
+    tag_index.init_app(app)
+
+    # Photo uploads go to content-addressed storage (PHOTO_STORAGE=filesystem|s3)
+    photo_pipeline.init_app(app)
+
+    # Per-route/user/IP request rates (RATELIMIT_*) and a cap on concurrent
+    # requests per process that sheds the excess (ADMISSION_*)
+    rate_limiter.init_app(app)
+    admission.init_app(app)
+
+
+def register_error_handlers(app):
+    from flask import jsonify, render_template
+    from passwords import TooManyAttempts, HashingBusy
+    from ratelimit import RateLimited, Overloaded
+
+    @app.errorhandler(404)
+    def not_found(e):
+        return render_template("index.html")
+
+    @app.errorhandler(RateLimited)
+    def rate_limited(e):
+        return jsonify({"error": "Too many requests"}), 429, {"Retry-After": str(e.retry_after)}
+
+    @app.errorhandler(Overloaded)
+    def overloaded(e):
+        return jsonify({"error": "Server busy, try again shortly"}), 503, {"Retry-After": "1"}
+
+    @app.errorhandler(TooManyAttempts)
+    def too_many_attempts(e):
+        return jsonify({"error": "Too many concurrent attempts"}), 429, {"Retry-After": "1"}
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(e):
+        return jsonify({"error": "Server busy, try again shortly"}), 503, {"Retry-After": "1"}
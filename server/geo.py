@@ -0,0 +1,303 @@
+import csv
+import math
+import os
+import unicodedata
+from functools import lru_cache
+
+from sqlalchemy import and_, func, or_, select, update
+from models import db, Entry
+from queries import ENTRY_COLUMNS
+import sync
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Stored precision: 9 characters is a cell of roughly 5 x 5 m
+GEOHASH_PRECISION = 9
+# A viewport is covered by at most this many geohash cells, each one index range
+MAX_COVER_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.csv')
+
+DEFAULT_BBOX_LIMIT = 500
+MAX_BBOX_LIMIT = 2000
+DEFAULT_NEARBY_LIMIT = 50
+MAX_NEARBY_LIMIT = 500
+MAX_RADIUS_KM = 200
+# Nearby searches widen through this many rings, each reading at most
+# NEARBY_CANDIDATES rows
+NEARBY_RINGS = 6
+NEARBY_CANDIDATES = 2000
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def _cell_size(precision):
+    # (height, width) in degrees of a geohash cell
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_ranges(min_lat, min_lng, max_lat, max_lng):
+    # Covers the box with the finest cells that keep the count under
+    # MAX_COVER_CELLS and returns them as (low, high) bounds on the stored
+    # geohash, merging cells that are adjacent in geohash order
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _cell_size(precision)
+        rows = range(math.floor((min_lat + 90) / height), math.floor((max_lat + 90) / height) + 1)
+        cols = range(math.floor((min_lng + 180) / width), math.floor((max_lng + 180) / width) + 1)
+        if len(rows) * len(cols) <= MAX_COVER_CELLS:
+            break
+
+    cells = sorted({
+        encode_geohash(min((row + 0.5) * height - 90, 90.0), min((col + 0.5) * width - 180, 180.0), precision)
+        for row in rows for col in cols
+    })
+    padding = GEOHASH_PRECISION - precision
+    ranges = []
+    for cell in cells:
+        low, high = cell + '0' * padding, cell + 'z' * padding
+        if ranges and _successor(ranges[-1][1]) == low:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((low, high))
+    return ranges
+
+
+def _successor(geohash):
+    # Next geohash of the same length in sort order, or None after 'zzz...'
+    chars = list(geohash)
+    for i in range(len(chars) - 1, -1, -1):
+        index = BASE32.index(chars[i])
+        if index < len(BASE32) - 1:
+            chars[i] = BASE32[index + 1]
+            return ''.join(chars)
+        chars[i] = BASE32[0]
+    return None
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _normalize(name):
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return ' '.join(name.lower().replace('.', '').split())
+
+
+@lru_cache(maxsize=1)
+def _gazetteer():
+    places = {}
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            point = (float(row['latitude']), float(row['longitude']))
+            # First listed wins for ambiguous names; the file is roughly by size
+            places.setdefault(_normalize(f"{row['name']}, {row['country']}"), point)
+            places.setdefault(_normalize(row['name']), point)
+    return places
+
+
+def warm():
+    # Reads the gazetteer now rather than on the first geocode
+    _gazetteer()
+
+
+@lru_cache(maxsize=50000)
+def geocode(location):
+    # Offline: resolves 'Paris', 'Paris, France' or 'Louvre, Paris' against the
+    # bundled gazetteer. Returns (latitude, longitude) or None.
+    if not location:
+        return None
+    places = _gazetteer()
+    normalized = _normalize(location)
+    if normalized in places:
+        return places[normalized]
+    for part in normalized.split(','):
+        point = places.get(part.strip())
+        if point is not None:
+            return point
+    return None
+
+
+def coordinate_columns(data, location):
+    # Latitude/longitude/geohash for an entry: explicit coordinates in the
+    # payload win, otherwise the location is geocoded. Raises ValueError.
+    latitude, longitude = data.get('latitude'), data.get('longitude')
+    if latitude is None and longitude is None:
+        point = geocode(location)
+        if point is None:
+            return {"latitude": None, "longitude": None, "geohash": None}
+        latitude, longitude = point
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must both be numbers.")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("Coordinates are out of range.")
+    return {"latitude": latitude, "longitude": longitude, "geohash": encode_geohash(latitude, longitude)}
+
+
+def _float_arg(args, name, low, high):
+    value = args.get(name, type=float)
+    if value is None or not low <= value <= high:
+        raise ValueError(f"'{name}' must be a number between {low} and {high}.")
+    return value
+
+
+def _limit_arg(args, default, maximum):
+    limit = args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+
+def _box_condition(min_lat, min_lng, max_lat, max_lng, use_postgis=False):
+    if use_postgis:
+        # Matches the GiST expression index created by the geo migration
+        point = func.ST_SetSRID(func.ST_MakePoint(Entry.longitude, Entry.latitude), 4326)
+        return point.op('&&')(func.ST_MakeEnvelope(min_lng, min_lat, max_lng, max_lat, 4326))
+    ranges = geohash_ranges(min_lat, min_lng, max_lat, max_lng)
+    return and_(
+        or_(*(Entry.geohash.between(low, high) for low, high in ranges)),
+        Entry.latitude.between(min_lat, max_lat),
+        Entry.longitude.between(min_lng, max_lng),
+    )
+
+
+def _boxes(min_lat, min_lng, max_lat, max_lng):
+    # A viewport crossing the antimeridian arrives with min_lng > max_lng
+    if min_lng <= max_lng:
+        return [(min_lat, min_lng, max_lat, max_lng)]
+    return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+
+
+def _spatial_statement(boxes, user_id, use_postgis):
+    stmt = select(*ENTRY_COLUMNS).where(or_(*(_box_condition(*box, use_postgis) for box in boxes)))
+    if user_id is not None:
+        stmt = stmt.where(Entry.user_id == user_id)
+    return stmt
+
+
+def bbox_statement(args, use_postgis=False):
+    # Entries inside a map viewport, at most limit + 1 rows. Returns
+    # (stmt, limit); raises ValueError with a client-facing message.
+    min_lat = _float_arg(args, 'min_lat', -90, 90)
+    max_lat = _float_arg(args, 'max_lat', -90, 90)
+    min_lng = _float_arg(args, 'min_lng', -180, 180)
+    max_lng = _float_arg(args, 'max_lng', -180, 180)
+    if min_lat > max_lat:
+        raise ValueError("'min_lat' must not exceed 'max_lat'.")
+    limit = _limit_arg(args, DEFAULT_BBOX_LIMIT, MAX_BBOX_LIMIT)
+    stmt = _spatial_statement(_boxes(min_lat, min_lng, max_lat, max_lng), args.get('user_id', type=int), use_postgis)
+    # No ORDER BY: SQLite otherwise gives up the per-range index searches and
+    # walks the whole geohash index; callers sort the (bounded) result
+    return stmt.limit(limit + 1), limit
+
+
+def nearby_args(args):
+    # Parses lat, lng, radius_km, limit and user_id. Returns
+    # (point, radius_km, limit, user_id); raises ValueError.
+    latitude = _float_arg(args, 'lat', -90, 90)
+    longitude = _float_arg(args, 'lng', -180, 180)
+    radius_km = args.get('radius_km', 10.0, type=float)
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise ValueError(f"'radius_km' must be between 0 and {MAX_RADIUS_KM}.")
+    limit = _limit_arg(args, DEFAULT_NEARBY_LIMIT, MAX_NEARBY_LIMIT)
+    return (latitude, longitude), radius_km, limit, args.get('user_id', type=int)
+
+
+def nearby_statement(point, radius_km, user_id=None, use_postgis=False):
+    # At most NEARBY_CANDIDATES + 1 candidates from the bounding box of the
+    # circle; on PostGIS the nearest ones (KNN on the GiST index) come first
+    latitude, longitude = point
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    edge = max(abs(min_lat), abs(max_lat))
+    lng_delta = 180.0 if edge >= 89.9 else lat_delta / math.cos(math.radians(edge))
+    if lng_delta >= 180:
+        # Wider than the globe near a pole; wrapping would keep only a sliver
+        min_lng, max_lng = -180.0, 180.0
+    else:
+        min_lng = (longitude - lng_delta + 180) % 360 - 180
+        max_lng = (longitude + lng_delta + 180) % 360 - 180
+    stmt = _spatial_statement(_boxes(min_lat, min_lng, max_lat, max_lng), user_id, use_postgis)
+    if use_postgis:
+        stmt = stmt.order_by(func.ST_SetSRID(func.ST_MakePoint(Entry.longitude, Entry.latitude), 4326)
+                             .op('<->')(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)))
+    return stmt.limit(NEARBY_CANDIDATES + 1)
+
+
+def rank_nearby(rows, point, radius_km, limit):
+    # Exact great-circle filter and ordering over the bounding-box candidates;
+    # returns [(row, distance_km)]
+    ranked = []
+    for row in rows:
+        distance = haversine_km(point[0], point[1], row.latitude, row.longitude)
+        if distance <= radius_km:
+            ranked.append((row, distance))
+    ranked.sort(key=lambda pair: (pair[1], pair[0].id))
+    return ranked[:limit]
+
+
+def find_nearby(point, radius_km, limit, user_id=None, use_postgis=False):
+    # Expanding-ring search: rings of radius_km / 2**(NEARBY_RINGS - 1) up to
+    # radius_km, stopping at the first that holds `limit` entries (nothing
+    # outside it can be nearer). Each ring reads at most NEARBY_CANDIDATES
+    # rows; a denser ring stops the search with truncated=True, and the
+    # result is then ranked from those candidates only.
+    # Returns ([(row, distance_km)], truncated).
+    for ring in range(NEARBY_RINGS - 1, -1, -1):
+        ring_km = radius_km / 2 ** ring
+        rows = db.session.execute(nearby_statement(point, ring_km, user_id, use_postgis)).all()
+        truncated = len(rows) > NEARBY_CANDIDATES
+        ranked = rank_nearby(rows[:NEARBY_CANDIDATES], point, ring_km, limit)
+        if truncated or len(ranked) == limit:
+            break
+    return ranked, truncated
+
+
+def backfill_coordinates(batch_size=500):
+    # Geocodes entries without coordinates, one UPDATE per distinct location
+    # (served by the location index). Returns the number of entries updated.
+    updated = 0
+    locations = db.session.scalars(
+        select(Entry.location).where(Entry.latitude.is_(None)).distinct().order_by(Entry.location)
+    ).all()
+    for start in range(0, len(locations), batch_size):
+        for location in locations[start:start + batch_size]:
+            point = geocode(location)
+            if point is None:
+                continue
+            rows = db.session.execute(
+                update(Entry).where(Entry.location == location, Entry.latitude.is_(None))
+                .values(latitude=point[0], longitude=point[1], geohash=encode_geohash(*point))
+                .returning(Entry.id, Entry.user_id)
+            ).all()
+            for entry_id, user_id in rows:
+                sync.entries_saved([entry_id], user_id)
+            updated += len(rows)
+        db.session.commit()
+    return updated
+
+
+def geo_config_from_env():
+    return {
+        'GEO_POSTGIS': os.getenv('GEO_POSTGIS', '').lower() in ('1', 'true', 'yes', 'on'),
+    }
@@ -0,0 +1,29 @@
+# Read by gunicorn from the working directory: cd server && gunicorn app:app
+# Command-line flags (-w, -b, -k, ...) override anything set here.
+#
+# GUNICORN_PRELOAD=1 builds the app once in the master and forks workers from
+# it, which saves the import time per worker (and memory through copy-on-write);
+# create_app opens no connections and starts no threads, so nothing is shared
+# across the fork.
+
+import os
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '0').lower() in ('1', 'true', 'yes', 'on')
+
+
+def on_starting(server):
+    # Per-worker metric snapshots from the previous run (see instrumentation.py)
+    if os.getenv('METRICS_DIR'):
+        from instrumentation import clear_metrics_dir
+
+        clear_metrics_dir(os.getenv('METRICS_DIR'))
+
+
+def post_worker_init(worker):
+    # The worker has loaded the app but accepts no connections until this returns
+    from warmup import warm_worker
+
+    timings = warm_worker(worker.wsgi)
+    if timings:
+        worker.log.info('Warmed up in %.0f ms (%s)', sum(timings.values()) * 1000,
+                        ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, seconds in timings.items()))
@@ -0,0 +1,341 @@
+import glob
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from json_provider import FastJSONProvider
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# SQL query count and time per request, from the engine's cursor events
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_started' in g:
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + time.perf_counter() - g.pop('sql_started')
+
+
+class TimedJSONProvider(FastJSONProvider):
+    # Accumulates time spent encoding JSON into the current request's timings
+    def dump_bytes(self, obj):
+        started = time.perf_counter()
+        try:
+            return super().dump_bytes(obj)
+        finally:
+            if has_request_context():
+                g.serialize_time = g.get('serialize_time', 0.0) + time.perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series = defaultdict(lambda: [[0] * (len(buckets) + 1), 0.0, 0])
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            counts, _, _ = series = self.series[labels]
+            counts[bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        # [[labels, bucket counts, sum, count]], JSON-friendly
+        with self.lock:
+            return [[list(labels), list(counts), total, count] for labels, (counts, total, count) in self.series.items()]
+
+    def merge(self, snapshot):
+        with self.lock:
+            for labels, counts, total, count in snapshot:
+                series = self.series[tuple(labels)]
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+                series[2] += count
+
+    def expose(self, name, help_text, label_names):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.series.items()):
+                label_str = ','.join(f'{k}="{v}"' for k, v in zip(label_names, labels))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{{label_str},le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_str}}} {total}')
+                lines.append(f'{name}_count{{{label_str}}} {count}')
+        return lines
+
+
+class StackSampler:
+    # Opt-in sampling profiler. A single daemon thread snapshots the stacks of
+    # in-flight request threads every `interval` seconds; requests slower than
+    # `threshold` get their folded stacks (flamegraph.pl / speedscope format)
+    # written to `output_dir`.
+
+    def __init__(self, output_dir, interval=0.005, threshold=0.5):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.threshold = threshold
+        self.active = {}
+        self.lock = threading.Lock()
+        self._thread_pid = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _ensure_thread(self):
+        # One sampling thread per process, started by its first request: a
+        # thread started in a preloading gunicorn master would not survive the fork
+        if self._thread_pid == os.getpid():
+            return
+        with self.lock:
+            if self._thread_pid != os.getpid():
+                self._thread_pid = os.getpid()
+                threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, stacks in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._fold(frame)] += 1
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def start(self):
+        self._ensure_thread()
+        with self.lock:
+            self.active[threading.get_ident()] = Counter()
+
+    def discard(self):
+        with self.lock:
+            self.active.pop(threading.get_ident(), None)
+
+    def stop(self, route, duration):
+        with self.lock:
+            stacks = self.active.pop(threading.get_ident(), None)
+        if not stacks or duration < self.threshold:
+            return
+        name = f"{int(time.time() * 1000)}-{int(duration * 1000)}ms-{route.strip('/').replace('/', '_') or 'root'}.folded"
+        with open(os.path.join(self.output_dir, name), 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _with_label(line, name, value):
+    # Adds name="value" to a Prometheus sample line
+    metric, labels, rest = re.match(r'([^{\s]+)(?:\{(.*)\})?(\s.*)', line).groups()
+    labels = f'{name}="{value}",{labels}' if labels else f'{name}="{value}"'
+    return f'{metric}{{{labels}}}{rest}'
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_metrics_dir(path):
+    # gunicorn's on_starting hook: a new server starts its counters from zero
+    for name in glob.glob(os.path.join(path, '*.json')):
+        os.remove(name)
+
+
+class Instrumentation:
+    # Histograms live in each worker process. With METRICS_DIR set, every
+    # worker writes a snapshot there at most every METRICS_FLUSH_SECONDS and
+    # /metrics sums them, so a scrape covers all workers whichever one
+    # answers it; collector gauges (pools, replicas) get a pid label instead.
+
+    HISTOGRAMS = (
+        ('latency', 'http_request_duration_seconds', 'Request latency by route.'),
+        ('sql_queries', 'http_request_sql_queries', 'SQL queries issued per request.'),
+        ('response_bytes', 'http_response_size_bytes', 'Response body size.'),
+    )
+
+    def __init__(self):
+        self._reset()
+        self.sampler = None
+        self.collectors = {}
+        self.token = None
+        self.metrics_dir = None
+        self.flush_seconds = 1.0
+        self._flushed_at = 0.0
+
+    def _reset(self):
+        self.latency = Histogram()
+        self.sql_queries = Histogram(buckets=(1, 2, 5, 10, 20, 50, 100))
+        self.response_bytes = Histogram(buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576))
+
+    def init_app(self, app):
+        self._reset()
+        provider = TimedJSONProvider(app)
+        provider.compact = app.json.compact
+        app.json = provider
+        if app.config.get('PROFILE_SLOW_REQUESTS'):
+            self.sampler = StackSampler(
+                app.config.get('PROFILE_DIR', 'profiles'),
+                threshold=app.config.get('PROFILE_THRESHOLD_MS', 500) / 1000,
+            )
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        # /metrics is off unless METRICS_TOKEN is set; scrapers send it as a bearer token
+        self.token = app.config.get('METRICS_TOKEN') or None
+        self.metrics_dir = app.config.get('METRICS_DIR') or None
+        self.flush_seconds = app.config.get('METRICS_FLUSH_SECONDS', 1.0)
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        app.extensions['instrumentation'] = self
+
+    def add_collector(self, name, collect):
+        # `collect()` returns more /metrics lines; one collector per name
+        self.collectors[name] = collect
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+        if self.sampler:
+            self.sampler.start()
+
+    def _after_request(self, response):
+        if 'request_started' not in g:
+            return response
+
+        duration = time.perf_counter() - g.request_started
+        sql_count, sql_time = g.get('sql_count', 0), g.get('sql_time', 0.0)
+        # Bounded label set: the matched rule, never the raw path
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+        labels = (route, request.method)
+        self.latency.observe(labels, duration)
+        self.sql_queries.observe(labels, sql_count)
+        if not response.is_streamed:
+            self.response_bytes.observe(labels, response.calculate_content_length() or 0)
+
+        timing = [
+            f'app;dur={duration * 1000:.2f}',
+            f'db;dur={sql_time * 1000:.2f};desc="{sql_count} queries"',
+            f'serialize;dur={g.get("serialize_time", 0.0) * 1000:.2f}',
+        ]
+        if not response.is_streamed:
+            timing.append(f'size;desc="{response.calculate_content_length() or 0} bytes"')
+        response.headers['Server-Timing'] = ', '.join(timing)
+
+        if self.sampler:
+            self.sampler.stop(route, duration)
+        if self.metrics_dir and time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush()
+        return response
+
+    def _teardown_request(self, exc):
+        # Requests that raised never reach after_request
+        if self.sampler:
+            self.sampler.discard()
+
+    def _collect(self):
+        lines = []
+        for collect in self.collectors.values():
+            lines += collect()
+        return lines
+
+    def flush(self):
+        # Writes this process' snapshot to METRICS_DIR, atomically
+        self._flushed_at = time.monotonic()
+        snapshot = {attr: getattr(self, attr).snapshot() for attr, _, _ in self.HISTOGRAMS}
+        snapshot['collected'] = self._collect()
+        path = os.path.join(self.metrics_dir, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def _aggregate(self):
+        # Histograms summed over every process that has written a snapshot
+        # (exited workers included, so totals never go backwards); collector
+        # lines from live processes only, labelled with their pid
+        self.flush()
+        totals = {attr: Histogram(getattr(self, attr).buckets) for attr, _, _ in self.HISTOGRAMS}
+        collected, seen = [], set()
+        for path in sorted(glob.glob(os.path.join(self.metrics_dir, '*.json'))):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for attr, histogram in totals.items():
+                histogram.merge(snapshot.get(attr, []))
+            pid = int(os.path.basename(path)[:-len('.json')])
+            if not _process_alive(pid):
+                continue
+            for line in snapshot.get('collected', []):
+                if not line.startswith('#'):
+                    collected.append(_with_label(line, 'pid', pid))
+                elif line not in seen:
+                    seen.add(line)
+                    collected.append(line)
+        return totals, collected
+
+    def metrics_view(self):
+        # Prometheus text exposition: this process' counters, or every
+        # worker's with METRICS_DIR
+        if self.token is None:
+            return Response('Not Found\n', status=404, mimetype='text/plain')
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {self.token}'.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain',
+                            headers={'WWW-Authenticate': 'Bearer'})
+
+        if self.metrics_dir:
+            histograms, collected = self._aggregate()
+        else:
+            histograms = {attr: getattr(self, attr) for attr, _, _ in self.HISTOGRAMS}
+            collected = self._collect()
+        lines = []
+        for attr, name, help_text in self.HISTOGRAMS:
+            lines += histograms[attr].expose(name, help_text, ('route', 'method'))
+        lines += collected
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def instrumentation_config_from_env():
+    return {
+        'PROFILE_SLOW_REQUESTS': os.getenv('PROFILE_SLOW_REQUESTS', '').lower() in ('1', 'true', 'yes', 'on'),
+        'PROFILE_DIR': os.getenv('PROFILE_DIR', 'profiles'),
+        'PROFILE_THRESHOLD_MS': int(os.getenv('PROFILE_THRESHOLD_MS', 500)),
+        'METRICS_TOKEN': os.getenv('METRICS_TOKEN', ''),
+        'METRICS_DIR': os.getenv('METRICS_DIR', ''),
+        'METRICS_FLUSH_SECONDS': float(os.getenv('METRICS_FLUSH_SECONDS', 1)),
+    }
+
+
+instrumentation = Instrumentation()
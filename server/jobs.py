@@ -0,0 +1,210 @@
+import multiprocessing
+import os
+import random
+import signal
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app, g
+from sqlalchemy import and_, delete, or_, select, update
+from models import db, Job
+from db_utils import insert_ignore
+
+# Durable background jobs on the application database. enqueue() adds a row in
+# the caller's transaction, so a job exists exactly when the write that caused
+# it commits. `flask jobs worker` claims due rows, runs the registered handler
+# and commits its work together with the job's status. Delivery is
+# at-least-once: handlers must be safe to run again, and must not commit.
+
+HANDLERS = {}
+
+
+def job(name, max_attempts=5):
+    # Registers a handler: @job('photos.release') def release(content_hash, key): ...
+    def register(fn):
+        HANDLERS[name] = (fn, max_attempts)
+        return fn
+    return register
+
+
+def after_commit(fn):
+    # Defers `fn` (e.g. a cache invalidation) until the running job's work has
+    # committed; called straight away outside a job
+    callbacks = g.get('job_after_commit')
+    if callbacks is None:
+        fn()
+    else:
+        callbacks.append(fn)
+
+
+def enqueue(name, payload=None, idempotency_key=None, delay=0):
+    # Returns False when a job with this idempotency key already exists. With
+    # JOBS_EAGER (tests, scripts) the handler runs inline, inside the caller's
+    # transaction, and its errors propagate.
+    if name not in HANDLERS:
+        raise ValueError(f"Unknown job '{name}'")
+    handler, max_attempts = HANDLERS[name]
+    payload = payload or {}
+    now = datetime.utcnow()
+    eager = current_app.config.get('JOBS_EAGER')
+
+    row = {
+        "name": name, "payload": payload, "idempotency_key": idempotency_key,
+        "status": 'done' if eager else 'queued', "attempts": 1 if eager else 0,
+        "max_attempts": max_attempts, "run_at": now + timedelta(seconds=delay), "created_at": now,
+        "finished_at": now if eager else None,
+    }
+    if not insert_ignore(db.session, Job, [row]):
+        return False
+    if eager:
+        handler(**payload)
+    return True
+
+
+def _due(now, lease_seconds):
+    # Queued jobs whose time has come, plus running jobs whose worker died
+    return or_(
+        and_(Job.status == 'queued', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=lease_seconds)),
+    )
+
+
+def claim(lease_seconds):
+    # Atomically marks the oldest due job running and returns it. FOR UPDATE
+    # SKIP LOCKED lets PostgreSQL workers claim in parallel without blocking
+    # each other; SQLite serializes writers, which makes the UPDATE atomic.
+    now = datetime.utcnow()
+    candidate = (select(Job.id).where(_due(now, lease_seconds)).order_by(Job.run_at, Job.id).limit(1)
+                 .with_for_update(skip_locked=True).scalar_subquery())
+    claimed = db.session.execute(
+        update(Job).where(Job.id == candidate)
+        .values(status='running', locked_at=now, attempts=Job.attempts + 1)
+        .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts)
+    ).first()
+    db.session.commit()
+    return claimed
+
+
+def retry_delay(attempts, base_seconds):
+    # Exponential backoff with jitter, capped at an hour
+    delay = min(base_seconds * 2 ** (attempts - 1), 3600)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_next(lease_seconds=300, retry_base_seconds=5):
+    # Claims and runs one job; returns False when nothing is due
+    claimed = claim(lease_seconds)
+    if claimed is None:
+        return False
+
+    g.job_after_commit = callbacks = []
+    try:
+        handler, _ = HANDLERS[claimed.name]
+        handler(**claimed.payload)
+        db.session.execute(update(Job).where(Job.id == claimed.id)
+                           .values(status='done', finished_at=datetime.utcnow(), last_error=None))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        current_app.logger.exception('Job %s (%s) failed, attempt %s of %s',
+                                     claimed.id, claimed.name, claimed.attempts, claimed.max_attempts)
+        if claimed.attempts >= claimed.max_attempts:
+            values = {"status": 'failed', "finished_at": datetime.utcnow()}
+        else:
+            run_at = datetime.utcnow() + timedelta(seconds=retry_delay(claimed.attempts, retry_base_seconds))
+            values = {"status": 'queued', "run_at": run_at}
+        db.session.execute(update(Job).where(Job.id == claimed.id).values(last_error=error[-4000:], **values))
+        db.session.commit()
+        return True
+    finally:
+        g.pop('job_after_commit', None)
+
+    for callback in callbacks:
+        callback()
+    return True
+
+
+def drain(lease_seconds=300, retry_base_seconds=5):
+    # Runs due jobs until none are left; returns how many ran
+    count = 0
+    while run_next(lease_seconds, retry_base_seconds):
+        count += 1
+    return count
+
+
+def purge(older_than_days):
+    # Deletes finished jobs, which also frees their idempotency keys
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    result = db.session.execute(delete(Job).where(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff))
+    db.session.commit()
+    return result.rowcount
+
+
+def _work(app, stop, poll_interval):
+    with app.app_context():
+        lease = app.config.get('JOBS_LEASE_SECONDS', 300)
+        retry_base = app.config.get('JOBS_RETRY_BASE_SECONDS', 5)
+        while not stop.is_set():
+            try:
+                ran = run_next(lease, retry_base)
+            except Exception:
+                # Lost the database for a moment; back off instead of spinning
+                app.logger.exception('Job worker could not claim a job')
+                db.session.rollback()
+                ran = False
+            if not ran:
+                stop.wait(poll_interval)
+
+
+def _child(app, poll_interval):
+    # Fork start method: drop connections inherited from the parent, ignore
+    # the terminal's Ctrl-C and stop after the current job on SIGTERM
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    with app.app_context():
+        db.engine.dispose(close=False)
+    _work(app, stop, poll_interval)
+
+
+def run_workers(app, processes=1, poll_interval=1.0):
+    # Runs `processes` worker processes until SIGINT/SIGTERM, restarting any
+    # that die. processes=1 works in this process.
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    if processes <= 1:
+        _work(app, stop, poll_interval)
+        return
+
+    context = multiprocessing.get_context('fork')
+
+    def spawn():
+        process = context.Process(target=_child, args=(app, poll_interval), daemon=True)
+        process.start()
+        return process
+
+    children = [spawn() for _ in range(processes)]
+    while not stop.wait(1.0):
+        for index, process in enumerate(children):
+            if not process.is_alive():
+                app.logger.warning('Job worker %s exited with %s; restarting', process.pid, process.exitcode)
+                children[index] = spawn()
+    for process in children:
+        os.kill(process.pid, signal.SIGTERM)
+    deadline = time.monotonic() + app.config.get('JOBS_SHUTDOWN_SECONDS', 30)
+    for process in children:
+        process.join(max(deadline - time.monotonic(), 0))
+        if process.is_alive():
+            process.terminate()
+
+
+def job_config_from_env():
+    return {
+        'JOBS_EAGER': os.getenv('JOBS_EAGER', '').lower() in ('1', 'true', 'yes', 'on'),
+        'JOBS_LEASE_SECONDS': int(os.getenv('JOBS_LEASE_SECONDS', 300)),
+        'JOBS_RETRY_BASE_SECONDS': float(os.getenv('JOBS_RETRY_BASE_SECONDS', 5)),
+    }
@@ -0,0 +1,39 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Compact JSON encoded with orjson when it is installed. Keys stay sorted so
+    # bodies (and the response cache's ETags) are byte-for-byte stable.
+    compact = True
+
+    def dump_bytes(self, obj):
+        if orjson is not None:
+            option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if self.compact is False:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self.default, option=option)
+
+        indent, separators = (2, None) if self.compact is False else (None, (',', ':'))
+        return json.dumps(obj, default=self.default, sort_keys=True, ensure_ascii=False,
+                          indent=indent, separators=separators).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dump_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dump_bytes(obj) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,37 @@
+"""Added entry listing indexes
+
+Revision ID: 4b7d2e91c3a8
+Revises: 15d53b59b6ff
+Create Date: 2026-10-18 09:12:41.503218
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7d2e91c3a8'
+down_revision = '15d53b59b6ff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.create_index('ix_entries_date_id', ['date', 'id'], unique=False)
+        batch_op.create_index('ix_entries_user_id_date_id', ['user_id', 'date', 'id'], unique=False)
+        # varchar_pattern_ops lets PostgreSQL serve LIKE 'prefix%' from the index
+        batch_op.create_index('ix_entries_location_date_id', ['location', 'date', 'id'], unique=False,
+                              postgresql_ops={'location': 'varchar_pattern_ops'})
+
+    with op.batch_alter_table('entry_tags', schema=None) as batch_op:
+        batch_op.create_index('ix_entry_tags_tag_id_entry_id', ['tag_id', 'entry_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('entry_tags', schema=None) as batch_op:
+        batch_op.drop_index('ix_entry_tags_tag_id_entry_id')
+
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_entries_location_date_id')
+        batch_op.drop_index('ix_entries_user_id_date_id')
+        batch_op.drop_index('ix_entries_date_id')
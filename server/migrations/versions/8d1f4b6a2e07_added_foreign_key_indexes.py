@@ -0,0 +1,41 @@
+"""Added foreign key indexes
+
+Revision ID: 8d1f4b6a2e07
+Revises: 7c4e2a9d5f18
+Create Date: 2026-10-18 21:04:52.118903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1f4b6a2e07'
+down_revision = '7c4e2a9d5f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        # An entry's photos in upload order (GET /api/entries/<id>/photos, embeds, export)
+        batch_op.create_index('ix_photos_entry_id_id', ['entry_id', 'id'], unique=False)
+        # Only uploads carry a hash; a partial index keeps URL photos out of it
+        batch_op.drop_index('ix_photos_content_hash')
+        batch_op.create_index('ix_photos_content_hash', ['content_hash'], unique=False,
+                              sqlite_where=sa.text('content_hash IS NOT NULL'),
+                              postgresql_where=sa.text('content_hash IS NOT NULL'))
+
+    with op.batch_alter_table('user_tag_stats', schema=None) as batch_op:
+        # Deleting a tag clears its stats rows for every user
+        batch_op.create_index('ix_user_tag_stats_tag_id', ['tag_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_tag_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_tag_stats_tag_id')
+
+    with op.batch_alter_table('photos', schema=None) as batch_op:
+        batch_op.drop_index('ix_photos_content_hash')
+        batch_op.create_index('ix_photos_content_hash', ['content_hash'], unique=False)
+        batch_op.drop_index('ix_photos_entry_id_id')
@@ -0,0 +1,72 @@
+"""Added entry full-text search
+
+Revision ID: 9c1f5a7e2d64
+Revises: 4b7d2e91c3a8
+Create Date: 2026-10-18 11:40:03.218774
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1f5a7e2d64'
+down_revision = '4b7d2e91c3a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        # Generated column is computed for existing rows as part of the ALTER
+        op.execute("""
+            ALTER TABLE entries ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(location, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(description, '')), 'B')
+            ) STORED
+        """)
+        op.execute("CREATE INDEX IF NOT EXISTS ix_entries_search_vector ON entries USING GIN (search_vector)")
+
+    elif dialect == 'sqlite':
+        op.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts
+            USING fts5(location, description, content='entries', content_rowid='id')
+        """)
+        op.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_fts_ai AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts(rowid, location, description)
+                VALUES (new.id, new.location, new.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_fts_ad AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, location, description)
+                VALUES ('delete', old.id, old.location, old.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_fts_au AFTER UPDATE ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, location, description)
+                VALUES ('delete', old.id, old.location, old.description);
+                INSERT INTO entries_fts(rowid, location, description)
+                VALUES (new.id, new.location, new.description);
+            END
+        """)
+        # Backfill the index from the rows already in entries
+        op.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_entries_search_vector")
+        op.execute("ALTER TABLE entries DROP COLUMN IF EXISTS search_vector")
+
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS entries_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS entries_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS entries_fts_ai")
+        op.execute("DROP TABLE IF EXISTS entries_fts")
@@ -0,0 +1,43 @@
+"""Limit the entries_fts update trigger to the indexed columns
+
+Revision ID: a1d7c3e9f520
+Revises: f3c6a9d2e417
+Create Date: 2026-10-19 14:05:52.603118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1d7c3e9f520'
+down_revision = 'f3c6a9d2e417'
+branch_labels = None
+depends_on = None
+
+
+def _create_update_trigger(columns):
+    op.execute(f"""
+        CREATE TRIGGER entries_fts_au AFTER UPDATE{columns} ON entries BEGIN
+            INSERT INTO entries_fts(entries_fts, rowid, location, description)
+            VALUES ('delete', old.id, old.location, old.description);
+            INSERT INTO entries_fts(rowid, location, description)
+            VALUES (new.id, new.location, new.description);
+        END
+    """)
+
+
+def upgrade():
+    # SQLite only: coordinate, stats and other column updates no longer
+    # rewrite the entry's FTS5 row. PostgreSQL's generated column already
+    # depends on location and description alone.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS entries_fts_au")
+    _create_update_trigger(' OF location, description')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS entries_fts_au")
+    _create_update_trigger('')
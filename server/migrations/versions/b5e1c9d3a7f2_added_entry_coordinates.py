@@ -0,0 +1,309 @@
+"""Added entry coordinates
+
+Revision ID: b5e1c9d3a7f2
+Revises: 6e3b8f0a5c21
+Create Date: 2026-10-18 17:48:09.274561
+
+"""
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e1c9d3a7f2'
+down_revision = '6e3b8f0a5c21'
+branch_labels = None
+depends_on = None
+
+# Frozen copies of geo.encode_geohash and the gazetteer as of this revision, so
+# the backfill gives the same result whatever geo.py and data/ later become
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+
+PLACES = (
+    ('Tokyo', 'Japan', 35.6762, 139.6503),
+    ('Delhi', 'India', 28.7041, 77.1025),
+    ('Shanghai', 'China', 31.2304, 121.4737),
+    ('Sao Paulo', 'Brazil', -23.5505, -46.6333),
+    ('Mexico City', 'Mexico', 19.4326, -99.1332),
+    ('Cairo', 'Egypt', 30.0444, 31.2357),
+    ('Mumbai', 'India', 19.076, 72.8777),
+    ('Beijing', 'China', 39.9042, 116.4074),
+    ('Dhaka', 'Bangladesh', 23.8103, 90.4125),
+    ('Osaka', 'Japan', 34.6937, 135.5023),
+    ('New York', 'United States', 40.7128, -74.006),
+    ('Karachi', 'Pakistan', 24.8607, 67.0011),
+    ('Buenos Aires', 'Argentina', -34.6037, -58.3816),
+    ('Istanbul', 'Turkey', 41.0082, 28.9784),
+    ('Kolkata', 'India', 22.5726, 88.3639),
+    ('Manila', 'Philippines', 14.5995, 120.9842),
+    ('Lagos', 'Nigeria', 6.5244, 3.3792),
+    ('Rio de Janeiro', 'Brazil', -22.9068, -43.1729),
+    ('Guangzhou', 'China', 23.1291, 113.2644),
+    ('Los Angeles', 'United States', 34.0522, -118.2437),
+    ('Moscow', 'Russia', 55.7558, 37.6173),
+    ('Shenzhen', 'China', 22.5431, 114.0579),
+    ('Lahore', 'Pakistan', 31.5204, 74.3587),
+    ('Bangalore', 'India', 12.9716, 77.5946),
+    ('Paris', 'France', 48.8566, 2.3522),
+    ('Bogota', 'Colombia', 4.711, -74.0721),
+    ('Jakarta', 'Indonesia', -6.2088, 106.8456),
+    ('Chennai', 'India', 13.0827, 80.2707),
+    ('Lima', 'Peru', -12.0464, -77.0428),
+    ('Bangkok', 'Thailand', 13.7563, 100.5018),
+    ('Seoul', 'South Korea', 37.5665, 126.978),
+    ('Nagoya', 'Japan', 35.1815, 136.9066),
+    ('Hyderabad', 'India', 17.385, 78.4867),
+    ('London', 'United Kingdom', 51.5074, -0.1278),
+    ('Tehran', 'Iran', 35.6892, 51.389),
+    ('Chicago', 'United States', 41.8781, -87.6298),
+    ('Chengdu', 'China', 30.5728, 104.0668),
+    ('Nanjing', 'China', 32.0603, 118.7969),
+    ('Wuhan', 'China', 30.5928, 114.3055),
+    ('Ho Chi Minh City', 'Vietnam', 10.8231, 106.6297),
+    ('Luanda', 'Angola', -8.839, 13.2894),
+    ('Ahmedabad', 'India', 23.0225, 72.5714),
+    ('Kuala Lumpur', 'Malaysia', 3.139, 101.6869),
+    ("Xi'an", 'China', 34.3416, 108.9398),
+    ('Hong Kong', 'China', 22.3193, 114.1694),
+    ('Dongguan', 'China', 23.0207, 113.7518),
+    ('Hangzhou', 'China', 30.2741, 120.1551),
+    ('Foshan', 'China', 23.0215, 113.1214),
+    ('Shenyang', 'China', 41.8057, 123.4315),
+    ('Riyadh', 'Saudi Arabia', 24.7136, 46.6753),
+    ('Baghdad', 'Iraq', 33.3152, 44.3661),
+    ('Santiago', 'Chile', -33.4489, -70.6693),
+    ('Surat', 'India', 21.1702, 72.8311),
+    ('Madrid', 'Spain', 40.4168, -3.7038),
+    ('Suzhou', 'China', 31.2989, 120.5853),
+    ('Pune', 'India', 18.5204, 73.8567),
+    ('Harbin', 'China', 45.8038, 126.535),
+    ('Houston', 'United States', 29.7604, -95.3698),
+    ('Dallas', 'United States', 32.7767, -96.797),
+    ('Toronto', 'Canada', 43.6532, -79.3832),
+    ('Dar es Salaam', 'Tanzania', -6.7924, 39.2083),
+    ('Miami', 'United States', 25.7617, -80.1918),
+    ('Belo Horizonte', 'Brazil', -19.9167, -43.9345),
+    ('Singapore', 'Singapore', 1.3521, 103.8198),
+    ('Philadelphia', 'United States', 39.9526, -75.1652),
+    ('Atlanta', 'United States', 33.749, -84.388),
+    ('Fukuoka', 'Japan', 33.5904, 130.4017),
+    ('Khartoum', 'Sudan', 15.5007, 32.5599),
+    ('Barcelona', 'Spain', 41.3874, 2.1686),
+    ('Johannesburg', 'South Africa', -26.2041, 28.0473),
+    ('Saint Petersburg', 'Russia', 59.9311, 30.3609),
+    ('Qingdao', 'China', 36.0671, 120.3826),
+    ('Dalian', 'China', 38.914, 121.6147),
+    ('Washington', 'United States', 38.9072, -77.0369),
+    ('Yangon', 'Myanmar', 16.8409, 96.1735),
+    ('Alexandria', 'Egypt', 31.2001, 29.9187),
+    ('Jinan', 'China', 36.6512, 117.1201),
+    ('Guadalajara', 'Mexico', 20.6597, -103.3496),
+    ('Boston', 'United States', 42.3601, -71.0589),
+    ('Phoenix', 'United States', 33.4484, -112.074),
+    ('San Francisco', 'United States', 37.7749, -122.4194),
+    ('Seattle', 'United States', 47.6062, -122.3321),
+    ('San Diego', 'United States', 32.7157, -117.1611),
+    ('Denver', 'United States', 39.7392, -104.9903),
+    ('Las Vegas', 'United States', 36.1699, -115.1398),
+    ('Portland', 'United States', 45.5152, -122.6784),
+    ('New Orleans', 'United States', 29.9511, -90.0715),
+    ('Honolulu', 'United States', 21.3069, -157.8583),
+    ('Anchorage', 'United States', 61.2181, -149.9003),
+    ('Austin', 'United States', 30.2672, -97.7431),
+    ('Nashville', 'United States', 36.1627, -86.7816),
+    ('Minneapolis', 'United States', 44.9778, -93.265),
+    ('Detroit', 'United States', 42.3314, -83.0458),
+    ('Montreal', 'Canada', 45.5017, -73.5673),
+    ('Vancouver', 'Canada', 49.2827, -123.1207),
+    ('Calgary', 'Canada', 51.0447, -114.0719),
+    ('Ottawa', 'Canada', 45.4215, -75.6972),
+    ('Quebec City', 'Canada', 46.8139, -71.208),
+    ('Havana', 'Cuba', 23.1136, -82.3666),
+    ('Cancun', 'Mexico', 21.1619, -86.8515),
+    ('Panama City', 'Panama', 8.9824, -79.5199),
+    ('San Jose', 'Costa Rica', 9.9281, -84.0907),
+    ('Quito', 'Ecuador', -0.1807, -78.4678),
+    ('Cusco', 'Peru', -13.5319, -71.9675),
+    ('Caracas', 'Venezuela', 10.4806, -66.9036),
+    ('Montevideo', 'Uruguay', -34.9011, -56.1645),
+    ('La Paz', 'Bolivia', -16.4897, -68.1193),
+    ('Brasilia', 'Brazil', -15.7975, -47.8919),
+    ('Salvador', 'Brazil', -12.9777, -38.5016),
+    ('Berlin', 'Germany', 52.52, 13.405),
+    ('Munich', 'Germany', 48.1351, 11.582),
+    ('Hamburg', 'Germany', 53.5511, 9.9937),
+    ('Frankfurt', 'Germany', 50.1109, 8.6821),
+    ('Cologne', 'Germany', 50.9375, 6.9603),
+    ('Rome', 'Italy', 41.9028, 12.4964),
+    ('Milan', 'Italy', 45.4642, 9.19),
+    ('Venice', 'Italy', 45.4408, 12.3155),
+    ('Florence', 'Italy', 43.7696, 11.2558),
+    ('Naples', 'Italy', 40.8518, 14.2681),
+    ('Lisbon', 'Portugal', 38.7223, -9.1393),
+    ('Porto', 'Portugal', 41.1579, -8.6291),
+    ('Seville', 'Spain', 37.3891, -5.9845),
+    ('Valencia', 'Spain', 39.4699, -0.3763),
+    ('Amsterdam', 'Netherlands', 52.3676, 4.9041),
+    ('Rotterdam', 'Netherlands', 51.9244, 4.4777),
+    ('Brussels', 'Belgium', 50.8503, 4.3517),
+    ('Zurich', 'Switzerland', 47.3769, 8.5417),
+    ('Geneva', 'Switzerland', 46.2044, 6.1432),
+    ('Vienna', 'Austria', 48.2082, 16.3738),
+    ('Prague', 'Czech Republic', 50.0755, 14.4378),
+    ('Budapest', 'Hungary', 47.4979, 19.0402),
+    ('Warsaw', 'Poland', 52.2297, 21.0122),
+    ('Krakow', 'Poland', 50.0647, 19.945),
+    ('Copenhagen', 'Denmark', 55.6761, 12.5683),
+    ('Stockholm', 'Sweden', 59.3293, 18.0686),
+    ('Oslo', 'Norway', 59.9139, 10.7522),
+    ('Helsinki', 'Finland', 60.1699, 24.9384),
+    ('Reykjavik', 'Iceland', 64.1466, -21.9426),
+    ('Dublin', 'Ireland', 53.3498, -6.2603),
+    ('Edinburgh', 'United Kingdom', 55.9533, -3.1883),
+    ('Manchester', 'United Kingdom', 53.4808, -2.2426),
+    ('Athens', 'Greece', 37.9838, 23.7275),
+    ('Santorini', 'Greece', 36.3932, 25.4615),
+    ('Dubrovnik', 'Croatia', 42.6507, 18.0944),
+    ('Bucharest', 'Romania', 44.4268, 26.1025),
+    ('Sofia', 'Bulgaria', 42.6977, 23.3219),
+    ('Belgrade', 'Serbia', 44.7866, 20.4489),
+    ('Kyiv', 'Ukraine', 50.4501, 30.5234),
+    ('Nice', 'France', 43.7102, 7.262),
+    ('Lyon', 'France', 45.764, 4.8357),
+    ('Marseille', 'France', 43.2965, 5.3698),
+    ('Marrakech', 'Morocco', 31.6295, -7.9811),
+    ('Casablanca', 'Morocco', 33.5731, -7.5898),
+    ('Tunis', 'Tunisia', 36.8065, 10.1815),
+    ('Nairobi', 'Kenya', -1.2921, 36.8219),
+    ('Addis Ababa', 'Ethiopia', 9.03, 38.74),
+    ('Accra', 'Ghana', 5.6037, -0.187),
+    ('Cape Town', 'South Africa', -33.9249, 18.4241),
+    ('Zanzibar', 'Tanzania', -6.1659, 39.2026),
+    ('Dubai', 'United Arab Emirates', 25.2048, 55.2708),
+    ('Abu Dhabi', 'United Arab Emirates', 24.4539, 54.3773),
+    ('Doha', 'Qatar', 25.2854, 51.531),
+    ('Jerusalem', 'Israel', 31.7683, 35.2137),
+    ('Tel Aviv', 'Israel', 32.0853, 34.7818),
+    ('Amman', 'Jordan', 31.9454, 35.9284),
+    ('Petra', 'Jordan', 30.3285, 35.4444),
+    ('Beirut', 'Lebanon', 33.8938, 35.5018),
+    ('Kathmandu', 'Nepal', 27.7172, 85.324),
+    ('Colombo', 'Sri Lanka', 6.9271, 79.8612),
+    ('Male', 'Maldives', 4.1755, 73.5093),
+    ('Jaipur', 'India', 26.9124, 75.7873),
+    ('Goa', 'India', 15.2993, 74.124),
+    ('Hanoi', 'Vietnam', 21.0278, 105.8342),
+    ('Phnom Penh', 'Cambodia', 11.5564, 104.9282),
+    ('Siem Reap', 'Cambodia', 13.3671, 103.8448),
+    ('Chiang Mai', 'Thailand', 18.7883, 98.9853),
+    ('Phuket', 'Thailand', 7.8804, 98.3923),
+    ('Bali', 'Indonesia', -8.3405, 115.092),
+    ('Taipei', 'Taiwan', 25.033, 121.5654),
+    ('Kyoto', 'Japan', 35.0116, 135.7681),
+    ('Sapporo', 'Japan', 43.0618, 141.3545),
+    ('Busan', 'South Korea', 35.1796, 129.0756),
+    ('Ulaanbaatar', 'Mongolia', 47.8864, 106.9057),
+    ('Sydney', 'Australia', -33.8688, 151.2093),
+    ('Melbourne', 'Australia', -37.8136, 144.9631),
+    ('Brisbane', 'Australia', -27.4698, 153.0251),
+    ('Perth', 'Australia', -31.9505, 115.8605),
+    ('Adelaide', 'Australia', -34.9285, 138.6007),
+    ('Cairns', 'Australia', -16.9186, 145.7781),
+    ('Auckland', 'New Zealand', -36.8485, 174.7633),
+    ('Wellington', 'New Zealand', -41.2865, 174.7762),
+    ('Queenstown', 'New Zealand', -45.0312, 168.6626),
+    ('Fiji', 'Fiji', -17.7134, 178.065),
+)
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def _normalize(name):
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return ' '.join(name.lower().replace('.', '').split())
+
+
+def _places():
+    places = {}
+    for name, country, latitude, longitude in PLACES:
+        places.setdefault(_normalize(f"{name}, {country}"), (latitude, longitude))
+        places.setdefault(_normalize(name), (latitude, longitude))
+    return places
+
+
+def geocode(location, places):
+    if not location:
+        return None
+    normalized = _normalize(location)
+    if normalized in places:
+        return places[normalized]
+    for part in normalized.split(','):
+        point = places.get(part.strip())
+        if point is not None:
+            return point
+    return None
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    bind = op.get_bind()
+    geohash_type = sa.String(length=12, collation='C') if bind.dialect.name == 'postgresql' else sa.String(length=12)
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geohash', geohash_type, nullable=True))
+        batch_op.create_index('ix_entries_geohash_id', ['geohash', 'id'], unique=False)
+
+    # ### end Alembic commands ###
+
+    # Optional PostGIS index, used when GEO_POSTGIS is on
+    if bind.dialect.name == 'postgresql' and bind.execute(
+        sa.text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+    ).first():
+        op.execute(
+            "CREATE INDEX ix_entries_point ON entries USING gist "
+            "(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326))"
+        )
+
+    # Backfill from the offline gazetteer, one UPDATE per distinct location
+    entries = sa.table('entries', sa.column('location', sa.String), sa.column('latitude', sa.Float),
+                       sa.column('longitude', sa.Float), sa.column('geohash', sa.String))
+    places = _places()
+    for (location,) in bind.execute(sa.select(entries.c.location).distinct()).all():
+        point = geocode(location, places)
+        if point is not None:
+            bind.execute(entries.update().where(entries.c.location == location)
+                         .values(latitude=point[0], longitude=point[1], geohash=encode_geohash(*point)))
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.execute("DROP INDEX IF EXISTS ix_entries_point")
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_entries_geohash_id')
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
+
+    # ### end Alembic commands ###
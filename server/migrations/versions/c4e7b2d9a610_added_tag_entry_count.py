@@ -0,0 +1,33 @@
+"""Added tag entry count and case-insensitive name index
+
+Revision ID: c4e7b2d9a610
+Revises: a6d3f8c2b915
+Create Date: 2026-10-18 23:12:40.551873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7b2d9a610'
+down_revision = 'a6d3f8c2b915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('entry_count', sa.Integer(), server_default='0', nullable=False))
+    # Tag lookups compare lower(name)
+    op.create_index('ix_tags_lower_name', 'tags', [sa.text('lower(name)')], unique=False)
+
+    op.execute(
+        "UPDATE tags SET entry_count = (SELECT count(*) FROM entry_tags WHERE entry_tags.tag_id = tags.id)"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_tags_lower_name', table_name='tags')
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.drop_column('entry_count')
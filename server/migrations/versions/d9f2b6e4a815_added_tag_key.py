@@ -0,0 +1,103 @@
+"""Added tag key
+
+Revision ID: d9f2b6e4a815
+Revises: b8e2d4f6a913
+Create Date: 2026-10-20 10:14:52.306418
+
+"""
+import unicodedata
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f2b6e4a815'
+down_revision = 'b8e2d4f6a913'
+branch_labels = None
+depends_on = None
+
+tags = sa.table('tags', sa.column('id', sa.Integer), sa.column('name', sa.String), sa.column('key', sa.String),
+                sa.column('entry_count', sa.Integer))
+entry_tags = sa.table('entry_tags', sa.column('entry_id', sa.Integer), sa.column('tag_id', sa.Integer))
+entries = sa.table('entries', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer))
+user_tag_stats = sa.table('user_tag_stats', sa.column('user_id', sa.Integer), sa.column('tag_id', sa.Integer),
+                          sa.column('entry_count', sa.Integer))
+changes = sa.table('changes', sa.column('kind', sa.String), sa.column('object_id', sa.Integer),
+                   sa.column('parent_id', sa.Integer), sa.column('user_id', sa.Integer),
+                   sa.column('deleted', sa.Boolean), sa.column('changed_at', sa.DateTime))
+
+
+# Frozen copy of tags.tag_key as of this revision
+def tag_key(name):
+    return ' '.join(unicodedata.normalize('NFKC', name).split()).casefold()
+
+
+def merge(bind, keep, duplicates):
+    # Moves the duplicates' entry links onto `keep` and deletes them, logging
+    # the moves and tombstones for sync clients; then recounts `keep`
+    now = datetime.utcnow()
+    kept = set(bind.scalars(sa.select(entry_tags.c.entry_id).where(entry_tags.c.tag_id == keep)))
+    for duplicate in duplicates:
+        links = bind.execute(
+            sa.select(entry_tags.c.entry_id, entries.c.user_id)
+            .join(entries, entries.c.id == entry_tags.c.entry_id)
+            .where(entry_tags.c.tag_id == duplicate)
+        ).all()
+        moved = [(entry_id, user_id) for entry_id, user_id in links if entry_id not in kept]
+        kept.update(entry_id for entry_id, _ in moved)
+        bind.execute(entry_tags.delete().where(entry_tags.c.tag_id == duplicate))
+        if moved:
+            bind.execute(entry_tags.insert(), [{"entry_id": entry_id, "tag_id": keep} for entry_id, _ in moved])
+        bind.execute(changes.insert(), [
+            {"kind": 'entry_tag', "object_id": duplicate, "parent_id": entry_id, "user_id": user_id,
+             "deleted": True, "changed_at": now} for entry_id, user_id in links
+        ] + [
+            {"kind": 'entry_tag', "object_id": keep, "parent_id": entry_id, "user_id": user_id,
+             "deleted": False, "changed_at": now} for entry_id, user_id in moved
+        ] + [
+            {"kind": 'tag', "object_id": duplicate, "parent_id": None, "user_id": None,
+             "deleted": True, "changed_at": now}
+        ])
+        bind.execute(user_tag_stats.delete().where(user_tag_stats.c.tag_id == duplicate))
+        bind.execute(tags.delete().where(tags.c.id == duplicate))
+
+    bind.execute(tags.update().where(tags.c.id == keep).values(entry_count=len(kept)))
+    bind.execute(user_tag_stats.delete().where(user_tag_stats.c.tag_id == keep))
+    bind.execute(user_tag_stats.insert().from_select(
+        ['user_id', 'tag_id', 'entry_count'],
+        sa.select(entries.c.user_id, entry_tags.c.tag_id, sa.func.count())
+        .join(entries, entries.c.id == entry_tags.c.entry_id)
+        .where(entry_tags.c.tag_id == keep)
+        .group_by(entries.c.user_id, entry_tags.c.tag_id)
+    ))
+
+
+def upgrade():
+    bind = op.get_bind()
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('key', sa.String(length=150), nullable=True))
+
+    # lower(name) only folded ASCII on some databases, so names such as 'Été'
+    # and 'été' could both exist; the oldest of each key keeps the entries
+    by_key = {}
+    for tag_id, name in bind.execute(sa.select(tags.c.id, tags.c.name).order_by(tags.c.id)).all():
+        by_key.setdefault(tag_key(name), []).append(tag_id)
+    for key, tag_ids in by_key.items():
+        if len(tag_ids) > 1:
+            merge(bind, tag_ids[0], tag_ids[1:])
+        bind.execute(tags.update().where(tags.c.id == tag_ids[0]).values(key=key))
+
+    op.drop_index('ix_tags_lower_name', table_name='tags')
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.alter_column('key', existing_type=sa.String(length=150), nullable=False)
+        batch_op.create_index('ix_tags_key', ['key'], unique=True)
+
+
+def downgrade():
+    # Merged duplicates are not split again
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.drop_index('ix_tags_key')
+        batch_op.drop_column('key')
+    op.create_index('ix_tags_lower_name', 'tags', [sa.text('lower(name)')], unique=False)
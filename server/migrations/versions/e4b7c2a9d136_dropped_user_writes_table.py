@@ -0,0 +1,29 @@
+"""Dropped user writes table
+
+Revision ID: e4b7c2a9d136
+Revises: d9f2b6e4a815
+Create Date: 2026-10-20 15:41:07.528390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c2a9d136'
+down_revision = 'd9f2b6e4a815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Read-your-writes now travels in the signed X-Last-Write header
+    op.drop_table('user_writes')
+
+
+def downgrade():
+    op.create_table('user_writes',
+        sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('written_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id')
+    )
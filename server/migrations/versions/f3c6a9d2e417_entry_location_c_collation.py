@@ -0,0 +1,38 @@
+"""Entry location in C collation with a plain listing index
+
+Revision ID: f3c6a9d2e417
+Revises: e8b3f1a4c905
+Create Date: 2026-10-19 10:21:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c6a9d2e417'
+down_revision = 'e8b3f1a4c905'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # PostgreSQL only: in C collation one btree index serves location prefix
+    # ranges and ORDER BY location, date, id; a varchar_pattern_ops index
+    # only served the former. SQLite already compares bytes.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_entries_location_date_id', table_name='entries')
+    op.alter_column('entries', 'location', type_=sa.String(length=100, collation='C'),
+                    existing_type=sa.String(length=100), existing_nullable=False)
+    op.create_index('ix_entries_location_date_id', 'entries', ['location', 'date', 'id'], unique=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_entries_location_date_id', table_name='entries')
+    op.alter_column('entries', 'location', type_=sa.String(length=100),
+                    existing_type=sa.String(length=100, collation='C'), existing_nullable=False)
+    op.create_index('ix_entries_location_date_id', 'entries', ['location', 'date', 'id'], unique=False,
+                    postgresql_ops={'location': 'varchar_pattern_ops'})
@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy_serializer import SerializerMixin
 from datetime import datetime
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# Reads in GET requests may go to a read replica; see replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model, SerializerMixin):
     __tablename__ = 'users'
@@ -19,16 +21,32 @@ class Entry(db.Model, SerializerMixin):
     __tablename__ = 'entries'
 
     id = db.Column(db.Integer, primary_key=True)
-    location = db.Column(db.String(100), nullable=False)
+    # C collation on PostgreSQL (SQLite compares bytes anyway), so one index
+    # serves both location prefix ranges and ORDER BY location
+    location = db.Column(db.String(100).with_variant(db.String(100, collation='C'), 'postgresql'), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     description = db.Column(db.Text, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Set from the request or geocoded from `location`; see geo.py. The geohash
+    # is compared as raw bytes (C collation) so prefix ranges use the index.
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    geohash = db.Column(db.String(12).with_variant(db.String(12, collation='C'), 'postgresql'), nullable=True)
+
     photos = db.relationship('Photo', back_populates='entry', lazy=True, cascade='all, delete-orphan')
-    tags = db.relationship('Tag', secondary='entry_tags', back_populates='entries', lazy='dynamic')
+    tags = db.relationship('Tag', secondary='entry_tags', back_populates='entries', lazy='select')
     user = db.relationship('User', back_populates='entries')
 
+    # Composite indexes backing the keyset-paginated, filterable entry listing
+    __table_args__ = (
+        db.Index('ix_entries_date_id', 'date', 'id'),
+        db.Index('ix_entries_user_id_date_id', 'user_id', 'date', 'id'),
+        db.Index('ix_entries_location_date_id', 'location', 'date', 'id'),
+        db.Index('ix_entries_geohash_id', 'geohash', 'id'),
+    )
+
 class Photo(db.Model, SerializerMixin):
     __tablename__ = 'photos'
 
@@ -37,19 +55,154 @@ class Photo(db.Model, SerializerMixin):
     entry_id = db.Column(db.Integer, db.ForeignKey('entries.id'), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Set for uploaded files only; photos added by URL leave these empty
+    storage_key = db.Column(db.String(200), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    content_type = db.Column(db.String(50), nullable=True)
+    size = db.Column(db.Integer, nullable=True)
+    thumbnail_url = db.Column(db.String(200), nullable=True)
+    preview_url = db.Column(db.String(200), nullable=True)
+
     entry = db.relationship('Entry', back_populates='photos', lazy=True)
 
+    # An entry's photos in upload order; uploads by content hash. Partial, so
+    # the many photos added by URL (no hash) neither bloat the index nor skew
+    # the planner's estimates for it.
+    __table_args__ = (
+        db.Index('ix_photos_entry_id_id', 'entry_id', 'id'),
+        db.Index('ix_photos_content_hash', 'content_hash',
+                 sqlite_where=db.text('content_hash IS NOT NULL'),
+                 postgresql_where=db.text('content_hash IS NOT NULL')),
+    )
+
+def _tag_key(context):
+    # Tag.key for inserts that only give a name (Tag(name=...), Core inserts)
+    from tags import tag_key
+    return tag_key(context.get_current_parameters()['name'])
+
 class Tag(db.Model, SerializerMixin):
     __tablename__ = 'tags'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
+    # tags.tag_key(name): NFKC, casefolded in Python so every database and the
+    # prefix index agree on which names are one tag; casefolding can triple
+    # the length ('ß' -> 'ss', ligatures)
+    key = db.Column(db.String(150), nullable=False, default=_tag_key)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Entries carrying the tag, kept by stats.py; ranks tag suggestions
+    entry_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     entries = db.relationship('Entry', secondary='entry_tags', back_populates='tags', lazy='dynamic')
 
+    # 'Travel', 'travel' and 'TRAVEL' are one tag
+    __table_args__ = (
+        db.Index('ix_tags_key', key, unique=True),
+    )
+
 class EntryTag(db.Model):
     __tablename__ = 'entry_tags'
 
     entry_id = db.Column(db.Integer, db.ForeignKey('entries.id'), primary_key=True)
     tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_entry_tags_tag_id_entry_id', 'tag_id', 'entry_id'),
+    )
+
+# Per-user journal statistics, maintained incrementally by the write routes
+# (see stats.py) so the stats endpoint never scans entries/photos/entry_tags
+class UserStats(db.Model):
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    photo_count = db.Column(db.Integer, nullable=False, default=0)
+    location_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserMonthStats(db.Model):
+    __tablename__ = 'user_month_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM'
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Entries per user and calendar day; GET /api/entries/timeline sums these
+# into days, weeks, months or years instead of grouping the entries
+class UserDayStats(db.Model):
+    __tablename__ = 'user_day_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserLocationStats(db.Model):
+    __tablename__ = 'user_location_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    location = db.Column(db.String(100), primary_key=True)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserTagStats(db.Model):
+    __tablename__ = 'user_tag_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_user_tag_stats_user_id_entry_count', 'user_id', 'entry_count'),
+        db.Index('ix_user_tag_stats_tag_id', 'tag_id'),
+    )
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    idempotency_key = db.Column(db.String(200), nullable=True, unique=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Workers claim the oldest due job per status
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+# Revoked JWTs (logout). Each process keeps a Bloom filter of these jtis and
+# polls for new rows by id; see auth.py.
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    token_type = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Change feed for delta sync (GET /api/sync). One row per created, changed or
+# deleted object; ids are handed out in commit order and double as sync
+# tokens, so AUTOINCREMENT keeps SQLite from reusing them. See sync.py.
+class Change(db.Model):
+    __tablename__ = 'changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)  # entry, photo, tag, entry_tag
+    object_id = db.Column(db.Integer, nullable=False)  # tag id for entry_tag
+    parent_id = db.Column(db.Integer, nullable=True)  # entry id for photo and entry_tag
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # NULL for tags, shared by everyone
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_changes_user_id_id', 'user_id', 'id'),
+        {'sqlite_autoincrement': True},
+    )
@@ -0,0 +1,36 @@
+import base64
+import json
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    # Falls back to the default for anything that isn't a positive integer
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return default
+    if limit < 1:
+        return default
+    return min(limit, maximum)
+
+
+def encode_cursor(date, id, location):
+    # Opaque token holding the (date, id) keyset of the last row on a page,
+    # and its location for listings ordered by location first
+    raw = json.dumps([date.isoformat(), id, location], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # Returns (date, id, location), raises ValueError for anything we didn't issue
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_str, id, location = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(location, str):
+            raise ValueError
+        return datetime.fromisoformat(date_str), int(id), location
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
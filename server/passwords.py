@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+# werkzeug method string: 'scrypt:N:r:p' or 'pbkdf2:sha256:iterations'
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+
+
+def stored_method(method):
+    # The method prefix werkzeug writes for `method`, with the defaults it
+    # fills in: 'scrypt' is stored as 'scrypt:32768:8:1', 'pbkdf2' as
+    # 'pbkdf2:sha256:600000'. Raises ValueError for methods it rejects.
+    name, *args = method.split(':')
+    try:
+        if name == 'scrypt':
+            n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+            return f'scrypt:{n}:{r}:{p}'
+        if name == 'pbkdf2' and len(args) <= 2:
+            hash_name = args[0] if args else 'sha256'
+            iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+            return f'pbkdf2:{hash_name}:{iterations}'
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid password hash method '{method}'.")
+
+
+def default_hash_workers():
+    # The cores shared out between the web workers (WEB_CONCURRENCY, as set
+    # for gunicorn), so all their pools together use each core once
+    return max(1, (os.cpu_count() or 1) // max(1, int(os.getenv('WEB_CONCURRENCY', 1))))
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class TooManyAttempts(Exception):
+    pass
+
+
+class PasswordHasher:
+    # Runs hashing in a bounded process pool so the CPU-heavy KDF neither holds
+    # the GIL nor lets a login burst queue up unbounded work. max_workers=0
+    # hashes inline, which is what tests and the seed script want.
+
+    def __init__(self, method=DEFAULT_HASH_METHOD, max_workers=None, max_pending=None):
+        self.configure(method, max_workers, max_pending)
+
+    def configure(self, method=DEFAULT_HASH_METHOD, max_workers=None, max_pending=None):
+        self.method = method
+        self._stored_method = stored_method(method)
+        self.max_workers = default_hash_workers() if max_workers is None else max_workers
+        self.max_pending = max_pending or self.max_workers * 4
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configure(
+            app.config.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD),
+            app.config.get('PASSWORD_HASH_WORKERS'),
+            app.config.get('PASSWORD_HASH_MAX_PENDING'),
+        )
+        app.extensions['password_hasher'] = self
+
+    def _executor(self):
+        # Created lazily and per process, so gunicorn's fork never inherits a pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def warm(self):
+        # Starts the pool's processes ahead of the first login
+        if self.max_workers:
+            self._executor().submit(int).result()
+
+    def _run(self, fn, *args):
+        if self.max_workers == 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            return self._executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        # Stored hashes look like '<method>$<salt>$<hash>', with every
+        # parameter of the method spelled out
+        return stored_hash.split('$', 1)[0] != self._stored_method
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+
+class ConcurrencyLimiter:
+    # Caps how many attempts may be in flight at once for any single key
+    # (client IP, username, ...)
+
+    def __init__(self, limit=2):
+        self.limit = limit
+        self._active = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, *keys):
+        keys = [key for key in keys if key]
+        with self._lock:
+            if any(self._active[key] >= self.limit for key in keys):
+                raise TooManyAttempts()
+            for key in keys:
+                self._active[key] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for key in keys:
+                    self._active[key] -= 1
+                    if not self._active[key]:
+                        del self._active[key]
+
+
+def password_config_from_env():
+    workers = os.getenv('PASSWORD_HASH_WORKERS')
+    return {
+        'PASSWORD_HASH_METHOD': os.getenv('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD),
+        'PASSWORD_HASH_WORKERS': int(workers) if workers is not None else None,
+        'PASSWORD_HASH_MAX_PENDING': int(os.getenv('PASSWORD_HASH_MAX_PENDING', 0)) or None,
+        'AUTH_CONCURRENCY_LIMIT': int(os.getenv('AUTH_CONCURRENCY_LIMIT', 2)),
+    }
+
+
+password_hasher = PasswordHasher(max_workers=0)
+auth_limiter = ConcurrencyLimiter()
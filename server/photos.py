@@ -0,0 +1,264 @@
+import hashlib
+import io
+import os
+import tempfile
+from importlib.util import find_spec
+
+from sqlalchemy import delete, func, select, update
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser
+
+from models import db, Photo, Job
+from jobs import job, enqueue, after_commit
+from storage import storage_from_config
+from cache import response_cache, entry_key, entry_photos_key
+import sync
+
+# Pillow is optional; uploads still work, just without thumbnails. It is
+# imported by the job that renders them, not by every web worker.
+HAVE_PILLOW = find_spec('PIL') is not None
+
+# Leading bytes -> (content type, extension). Sniffed rather than trusting the
+# part's declared Content-Type.
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'GIF87a', 'image/gif', '.gif'),
+    (b'GIF89a', 'image/gif', '.gif'),
+)
+# Photo column -> longest edge in pixels. Largest first: each size is
+# downscaled from the one before it.
+THUMBNAIL_SIZES = (('preview_url', 1280), ('thumbnail_url', 256))
+UPLOAD_FIELD = 'photo'
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+def sniff_image_type(header):
+    for signature, content_type, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return content_type, extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    return None
+
+
+class HashingFile:
+    # Sink for one multipart file part: each chunk the parser reads is written
+    # to a temporary file and fed to SHA-256 in the same pass, so the upload is
+    # never held in memory and never re-read just to hash it
+    def __init__(self, tmp_dir, max_size=None):
+        self._file = tempfile.NamedTemporaryFile(dir=tmp_dir, prefix='upload-', delete=False)
+        self.name = self._file.name
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            # Chunked bodies carry no Content-Length to reject up front
+            raise RequestEntityTooLarge()
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.name)
+        except FileNotFoundError:
+            pass
+
+
+def original_key(content_hash, extension):
+    return f'photos/{content_hash[:2]}/{content_hash}{extension}'
+
+
+def thumbnail_key(content_hash, size):
+    return f'thumbs/{content_hash[:2]}/{content_hash}-{size}.jpg'
+
+
+def lock_content(content_hash):
+    # Held until the transaction ends, so an upload that finds the file already
+    # stored commits its Photo row before a release of the same content can
+    # count the rows, or only looks once that release has deleted the files.
+    # SQLite has one writer at a time: any write, even one matching no rows,
+    # queues behind the others.
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(select(func.pg_advisory_xact_lock(int(content_hash[:15], 16))))
+    else:
+        db.session.execute(update(Photo).where(Photo.content_hash == content_hash)
+                           .values(content_hash=Photo.content_hash))
+
+
+class PhotoPipeline:
+    # Multipart uploads are streamed to content-addressed storage during the
+    # request; thumbnails are rendered and unused files deleted afterwards, by
+    # the job worker (see the handlers at the bottom of this module). Storing,
+    # rendering and deleting the files of one content hash all happen under
+    # lock_content, in the transaction that adds or drops the Photo rows.
+
+    def __init__(self):
+        self.storage = None
+        self.max_upload_bytes = None
+
+    def init_app(self, app):
+        self.storage = storage_from_config(app.config)
+        self.max_upload_bytes = app.config.get('PHOTO_MAX_UPLOAD_BYTES')
+        app.extensions['photo_pipeline'] = self
+
+    def receive(self, request):
+        # Parses the multipart body and stores the UPLOAD_FIELD file. Returns a
+        # dict of Photo column values; the caller adds the Photo row in the
+        # same transaction. RequestEntityTooLarge propagates.
+        if self.max_upload_bytes is not None and (request.content_length or 0) > self.max_upload_bytes:
+            raise RequestEntityTooLarge()
+        sinks = []
+
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            sink = HashingFile(self.storage.tmp_dir, self.max_upload_bytes)
+            sinks.append(sink)
+            return sink
+
+        parser = FormDataParser(stream_factory=stream_factory, silent=False)
+        try:
+            _, _, files = parser.parse(request.stream, request.mimetype, request.content_length,
+                                       request.mimetype_params)
+            upload = files.get(UPLOAD_FIELD)
+            if upload is None:
+                raise InvalidUpload(f"A '{UPLOAD_FIELD}' file part is required.")
+            sink = upload.stream
+            sink.flush()
+            sink.seek(0)
+            sniffed = sniff_image_type(sink.read(12))
+            if sniffed is None:
+                raise InvalidUpload("Unsupported image type.")
+            sink.close()
+
+            content_type, extension = sniffed
+            content_hash = sink.sha256.hexdigest()
+            key = original_key(content_hash, extension)
+            lock_content(content_hash)
+            if self.storage.exists(key):
+                sink.discard()
+            else:
+                self.storage.put_file(key, sink.name, content_type)
+            return {
+                "url": self.storage.url(key),
+                "storage_key": key,
+                "content_hash": content_hash,
+                "content_type": content_type,
+                "size": sink.size,
+            }
+        finally:
+            for sink in sinks:
+                if os.path.exists(sink.name):
+                    sink.discard()
+
+    def reuse_thumbnails(self, content_hash):
+        # Thumbnail columns from an earlier upload of the same bytes, if rendered
+        existing = db.session.execute(
+            select(Photo.thumbnail_url, Photo.preview_url)
+            .where(Photo.content_hash == content_hash, Photo.thumbnail_url.is_not(None)).limit(1)
+        ).first()
+        return dict(existing._mapping) if existing else {}
+
+    def schedule_thumbnails(self, content_hash, key):
+        # Call in the transaction that adds the Photo row
+        if HAVE_PILLOW:
+            enqueue('photos.render_thumbnails', {"content_hash": content_hash, "key": key},
+                    idempotency_key=f'thumbnails:{content_hash}')
+
+    def schedule_release(self, content_hash, key):
+        # Call in the transaction that deletes a Photo row
+        if content_hash is not None:
+            enqueue('photos.release', {"content_hash": content_hash, "key": key})
+
+    def render_thumbnails(self, content_hash, key):
+        from PIL import Image, ImageOps
+
+        lock_content(content_hash)
+        if not self._in_use(content_hash):
+            # Released since; the files are gone
+            return
+        with self.storage.open(key) as f:
+            # S3 bodies are not seekable, which Pillow needs
+            source = f if f.seekable() else io.BytesIO(f.read())
+            image = Image.open(source)
+            # For JPEGs, decode at a reduced DCT scale instead of full resolution
+            largest = max(size for _, size in THUMBNAIL_SIZES)
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+        values = {}
+        for column, size in THUMBNAIL_SIZES:
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=85, optimize=True)
+            thumb_key = thumbnail_key(content_hash, size)
+            self.storage.put_bytes(thumb_key, buffer.getvalue(), 'image/jpeg')
+            values[column] = self.storage.url(thumb_key)
+
+        updated = db.session.execute(
+            update(Photo).where(Photo.content_hash == content_hash).values(**values)
+            .returning(Photo.id, Photo.entry_id)
+        ).tuples().all()
+        if updated:
+            sync.photos_saved(updated)
+        entry_ids = {entry_id for _, entry_id in updated}
+        after_commit(lambda: response_cache.invalidate(
+            *(cache_key for entry_id in entry_ids for cache_key in (entry_key(entry_id), entry_photos_key(entry_id)))
+        ))
+
+    def _in_use(self, content_hash):
+        return db.session.scalar(select(Photo.id).filter_by(content_hash=content_hash).limit(1)) is not None
+
+    def release(self, content_hash, key):
+        # Drops the stored files once no photo shares the content any more
+        lock_content(content_hash)
+        if self._in_use(content_hash):
+            return
+        self.storage.delete(key)
+        for _, size in THUMBNAIL_SIZES:
+            self.storage.delete(thumbnail_key(content_hash, size))
+        # A later upload of the same bytes needs its thumbnails rendered again
+        db.session.execute(delete(Job).where(Job.idempotency_key == f'thumbnails:{content_hash}'))
+
+
+def photo_config_from_env():
+    config = {
+        'PHOTO_STORAGE': os.getenv('PHOTO_STORAGE', 'filesystem'),
+        # Relative to server/, whichever directory the web or job process runs from
+        'PHOTO_ROOT': os.path.join(SERVER_DIR, os.getenv('PHOTO_ROOT', 'uploads')),
+        'PHOTO_BASE_URL': os.getenv('PHOTO_BASE_URL', '/media/'),
+        'PHOTO_MAX_UPLOAD_BYTES': int(os.getenv('PHOTO_MAX_UPLOAD_MB', 25)) * 1024 * 1024,
+        # '' (Flask sends files), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+        'PHOTO_OFFLOAD': os.getenv('PHOTO_OFFLOAD', ''),
+        'PHOTO_ACCEL_PREFIX': os.getenv('PHOTO_ACCEL_PREFIX', '/protected-media/'),
+    }
+    if config['PHOTO_STORAGE'] == 's3':
+        config.update({
+            'PHOTO_S3_BUCKET': os.getenv('PHOTO_S3_BUCKET'),
+            'PHOTO_S3_PREFIX': os.getenv('PHOTO_S3_PREFIX', ''),
+            'PHOTO_S3_ENDPOINT_URL': os.getenv('PHOTO_S3_ENDPOINT_URL'),
+        })
+    return config
+
+
+photo_pipeline = PhotoPipeline()
+
+
+@job('photos.render_thumbnails')
+def render_thumbnails_job(content_hash, key):
+    photo_pipeline.render_thumbnails(content_hash, key)
+
+
+@job('photos.release')
+def release_job(content_hash, key):
+    photo_pipeline.release(content_hash, key)
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import selectinload
+from models import Entry, Photo, Tag, EntryTag
+from pagination import parse_limit, encode_cursor, decode_cursor
+from tags import PREFIX_END, tag_key
+
+# Relationships an entry representation may embed
+EMBEDDABLE = ('photos', 'tags')
+
+# Listing reads plain column tuples; see serializers.serialize_entry_row
+ENTRY_COLUMNS = (Entry.id, Entry.location, Entry.date, Entry.description, Entry.user_id, Entry.latitude, Entry.longitude)
+
+
+def parse_include(value):
+    return tuple(name for name in (value or '').split(',') if name in EMBEDDABLE)
+
+
+def eager_options(include):
+    return [selectinload(getattr(Entry, name)) for name in include]
+
+
+def parse_date_range(args):
+    # date_from and date_to ('YYYY-MM-DD', both inclusive) as the datetimes
+    # bounding [date_from, date_to + 1 day); None where not given
+    try:
+        date_from = datetime.strptime(args['date_from'], '%Y-%m-%d') if args.get('date_from') else None
+        date_until = datetime.strptime(args['date_to'], '%Y-%m-%d') + timedelta(days=1) if args.get('date_to') else None
+    except ValueError:
+        raise ValueError("Invalid date format. Use 'YYYY-MM-DD'.")
+    return date_from, date_until
+
+
+def entry_list_statement(args):
+    # Builds the keyset-paginated entry listing from request args. Shared by the
+    # WSGI and ASGI apps; raises ValueError with a client-facing message.
+    limit = parse_limit(args.get('limit'))
+    stmt = select(*ENTRY_COLUMNS)
+
+    # Optional filters, each backed by an index on the entries table
+    user_id = args.get('user_id', type=int)
+    if user_id is not None:
+        stmt = stmt.where(Entry.user_id == user_id)
+
+    date_from, date_until = parse_date_range(args)
+    if date_from:
+        stmt = stmt.where(Entry.date >= date_from)
+    if date_until:
+        stmt = stmt.where(Entry.date < date_until)
+
+    # A location prefix is a range on the column, so it can walk
+    # ix_entries_location_date_id (binary/C collation: case-sensitive)
+    location = args.get('location')
+    if location:
+        stmt = stmt.where(Entry.location >= location, Entry.location < location + PREFIX_END)
+
+    # Tags match by key (any case or width), through ix_tags_key
+    tag = args.get('tag')
+    if tag:
+        stmt = (stmt.join(EntryTag, EntryTag.entry_id == Entry.id)
+                    .join(Tag, Tag.id == EntryTag.tag_id)
+                    .where(Tag.key == tag_key(tag)))
+
+    # Keyset pagination: continue strictly after the last (date, id) seen.
+    # With a location prefix the listing is deliberately no longer newest
+    # first: it is ordered (location, date, id) descending, the order of the
+    # location index, so a page costs the same however deep it is. Entries of
+    # one location still come newest first. (Kept in date order, the prefix
+    # would have to read and sort every match before returning one page.)
+    keys = (Entry.location, Entry.date, Entry.id) if location else (Entry.date, Entry.id)
+    cursor = args.get('cursor')
+    if cursor:
+        cursor_date, cursor_id, cursor_location = decode_cursor(cursor)
+        values = (cursor_location, cursor_date, cursor_id) if location else (cursor_date, cursor_id)
+        stmt = stmt.where(tuple_(*keys) < tuple_(*values))
+
+    include = parse_include(args.get('include'))
+    stmt = stmt.order_by(*(key.desc() for key in keys)).limit(limit + 1)
+    return stmt, limit, include
+
+
+def embed_statements(entry_ids, include):
+    # One IN query per embedded relationship for a whole page of entries;
+    # every row starts with the entry_id it belongs to
+    statements = {}
+    if 'photos' in include:
+        statements['photos'] = (select(Photo.entry_id, Photo.id, Photo.url, Photo.thumbnail_url, Photo.preview_url)
+                                .where(Photo.entry_id.in_(entry_ids)).order_by(Photo.entry_id, Photo.id))
+    if 'tags' in include:
+        statements['tags'] = (select(EntryTag.entry_id, Tag.id, Tag.name)
+                              .join(Tag, Tag.id == EntryTag.tag_id)
+                              .where(EntryTag.entry_id.in_(entry_ids)).order_by(Tag.id))
+    return statements
+
+
+def split_page(entries, limit):
+    # entry_list_statement fetches one extra row to know whether a next page exists
+    if len(entries) > limit:
+        entries = entries[:limit]
+        return entries, encode_cursor(entries[-1].date, entries[-1].id, entries[-1].location)
+    return entries, None
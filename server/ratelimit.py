@@ -0,0 +1,260 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache, wraps
+
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity
+from passwords import ConcurrencyLimiter
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__()
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    # '10/minute' or '100/2hour' -> (limit, period in seconds)
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*', rate)
+    if match is None:
+        raise ValueError(f"Invalid rate limit '{rate}'")
+    count, multiple, unit = int(match.group(1)), int(match.group(2) or 1), match.group(3)
+    if count < 1 or multiple < 1:
+        raise ValueError(f"Rate limit '{rate}' must allow at least 1 request per period")
+    return count, multiple * PERIODS[unit]
+
+
+def sliding_window(current, previous, elapsed, period, limit):
+    # Sliding-window counter: the previous fixed window counts in proportion
+    # to how much of it the sliding window still covers. `current` excludes
+    # the request being decided. Returns (allowed, retry_after seconds).
+    weight = 1 - elapsed / period
+    if previous * weight + current + 1 <= limit:
+        return True, 0
+    if current + 1 > limit:
+        # Wait for this window to become the previous one and decay enough
+        wait = period - elapsed + period * max(0.0, 1 - (limit - 1) / current)
+    else:
+        wait = period * (1 - (limit - current - 1) / previous) - elapsed
+    return False, max(1, math.ceil(wait))
+
+
+class MemoryRateBackend:
+    # Per-process counters; each gunicorn worker enforces the limit on its own
+    # share of the traffic. The least recently used keys are dropped first.
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period, now=None):
+        now = time.time() if now is None else now
+        index = int(now // period)
+        with self._lock:
+            window, current, previous = self._windows.get(key, (index, 0, 0))
+            if window == index - 1:
+                current, previous = 0, current
+            elif window != index:
+                current, previous = 0, 0
+            allowed, retry_after = sliding_window(current, previous, now - index * period, period, limit)
+            self._windows[key] = (index, current + allowed, previous)
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+        return allowed, retry_after
+
+
+class RedisRateBackend:
+    # Counters shared by every worker. Accepts any client exposing pipeline()
+    # with incr/expire/get plus decr (redis-py, fakeredis, ...).
+
+    def __init__(self, client, prefix='tj:rate:'):
+        self.client = client
+        self.prefix = prefix
+
+    def hit(self, key, limit, period, now=None):
+        now = time.time() if now is None else now
+        index = int(now // period)
+        current_key = f'{self.prefix}{key}:{period}:{index}'
+        pipe = self.client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, period * 2)
+        pipe.get(f'{self.prefix}{key}:{period}:{index - 1}')
+        current, _, previous = pipe.execute()
+        allowed, retry_after = sliding_window(current - 1, int(previous or 0), now - index * period, period, limit)
+        if not allowed:
+            # Rejected requests don't use up the allowance
+            self.client.decr(current_key)
+        return allowed, retry_after
+
+
+def client_key(address):
+    return f'ip:{address}'
+
+
+def by_ip():
+    # request.remote_addr is the real client once ProxyFix trusts the proxies
+    # in front of the app (PROXY_FIX_X_FOR, see factory.py)
+    return client_key(request.remote_addr)
+
+
+def by_user():
+    # The JWT identity on @jwt_required routes, else the client address
+    identity = get_jwt_identity()
+    return f'user:{identity}' if identity is not None else by_ip()
+
+
+def anonymous_reads():
+    # Only unauthenticated GETs; for @jwt_required(optional=True) routes
+    if request.method != 'GET' or get_jwt_identity() is not None:
+        return None
+    return by_ip()
+
+
+class RateLimiter:
+    # Policies are config keys holding '<count>/<period>'. RATELIMIT_DEFAULT
+    # applies per client address to every /api/ request; routes add their own
+    # with @rate_limiter.limit('RATELIMIT_AUTH', by_ip). An empty policy
+    # disables that limit.
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryRateBackend()
+        self.app = None
+
+    def init_app(self, app):
+        # RATELIMIT_BACKEND=redis needs the optional `redis` package
+        self.app = app
+        if app.config.get('RATELIMIT_BACKEND') == 'redis':
+            import redis
+            self.backend = RedisRateBackend(redis.Redis.from_url(app.config['RATELIMIT_REDIS_URL']))
+        else:
+            self.backend = MemoryRateBackend()
+        app.before_request(self._default_limit)
+        app.extensions['rate_limiter'] = self
+
+    def check(self, policy, key):
+        rate = self.app.config.get(policy)
+        if not rate or key is None or not self.app.config.get('RATELIMIT_ENABLED', True):
+            return
+        limit, period = parse_rate(rate)
+        allowed, retry_after = self.backend.hit(f'{policy}:{key}', limit, period)
+        if not allowed:
+            raise RateLimited(retry_after)
+
+    def _default_limit(self):
+        if request.path.startswith('/api/'):
+            self.check('RATELIMIT_DEFAULT', by_ip())
+
+    def limit(self, policy, key_func):
+        # Place below @jwt_required so key functions can see the identity
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                self.check(policy, key_func())
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+class AdmissionControl:
+    # Bounds the /api/ and /media/ requests a process works on at once, which
+    # matters for threaded and ASGI workers. Past ADMISSION_MAX_INFLIGHT a
+    # request waits up to ADMISSION_QUEUE_TIMEOUT seconds for a slot, with at
+    # most ADMISSION_MAX_QUEUE waiting; otherwise it is shed with a 503. One
+    # client address may hold ADMISSION_PER_CLIENT slots (429 beyond that).
+
+    def __init__(self):
+        self.max_inflight = 0
+        self.max_queue = 0
+        self.queue_timeout = 0.0
+        self.clients = ConcurrencyLimiter()
+        self._inflight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def init_app(self, app):
+        self.max_inflight = app.config.get('ADMISSION_MAX_INFLIGHT', 0)
+        self.max_queue = app.config.get('ADMISSION_MAX_QUEUE', 0)
+        self.queue_timeout = app.config.get('ADMISSION_QUEUE_TIMEOUT', 0.0)
+        self.clients.limit = app.config.get('ADMISSION_PER_CLIENT', 0)
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+        app.extensions['admission_control'] = self
+
+    @contextmanager
+    def slot(self, wait=True):
+        # wait=False sheds at once rather than queueing (for callers that
+        # must not block, like the ASGI event loop)
+        with self._cond:
+            if self._inflight >= self.max_inflight:
+                if not wait or self._waiting >= self.max_queue:
+                    raise Overloaded()
+                self._waiting += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self._inflight < self.max_inflight, self.queue_timeout)
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    raise Overloaded()
+            self._inflight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                self._cond.notify()
+
+    @contextmanager
+    def admit(self, address, wait=True):
+        # A per-client slot, then a process-wide one
+        with ExitStack() as stack:
+            if self.clients.limit:
+                stack.enter_context(self.clients.acquire(address))
+            if self.max_inflight:
+                stack.enter_context(self.slot(wait))
+            yield
+
+    def _admit(self):
+        if not request.path.startswith(('/api/', '/media/')):
+            return
+        with ExitStack() as stack:
+            stack.enter_context(self.admit(request.remote_addr))
+            g.admission = stack.pop_all()
+
+    def _release(self, exc):
+        admission = g.pop('admission', None)
+        if admission is not None:
+            admission.close()
+
+
+def ratelimit_config_from_env():
+    return {
+        'RATELIMIT_ENABLED': os.getenv('RATELIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes', 'on'),
+        'RATELIMIT_BACKEND': os.getenv('RATELIMIT_BACKEND', 'memory'),
+        'RATELIMIT_REDIS_URL': os.getenv('RATELIMIT_REDIS_URL', 'redis://localhost:6379/1'),
+        'RATELIMIT_DEFAULT': os.getenv('RATELIMIT_DEFAULT', '600/minute'),
+        'RATELIMIT_AUTH': os.getenv('RATELIMIT_AUTH', '10/minute'),
+        'RATELIMIT_ANONYMOUS_READ': os.getenv('RATELIMIT_ANONYMOUS_READ', '60/minute'),
+        'RATELIMIT_HEAVY': os.getenv('RATELIMIT_HEAVY', '30/minute'),
+        'ADMISSION_MAX_INFLIGHT': int(os.getenv('ADMISSION_MAX_INFLIGHT', 32)),
+        'ADMISSION_MAX_QUEUE': int(os.getenv('ADMISSION_MAX_QUEUE', 64)),
+        'ADMISSION_QUEUE_TIMEOUT': float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 1.0)),
+        'ADMISSION_PER_CLIENT': int(os.getenv('ADMISSION_PER_CLIENT', 16)),
+    }
+
+
+rate_limiter = RateLimiter()
+admission = AdmissionControl()
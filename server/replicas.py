@@ -0,0 +1,310 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+
+from database import engine_options_from_env
+
+# Read replicas (REPLICA_DATABASE_URIS). Reads in GET and HEAD requests go to
+# a healthy replica, picked once per request, that is at most
+# REPLICA_MAX_LAG_SECONDS behind. Everything else reads the primary:
+# - requests with other methods, and a GET request once it has written
+# - response cache fills (see cache.py), so an invalidated entry is never
+#   refilled from a replica that hasn't seen the write yet
+# - token and user lookups (auth.py): lag is only measured on the change
+#   log, and a new user or revoked token missing from a replica would fail
+#   or pass authentication wrongly
+# - a user's reads for REPLICA_STICKY_SECONDS after a write of theirs that
+#   changed rows, so they read their own writes. The response to such a
+#   write carries an X-Last-Write token (user and time, signed with
+#   SECRET_KEY) that the client sends back on later requests; any worker can
+#   check it without a query. Stickiness is therefore per client: another
+#   device of the same user may read a lagging replica for a few seconds.
+# - all requests when no replica is usable, and anything outside a request
+#   (CLI, jobs, scripts)
+# A thread per process checks each replica every REPLICA_CHECK_SECONDS. Lag
+# is how long the oldest change-log row the replica is missing has been on
+# the primary; that works for any kind of replication, and for SQLite copies
+# standing in for replicas. A replica whose connection drops mid-request is
+# taken out at once.
+
+READ_METHODS = ('GET', 'HEAD')
+WRITE_HEADER = 'X-Last-Write'
+
+
+class RoutingSession(Session):
+    # db.session's class (models.py); the router decides per statement
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            router = current_app.extensions.get('replica_router')
+            if router is not None and router.replicas:
+                engine = router.read_engine(self, clause)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+# Whether the current request committed a change: flushed ORM objects or
+# ran an INSERT, UPDATE or DELETE, in a transaction that was not rolled back
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    if has_request_context() and (session.new or session.dirty or session.deleted):
+        g.db_changes_pending = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _on_execute(state):
+    if has_request_context() and (state.is_insert or state.is_update or state.is_delete):
+        g.db_changes_pending = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if has_request_context() and g.pop('db_changes_pending', False):
+        g.db_changed = True
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(session):
+    if has_request_context():
+        g.pop('db_changes_pending', None)
+
+
+def request_identity():
+    # The JWT identity of the current request, if its route verified one
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+@contextmanager
+def primary_reads():
+    # Reads inside the block go to the primary
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('db_primary', False)
+    g.db_primary = True
+    try:
+        yield
+    finally:
+        g.db_primary = previous
+
+
+class Replica:
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        # Unusable until the first check passes
+        self.up = False
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+
+    def usable(self, max_lag):
+        return self.up and self.lag is not None and self.lag <= max_lag
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = []
+        self.primary = None
+        self.max_lag = 5.0
+        self.check_seconds = 2.0
+        self.sticky_seconds = 7.0
+        self.routed = {}
+        self.logger = None
+        self._lock = threading.Lock()
+        self._checker_pid = None
+
+    def init_app(self, app):
+        # Call after db.init_app; the replica binds come from replica_binds()
+        with app.app_context():
+            engines = app.extensions['sqlalchemy'].engines
+        self.primary = engines[None]
+        self.replicas = [Replica(name, engines[name]) for name in replica_binds(app.config['REPLICA_DATABASE_URIS'])]
+        self.max_lag = app.config['REPLICA_MAX_LAG_SECONDS']
+        self.check_seconds = app.config['REPLICA_CHECK_SECONDS']
+        # A write may reach a usable replica up to max_lag (plus one check) later
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS'] or self.max_lag + self.check_seconds
+        self.routed = {'primary': 0, **{replica.name: 0 for replica in self.replicas}}
+        self.logger = app.logger
+        self._checker_pid = None
+        for replica in self.replicas:
+            event.listen(replica.engine, 'handle_error', self._on_error(replica))
+        if self.replicas:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+        instrumentation = app.extensions.get('instrumentation')
+        if instrumentation is not None:
+            instrumentation.add_collector('db', self.metrics)
+        app.extensions['replica_router'] = self
+
+    def _before_request(self):
+        # An app context can outlive a request (scripts, tests); start clean
+        for name in ('db_replica', 'db_primary', 'db_written', 'db_changes_pending', 'db_changed'):
+            g.pop(name, None)
+
+    def _after_request(self, response):
+        # Only writes that changed rows make the user's next reads sticky
+        if g.get('db_changed') and response.status_code < 400:
+            identity = request_identity()
+            if identity is not None:
+                response.headers[WRITE_HEADER] = self.write_token(identity)
+        return response
+
+    @staticmethod
+    def _signer():
+        return Signer(current_app.config['SECRET_KEY'], salt='replica-last-write')
+
+    def write_token(self, user_id, written_at=None):
+        # Sends the user's reads to the primary for sticky_seconds from written_at
+        written_at = time.time() if written_at is None else written_at
+        return self._signer().sign(f'{user_id}:{written_at:.3f}').decode()
+
+    def read_engine(self, session, clause):
+        # The replica engine for this statement, or None for the primary
+        if request.method not in READ_METHODS or g.get('db_primary') or g.get('db_written'):
+            return None
+        if session._flushing or isinstance(clause, UpdateBase) or getattr(clause, '_for_update_arg', None) is not None:
+            # Later reads in this request must see the write
+            g.db_written = True
+            return None
+        if 'db_replica' not in g:
+            g.db_replica = self._choose()
+        return g.db_replica
+
+    def _choose(self):
+        self._ensure_checker()
+        usable = [replica for replica in self.replicas if replica.usable(self.max_lag)]
+        replica = random.choice(usable) if usable and not self._sticky() else None
+        with self._lock:
+            self.routed[replica.name if replica else 'primary'] += 1
+        return replica.engine if replica else None
+
+    def _sticky(self):
+        # Whether the request carries a write token of its own user from the
+        # last sticky_seconds
+        token = request.headers.get(WRITE_HEADER)
+        identity = request_identity()
+        if not token or identity is None:
+            return False
+        try:
+            user_id, _, written_at = self._signer().unsign(token).decode().rpartition(':')
+            return user_id == str(identity) and time.time() - float(written_at) < self.sticky_seconds
+        except (BadSignature, ValueError):
+            return False
+
+    def _ensure_checker(self):
+        # One checker thread per process, started on first use (after any fork)
+        if self._checker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._checker_pid != os.getpid():
+                self._checker_pid = os.getpid()
+                threading.Thread(target=self._run_checks, name='replica-health', daemon=True).start()
+
+    def _run_checks(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                self.logger.exception('Replica health check failed')
+            time.sleep(self.check_seconds)
+
+    def check(self):
+        # Refreshes every replica's health and lag
+        from models import Change
+
+        for replica in self.replicas:
+            try:
+                # Replica first: the primary can only be further ahead
+                with replica.engine.connect() as connection:
+                    replica_head = connection.scalar(select(func.max(Change.id))) or 0
+                with self.primary.connect() as connection:
+                    oldest_missing = connection.scalar(
+                        select(Change.changed_at).where(Change.id > replica_head).order_by(Change.id).limit(1)
+                    )
+            except SQLAlchemyError as e:
+                self._mark(replica, False, None, e)
+                continue
+            lag = 0.0 if oldest_missing is None else max(0.0, (datetime.utcnow() - oldest_missing).total_seconds())
+            self._mark(replica, True, lag, None)
+
+    def _mark(self, replica, up, lag, error):
+        was_usable = replica.usable(self.max_lag)
+        replica.up, replica.lag, replica.error, replica.checked_at = up, lag, error, time.time()
+        if was_usable and not replica.usable(self.max_lag) and self.logger is not None:
+            reason = f'lag {lag:.1f}s' if up else f'{type(error).__name__}: {error}'
+            self.logger.warning('Replica %s taken out of rotation (%s)', replica.name, reason)
+
+    def _on_error(self, replica):
+        def handle_error(context):
+            if context.is_disconnect:
+                self._mark(replica, False, None, context.original_exception)
+        return handle_error
+
+    def metrics(self):
+        # Prometheus lines: pool usage for every bind, then replica routing and health
+        lines = ['# HELP db_pool_connections Pooled connections per bind, by state.',
+                 '# TYPE db_pool_connections gauge']
+        binds = [('primary', self.primary)] + [(replica.name, replica.engine) for replica in self.replicas]
+        for name, engine in binds:
+            pool = engine.pool
+            if not hasattr(pool, 'checkedout'):
+                continue
+            # QueuePool.overflow() counts up from -pool_size
+            for state, count in (('checked_out', pool.checkedout()), ('idle', pool.checkedin()),
+                                 ('overflow', max(0, pool.overflow()))):
+                lines.append(f'db_pool_connections{{bind="{name}",state="{state}"}} {count}')
+        lines += ['# HELP db_pool_size Configured pool size per bind.', '# TYPE db_pool_size gauge']
+        lines += [f'db_pool_size{{bind="{name}"}} {engine.pool.size()}'
+                  for name, engine in binds if hasattr(engine.pool, 'size')]
+        if not self.replicas:
+            return lines
+        lines += ['# HELP db_read_requests_total GET requests by the bind they read from.',
+                  '# TYPE db_read_requests_total counter']
+        with self._lock:
+            lines += [f'db_read_requests_total{{bind="{name}"}} {count}' for name, count in self.routed.items()]
+        lines += ['# HELP db_replica_up Whether the replica passed its last check and is within the lag tolerance.',
+                  '# TYPE db_replica_up gauge']
+        lines += [f'db_replica_up{{bind="{replica.name}"}} {int(replica.usable(self.max_lag))}'
+                  for replica in self.replicas]
+        lines += ['# HELP db_replica_lag_seconds Replica lag behind the primary change log at the last check.',
+                  '# TYPE db_replica_lag_seconds gauge']
+        lines += [f'db_replica_lag_seconds{{bind="{replica.name}"}} {replica.lag}'
+                  for replica in self.replicas if replica.lag is not None]
+        return lines
+
+
+def replica_binds(uris):
+    # SQLALCHEMY_BINDS entries for a comma-separated list of replica URIs
+    return {
+        f'replica{number}': {'url': uri, **engine_options_from_env(uri)}
+        for number, uri in enumerate((uri.strip() for uri in uris.split(',') if uri.strip()), 1)
+    }
+
+
+def replica_config_from_env():
+    return {
+        'REPLICA_DATABASE_URIS': os.getenv('REPLICA_DATABASE_URIS', ''),
+        'REPLICA_MAX_LAG_SECONDS': float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5)),
+        'REPLICA_CHECK_SECONDS': float(os.getenv('REPLICA_CHECK_SECONDS', 2)),
+        # How long a client reads from the primary after a write; 0 means max lag + one check
+        'REPLICA_STICKY_SECONDS': float(os.getenv('REPLICA_STICKY_SECONDS', 0)),
+    }
+
+
+replica_router = ReplicaRouter()
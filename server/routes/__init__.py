@@ -0,0 +1,10 @@
+# One blueprint per resource. Route paths are spelled out in full (no
+# url_prefix), so a path found in the client or the README greps straight to
+# its view.
+
+
+def register_blueprints(app):
+    from routes import users, entries, photos, tags, sync
+
+    for module in (users, entries, photos, tags, sync):
+        app.register_blueprint(module.bp)
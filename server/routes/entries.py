@@ -0,0 +1,261 @@
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from models import db, Entry
+from pagination import parse_limit
+from queries import EMBEDDABLE, eager_options, entry_list_statement, embed_statements, parse_date_range, split_page
+from export import iter_entry_records, ndjson_lines, csv_lines
+from serializers import serialize_entry, serialize_entry_rows
+from search import search_entries
+from cache import response_cache, entry_key, entry_photos_key
+from ratelimit import rate_limiter, by_user, anonymous_reads
+from photos import photo_pipeline
+from bulk import MAX_BATCH_SIZE, bulk_create_entries, bulk_create_photos, bulk_add_entry_tags
+import geo
+import stats
+import sync
+
+bp = Blueprint('entries', __name__)
+
+
+# Retrieve entries, newest first, one keyset page at a time
+@bp.route('/api/entries', methods=['GET', 'POST'])
+@jwt_required(optional=True)
+@rate_limiter.limit('RATELIMIT_ANONYMOUS_READ', anonymous_reads)
+def entry_list():
+    if request.method == 'GET':
+        try:
+            stmt, limit, include = entry_list_statement(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        rows, next_cursor = split_page(db.session.execute(stmt).all(), limit)
+        # Optional embedding of photos/tags, batch-loaded with one IN query each
+        embedded = {name: db.session.execute(embed_stmt).all()
+                    for name, embed_stmt in embed_statements([row.id for row in rows], include).items()}
+        entries_list = serialize_entry_rows(rows, embedded)
+        return jsonify({"entries": entries_list, "next_cursor": next_cursor}), 200
+
+    if request.method == 'POST':
+        data = request.get_json()
+
+        # Use only the date format
+        try:
+            entry_date = datetime.strptime(data.get('date'), '%Y-%m-%d')
+        except ValueError:
+            return jsonify({"error": "Invalid date format. Use 'YYYY-MM-DD'."}), 400
+
+        try:
+            coordinates = geo.coordinate_columns(data, data.get('location'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        new_entry = Entry(
+            location=data.get('location'),
+            date=entry_date,
+            description=data.get('description'),
+            user_id=get_jwt_identity(),
+            **coordinates
+        )
+        db.session.add(new_entry)
+        db.session.flush()
+        stats.entry_added(new_entry.user_id, new_entry.date, new_entry.location)
+        sync.entries_saved([new_entry.id], new_entry.user_id)
+        db.session.commit()
+        return jsonify({"id": new_entry.id}), 201
+
+# Batch writes for offline sync: one transaction per request, per-item results
+def run_batch(key, handler, *args, cache_keys=None):
+    data = request.get_json(silent=True)
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return jsonify({"error": f"Expected a JSON object with a '{key}' array"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} items per batch"}), 413
+
+    try:
+        results = handler(items, *args)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Batch of %s %s failed', len(items), key)
+        return jsonify({"error": "Batch failed"}), 500
+
+    if cache_keys:
+        entry_ids = {result['entry_id'] for result in results if 'entry_id' in result}
+        response_cache.invalidate(*(cache_key(entry_id) for entry_id in entry_ids for cache_key in cache_keys))
+    return jsonify({"results": results}), 200
+
+@bp.route('/api/entries/batch', methods=['POST'])
+@jwt_required()
+@rate_limiter.limit('RATELIMIT_HEAVY', by_user)
+def batch_create_entries():
+    return run_batch('entries', bulk_create_entries, get_jwt_identity())
+
+@bp.route('/api/entries/photos/batch', methods=['POST'])
+@jwt_required()
+@rate_limiter.limit('RATELIMIT_HEAVY', by_user)
+def batch_create_photos():
+    return run_batch('photos', bulk_create_photos, cache_keys=(entry_key, entry_photos_key))
+
+@bp.route('/api/entries/tags/batch', methods=['POST'])
+@jwt_required()
+@rate_limiter.limit('RATELIMIT_HEAVY', by_user)
+def batch_add_entry_tags():
+    return run_batch('tags', bulk_add_entry_tags, cache_keys=(entry_key,))
+
+# Ranked full-text search over entry location and description
+@bp.route('/api/entries/search', methods=['GET'])
+@jwt_required(optional=True)
+@rate_limiter.limit('RATELIMIT_ANONYMOUS_READ', anonymous_reads)
+def entry_search():
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+
+    limit = parse_limit(request.args.get('limit'))
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    entries = search_entries(q, limit + 1, offset, user_id=request.args.get('user_id', type=int))
+
+    next_offset = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_offset = offset + limit
+
+    return jsonify({"entries": [serialize_entry(entry) for entry in entries], "next_offset": next_offset}), 200
+
+# Entries inside a map viewport (min_lat, min_lng, max_lat, max_lng)
+@bp.route('/api/entries/bbox', methods=['GET'])
+@jwt_required(optional=True)
+@rate_limiter.limit('RATELIMIT_ANONYMOUS_READ', anonymous_reads)
+def entries_in_bbox():
+    try:
+        stmt, limit = geo.bbox_statement(request.args, current_app.config['GEO_POSTGIS'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows = sorted(db.session.execute(stmt).all(), key=lambda row: row.id)
+    return jsonify({"entries": serialize_entry_rows(rows[:limit]), "truncated": len(rows) > limit}), 200
+
+# Entries within radius_km of (lat, lng), nearest first
+@bp.route('/api/entries/nearby', methods=['GET'])
+@jwt_required(optional=True)
+@rate_limiter.limit('RATELIMIT_ANONYMOUS_READ', anonymous_reads)
+def entries_nearby():
+    try:
+        point, radius_km, limit, user_id = geo.nearby_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ranked, truncated = geo.find_nearby(point, radius_km, limit, user_id, current_app.config['GEO_POSTGIS'])
+    entries = serialize_entry_rows([row for row, _ in ranked])
+    for entry, (_, distance) in zip(entries, ranked):
+        entry["distance_km"] = round(distance, 3)
+    return jsonify({"entries": entries, "truncated": truncated}), 200
+
+# Entry counts per day, week, month or year, with the first few entry ids of each
+@bp.route('/api/entries/timeline', methods=['GET'])
+@jwt_required(optional=True)
+@rate_limiter.limit('RATELIMIT_ANONYMOUS_READ', anonymous_reads)
+def entry_timeline():
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in stats.TIMELINE_GRANULARITIES:
+        return jsonify({"error": "Unsupported granularity. Use 'day', 'week', 'month' or 'year'."}), 400
+
+    user_id = request.args.get('user_id', type=int) or get_jwt_identity()
+    if user_id is None:
+        return jsonify({"error": "Query parameter 'user_id' is required"}), 400
+
+    try:
+        date_from, date_until = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ids = min(max(request.args.get('ids', 3, type=int), 0), current_app.config['TIMELINE_MAX_IDS'])
+    buckets = stats.get_timeline(user_id, granularity, date_from, date_until, ids_per_bucket=ids,
+                                 use_rollup=current_app.config['TIMELINE_ROLLUP'])
+    return jsonify({"granularity": granularity, "user_id": int(user_id), "buckets": buckets}), 200
+
+# Stream every entry (with photos and tags) as NDJSON or CSV
+@bp.route('/api/entries/export', methods=['GET'])
+@jwt_required()
+@rate_limiter.limit('RATELIMIT_HEAVY', by_user)
+def export_entries():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "Unsupported format. Use 'ndjson' or 'csv'."}), 400
+
+    records = iter_entry_records(user_id=request.args.get('user_id', type=int))
+    if export_format == 'csv':
+        body, mimetype = csv_lines(records), 'text/csv'
+    else:
+        body, mimetype = ndjson_lines(records), 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=entries.{export_format}"}
+    )
+
+# Retrieve a specific entry
+@bp.route('/api/entries/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@jwt_required(optional=True)
+@response_cache.cached(entry_key)
+def entry_resource(id):
+    if request.method == 'GET':
+        # The detail view embeds photos and tags, loaded alongside the entry
+        entry = db.session.get(Entry, id, options=eager_options(EMBEDDABLE))
+        if entry is None:
+            return jsonify({"error": "Entry not found"}), 404
+
+        return jsonify(serialize_entry(entry, EMBEDDABLE)), 200
+
+    entry = db.session.get(Entry, id)
+
+    if request.method == 'PUT':
+        if entry is None:
+            return jsonify({"error": "Entry not found"}), 404
+
+        data = request.get_json()
+        old_date, old_location = entry.date, entry.location
+        entry.location = data.get('location', entry.location)
+
+        # Update date with parsing
+        date_str = data.get('date', entry.date.strftime('%Y-%m-%d %H:%M:%S'))
+        try:
+            entry.date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            entry.date = datetime.strptime(date_str, '%Y-%m-%d')
+
+        entry.description = data.get('description', entry.description)
+
+        # Re-resolve coordinates when they are sent or the location changed
+        if 'latitude' in data or 'longitude' in data or entry.location != old_location:
+            try:
+                for column, value in geo.coordinate_columns(data, entry.location).items():
+                    setattr(entry, column, value)
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({"error": str(e)}), 400
+
+        stats.entry_changed(entry.user_id, old_date, old_location, entry.date, entry.location)
+        sync.entries_saved([id], entry.user_id)
+        db.session.commit()
+        response_cache.invalidate(entry_key(id))
+        return jsonify({"message": "Entry updated successfully"}), 200
+
+    if request.method == 'DELETE':
+        if entry is None:
+            return jsonify({"error": "Entry not found"}), 404
+
+        stats.entry_removed(entry)
+        sync.entry_removed(entry)
+        stored = {(photo.content_hash, photo.storage_key) for photo in entry.photos if photo.content_hash}
+        db.session.delete(entry)
+        for content_hash, storage_key in stored:
+            photo_pipeline.schedule_release(content_hash, storage_key)
+        db.session.commit()
+        response_cache.invalidate(entry_key(id), entry_photos_key(id))
+        return jsonify({"message": "Entry deleted successfully"}), 200
@@ -0,0 +1,136 @@
+import mimetypes
+import os
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request, redirect
+from flask_jwt_extended import jwt_required
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+
+from models import db, Entry, Photo
+from serializers import serialize_photo
+from cache import response_cache, entry_key, entry_photos_key
+from photos import photo_pipeline, thumbnail_key, InvalidUpload, THUMBNAIL_SIZES
+from downloads import send_stored_file
+import stats
+import sync
+
+bp = Blueprint('photos', __name__)
+
+
+# Deleting a photo
+@bp.route('/api/entries/<int:entry_id>/photos/<int:photo_id>', methods=['DELETE'])
+@jwt_required()
+def delete_photo(entry_id, photo_id):
+    photo = Photo.query.filter_by(id=photo_id, entry_id=entry_id).first()
+    if photo is None:
+        return jsonify({"error": "Photo not found"}), 404
+
+    db.session.delete(photo)
+    photo_pipeline.schedule_release(photo.content_hash, photo.storage_key)
+    stats.photos_changed(entry_id, -1)
+    sync.photos_removed([(photo_id, entry_id)])
+    db.session.commit()
+    response_cache.invalidate(entry_key(entry_id), entry_photos_key(entry_id))
+    return jsonify({"message": "Photo deleted successfully"}), 200
+
+# Downloading a stored photo (?size=thumbnail|preview for the rendered variants)
+@bp.route('/api/entries/<int:entry_id>/photos/<int:photo_id>/file', methods=['GET'])
+@jwt_required()
+def download_photo(entry_id, photo_id):
+    photo = Photo.query.filter_by(id=photo_id, entry_id=entry_id).first()
+    if photo is None:
+        return jsonify({"error": "Photo not found"}), 404
+    if photo.storage_key is None:
+        # Added by URL; nothing stored here
+        return redirect(photo.url)
+
+    variant = request.args.get('size')
+    if variant is None:
+        key, content_type, etag, size = photo.storage_key, photo.content_type, photo.content_hash, photo.size
+    elif variant in ('thumbnail', 'preview') and getattr(photo, f'{variant}_url') is not None:
+        pixels = dict(THUMBNAIL_SIZES)[f'{variant}_url']
+        key, content_type, etag, size = thumbnail_key(photo.content_hash, pixels), 'image/jpeg', f'{photo.content_hash}-{pixels}', None
+    else:
+        return jsonify({"error": "Unknown or not yet rendered size."}), 404
+
+    response = send_stored_file(photo_pipeline.storage, key, content_type, etag, photo.uploaded_at, size)
+    if response is None:
+        return jsonify({"error": "File not found"}), 404
+    return response
+
+# Retrieve all photos for an entry
+@bp.route('/api/entries/<int:id>/photos', methods=['GET', 'POST'])
+@jwt_required()
+@response_cache.cached(entry_photos_key)
+def entry_photos(id):
+    entry = db.session.get(Entry, id)
+
+    if request.method == 'GET':
+        if entry is None:
+            return jsonify({"error": "Entry not found"}), 404
+
+        photos = Photo.query.filter_by(entry_id=id).all()
+        photos_list = [serialize_photo(photo) for photo in photos]
+        return jsonify(photos_list), 200
+
+    if request.method == 'POST' and request.mimetype == 'multipart/form-data':
+        if entry is None:
+            return jsonify({"error": "Entry not found"}), 404
+
+        try:
+            upload = photo_pipeline.receive(request)
+        except InvalidUpload as e:
+            return jsonify({"error": str(e)}), 400
+        except RequestEntityTooLarge:
+            return jsonify({"error": "Photo is too large."}), 413
+
+        new_photo = Photo(entry_id=id, uploaded_at=datetime.utcnow(), **upload,
+                          **photo_pipeline.reuse_thumbnails(upload["content_hash"]))
+        db.session.add(new_photo)
+        db.session.flush()
+        stats.photos_changed(id, 1, entry.user_id)
+        sync.photos_saved([(new_photo.id, id)], entry.user_id)
+        if new_photo.thumbnail_url is None:
+            photo_pipeline.schedule_thumbnails(new_photo.content_hash, new_photo.storage_key)
+        db.session.commit()
+        response_cache.invalidate(entry_key(id), entry_photos_key(id))
+        return jsonify(serialize_photo(new_photo)), 201
+
+    if request.method == 'POST':
+        data = request.get_json()
+
+        if 'url' not in data or not data['url']:
+            return jsonify({"error": "Photo URL is required."}), 400
+
+        new_photo = Photo(
+            url=data['url'],
+            entry_id=id,
+            uploaded_at=datetime.utcnow()
+        )
+
+        db.session.add(new_photo)
+        if entry is not None:
+            stats.photos_changed(id, 1, entry.user_id)
+
+        try:
+            db.session.flush()
+            sync.photos_saved([(new_photo.id, id)], entry.user_id if entry is not None else None)
+            db.session.commit()
+            response_cache.invalidate(entry_key(id), entry_photos_key(id))
+            return jsonify({"id": new_photo.id, "url": new_photo.url}), 201
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": f"Failed to upload photo: {str(e)}"}), 500
+
+# Uploaded photos and thumbnails. Keys are content hashes, so responses never go stale.
+@bp.route('/media/<path:key>', methods=['GET'])
+def media_file(key):
+    if safe_join('media', key) is None:
+        return jsonify({"error": "File not found"}), 404
+    response = send_stored_file(photo_pipeline.storage, key, mimetypes.guess_type(key)[0],
+                                etag=os.path.splitext(os.path.basename(key))[0],
+                                cache_control='public, max-age=31536000, immutable')
+    if response is None:
+        return jsonify({"error": "File not found"}), 404
+    return response
@@ -0,0 +1,27 @@
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from pagination import parse_limit
+import sync
+
+bp = Blueprint('sync', __name__)
+
+
+# Delta sync: what changed in the caller's journal since a token from an earlier call
+@bp.route('/api/sync', methods=['GET'])
+@jwt_required()
+def sync_changes():
+    since = request.args.get('since')
+    if since:
+        try:
+            since, issued_at = sync.decode_token(since)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if sync.token_expired(issued_at, current_app.config['SYNC_TOMBSTONE_DAYS']):
+            return jsonify({"error": "Sync token expired. Sync again without 'since'."}), 410
+    else:
+        since = 0
+
+    config = current_app.config
+    limit = parse_limit(request.args.get('limit'), config['SYNC_PAGE_SIZE'], config['SYNC_MAX_PAGE_SIZE'])
+    return jsonify(sync.changes_since(get_jwt_identity(), since, limit)), 200
@@ -0,0 +1,101 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Entry, Tag, EntryTag
+from pagination import parse_limit
+from serializers import serialize_tag
+from db_utils import insert_ignore
+from cache import response_cache, entry_key, TAGS_KEY
+from tags import tag_index, normalize_tag_name, find_tag, SUGGEST_MAX_LIMIT
+import stats
+import sync
+
+bp = Blueprint('tags', __name__)
+
+
+# Tags management
+@bp.route('/api/tags', methods=['GET'])
+@jwt_required()
+@response_cache.cached(lambda: TAGS_KEY)
+def get_tags():
+    tags = Tag.query.all()
+    return jsonify([serialize_tag(tag, with_created_at=True) for tag in tags])
+
+# Tag autocomplete: tags starting with `prefix`, in any case, most used first
+@bp.route('/api/tags/suggest', methods=['GET'])
+@jwt_required()
+def suggest_tags():
+    limit = parse_limit(request.args.get('limit'), 10, SUGGEST_MAX_LIMIT)
+    return jsonify(tag_index.suggest(request.args.get('prefix', ''), limit)), 200
+
+@bp.route('/api/tags', methods=['POST'])
+@jwt_required()
+def create_tag():
+    data = request.json
+    name = normalize_tag_name(data.get('name') or '')
+    if not name:
+        return jsonify({"error": "Tag name is required."}), 400
+    # 'Travel', 'travel ' and 'TRAVEL' are one tag
+    existing_tag = find_tag(name)
+    if existing_tag:
+        return jsonify({"id": existing_tag.id, "name": existing_tag.name})
+    new_tag = Tag(name=name)
+    db.session.add(new_tag)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # A concurrent request created it (or a name with the same key) first
+        db.session.rollback()
+        existing_tag = find_tag(name)
+        if existing_tag is None:
+            raise
+        return jsonify({"id": existing_tag.id, "name": existing_tag.name})
+    sync.tag_saved(new_tag.id)
+    db.session.commit()
+    response_cache.invalidate(TAGS_KEY)
+    tag_index.added(new_tag.id, new_tag.name)
+    return jsonify({"id": new_tag.id, "name": new_tag.name}), 201
+
+@bp.route('/api/entries/<int:entry_id>/tags', methods=['POST'])
+@jwt_required()
+def add_tag_to_entry(entry_id):
+    entry = Entry.query.get_or_404(entry_id)
+    data = request.json
+    tag = Tag.query.get_or_404(data['tag_id'])
+    # Primary-key upsert instead of loading the entry's tag collection
+    if insert_ignore(db.session, EntryTag, [{"entry_id": entry_id, "tag_id": tag.id}]):
+        stats.tag_link_changed(entry_id, tag.id, 1, entry.user_id)
+        sync.tag_links_saved([(entry_id, tag.id)], entry.user_id)
+        db.session.commit()
+        response_cache.invalidate(entry_key(entry_id))
+    return jsonify({"message": "Tag added successfully"}), 200
+
+@bp.route('/api/entries/<int:entry_id>/tags/<int:tag_id>', methods=['DELETE'])
+@jwt_required()
+def remove_tag_from_entry(entry_id, tag_id):
+    deleted = EntryTag.query.filter_by(entry_id=entry_id, tag_id=tag_id).delete()
+    if deleted:
+        stats.tag_link_changed(entry_id, tag_id, -1)
+        sync.tag_links_removed([(entry_id, tag_id)])
+        db.session.commit()
+        response_cache.invalidate(entry_key(entry_id))
+        return '', 204
+
+    # Nothing was linked; only now check whether either side is missing
+    Entry.query.get_or_404(entry_id)
+    Tag.query.get_or_404(tag_id)
+    return '', 204
+
+@bp.route('/api/tags/<int:tag_id>', methods=['DELETE'])
+@jwt_required()
+def delete_tag(tag_id):
+    tag = Tag.query.get_or_404(tag_id)
+    # Entries embedding this tag in their cached detail view
+    tagged_entry_ids = sync.tag_removed(tag_id)
+    stats.tag_removed(tag_id)
+    db.session.delete(tag)
+    db.session.commit()
+    response_cache.invalidate(TAGS_KEY, *(entry_key(entry_id) for entry_id in tagged_entry_ids))
+    tag_index.removed(tag_id)
+    return '', 204
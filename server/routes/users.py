@@ -0,0 +1,133 @@
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import (create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt,
+                                current_user, decode_token)
+from sqlalchemy import update
+
+from models import db, User
+from passwords import password_hasher, auth_limiter
+from ratelimit import rate_limiter, by_ip
+from auth import identity_cache, token_blocklist
+import stats
+
+bp = Blueprint('users', __name__)
+
+
+# User registration
+@bp.route('/api/users/register', methods=['POST'])
+@rate_limiter.limit('RATELIMIT_AUTH', by_ip)
+def user_register():
+    data = request.get_json()
+    current_app.logger.debug("Registration request for %s", data.get('username') if data else None)
+
+    if not data or not all(key in data for key in ('username', 'email', 'password_hash')):
+        current_app.logger.debug("Registration rejected: missing required fields")
+        return jsonify({"error": "Missing required fields"}), 400
+
+    with auth_limiter.acquire(request.remote_addr):
+        password_hash = password_hasher.hash(data['password_hash'])  # Hashing the password off-thread
+
+    new_user = User(
+        username=data['username'],
+        email=data['email'],
+        password_hash=password_hash,
+        created_at=datetime.utcnow()  # Set the joined date
+    )
+    db.session.add(new_user)
+    db.session.commit()
+    return jsonify({"message": "User registered successfully"}), 201
+
+# User login
+@bp.route('/api/users/login', methods=['POST'])
+@rate_limiter.limit('RATELIMIT_AUTH', by_ip)
+def user_login():
+    data = request.get_json()
+    if not data or not all(key in data for key in ('username', 'password')):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    with auth_limiter.acquire(request.remote_addr, f"user:{data['username']}"):
+        user = User.query.filter_by(username=data['username']).first()
+        valid = user is not None and password_hasher.verify(user.password_hash, data['password'])
+
+        # Transparently upgrade hashes made with older algorithm/cost settings
+        if valid and password_hasher.needs_rehash(user.password_hash):
+            user.password_hash = password_hasher.hash(data['password'])
+            db.session.commit()
+
+    if valid:
+        access_token = create_access_token(identity=user.id)
+        refresh_token = create_refresh_token(identity=user.id)
+        return jsonify(access_token=access_token, refresh_token=refresh_token), 200
+
+    return jsonify({"error": "Invalid credentials"}), 401
+
+# New access token for a refresh token
+@bp.route('/api/users/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def user_refresh():
+    return jsonify(access_token=create_access_token(identity=get_jwt_identity())), 200
+
+# Logout: revokes the token sent, plus a refresh token given in the body
+@bp.route('/api/users/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def user_logout():
+    revoked = [get_jwt()]
+    data = request.get_json(silent=True) or {}
+    if data.get('refresh_token'):
+        try:
+            refresh = decode_token(data['refresh_token'], allow_expired=True)
+        except Exception:
+            return jsonify({"error": "Invalid refresh token"}), 400
+        if refresh['type'] != 'refresh' or refresh['sub'] != get_jwt_identity():
+            return jsonify({"error": "Invalid refresh token"}), 400
+        revoked.append(refresh)
+
+    for jwt_data in revoked:
+        token_blocklist.revoke(jwt_data)
+    db.session.commit()
+    return jsonify({"message": "Logged out"}), 200
+
+# Password reset request (placeholder)
+@bp.route('/api/users/reset-password', methods=['POST'])
+def user_reset_password():
+    data = request.get_json()
+    return jsonify({"message": "Password reset request received"}), 200
+
+# User profile
+@bp.route('/api/users/profile', methods=['GET'])
+@jwt_required()
+def user_profile():
+    user = current_user  # From the identity cache; see auth.py
+
+    user_data = {
+        "id": user["id"],
+        "username": user["username"],
+        "email": user["email"],
+        "joined": user["created_at"].strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+    return jsonify(user_data), 200
+
+# Journal statistics for the current user, read from the summary tables
+@bp.route('/api/users/profile/stats', methods=['GET'])
+@jwt_required()
+def user_profile_stats():
+    top = max(1, min(request.args.get('top', 10, type=int), 100))
+    return jsonify(stats.get_user_stats(get_jwt_identity(), top_tags=top)), 200
+
+# Update user profile
+@bp.route('/api/users/profile', methods=['PUT'])
+@jwt_required()
+def update_user_profile():
+    current_user_id = get_jwt_identity()  # Existence already checked by the user lookup
+    data = request.get_json()
+
+    # Updating the user's username if provided
+    if 'username' in data:
+        db.session.execute(update(User).where(User.id == current_user_id).values(username=data['username']))
+
+    db.session.commit()
+    identity_cache.invalidate(current_user_id)
+
+    return jsonify({"message": "User profile updated successfully"}), 200
@@ -0,0 +1,116 @@
+import re
+
+from sqlalchemy import column, event, func, literal_column, or_, select, table
+from models import db, Entry
+
+# PostgreSQL: a stored tsvector column over location (weight A) and
+# description (weight B), served by a GIN index
+POSTGRES_DDL = [
+    """
+    ALTER TABLE entries ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(location, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_entries_search_vector ON entries USING GIN (search_vector)",
+]
+
+# SQLite: an external-content FTS5 table kept in sync with entries by triggers;
+# bm25 weights location above description to mirror the PostgreSQL weights
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts
+    USING fts5(location, description, content='entries', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS entries_fts_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts(rowid, location, description)
+        VALUES (new.id, new.location, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS entries_fts_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, location, description)
+        VALUES ('delete', old.id, old.location, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS entries_fts_au AFTER UPDATE OF location, description ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, location, description)
+        VALUES ('delete', old.id, old.location, old.description);
+        INSERT INTO entries_fts(rowid, location, description)
+        VALUES (new.id, new.location, new.description);
+    END
+    """,
+]
+
+ENTRIES_FTS = table('entries_fts', column('rowid'))
+
+# Schema the DDL above (and geo's optional PostGIS index) creates outside the
+# models. Autogenerate would otherwise propose dropping it; triggers are never
+# compared.
+UNMANAGED_TABLE_PREFIX = 'entries_fts'
+UNMANAGED_COLUMNS = {('entries', 'search_vector')}
+UNMANAGED_INDEXES = {'ix_entries_search_vector', 'ix_entries_point'}
+
+SEARCH_DDL = {'postgresql': POSTGRES_DDL, 'sqlite': SQLITE_DDL}
+
+
+@event.listens_for(Entry.__table__, 'after_create')
+def create_search_index(target, connection, **kw):
+    # Keeps db.create_all() (seed.py, local SQLite) in step with the migration
+    for statement in SEARCH_DDL.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # Alembic include_object hook, installed by migrations/env.py
+    if type_ == 'table':
+        return not name.startswith(UNMANAGED_TABLE_PREFIX)
+    if type_ == 'column':
+        return (obj.table.name, name) not in UNMANAGED_COLUMNS
+    if type_ == 'index':
+        return name not in UNMANAGED_INDEXES
+    return True
+
+
+def fts5_query(q):
+    # Quote every word so user input can't inject FTS5 syntax; the last word
+    # is prefix-matched so results show up while the user is still typing
+    words = re.findall(r'\w+', q)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_entries(q, limit, offset=0, user_id=None):
+    # Returns the matching Entry objects, best match first
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        ts_query = func.websearch_to_tsquery('english', q)
+        vector = literal_column('entries.search_vector')
+        rank = func.ts_rank_cd(vector, ts_query)
+        stmt = select(Entry).where(vector.op('@@')(ts_query)).order_by(rank.desc(), Entry.id.desc())
+    elif dialect == 'sqlite':
+        match = fts5_query(q)
+        if match is None:
+            return []
+        fts = literal_column('entries_fts')
+        stmt = (select(Entry)
+                .join(ENTRIES_FTS, ENTRIES_FTS.c.rowid == Entry.id)
+                .where(fts.op('MATCH')(match))
+                .order_by(func.bm25(fts, 4.0, 1.0), Entry.id.desc()))
+    else:
+        # No full-text index on this backend; fall back to a substring scan
+        pattern = f'%{q}%'
+        stmt = (select(Entry)
+                .where(or_(Entry.location.ilike(pattern), Entry.description.ilike(pattern)))
+                .order_by(Entry.date.desc(), Entry.id.desc()))
+
+    if user_id is not None:
+        stmt = stmt.where(Entry.user_id == user_id)
+    return db.session.scalars(stmt.limit(limit).offset(offset)).all()
@@ -1,10 +1,26 @@
 #!/usr/bin/env python3
+# Sample data, or a generated data set of any size for benchmarks:
+#
+#   python seed.py                                  # two users, resets the database
+#   python seed.py --users 100000 --workers 8       # ~10M rows, appended
+#
+# Generated users all have the password 'password'.
 
+import argparse
+import csv
+import math
+import multiprocessing
 import os
-from datetime import datetime, timezone
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, func, insert, select, text
 from werkzeug.security import generate_password_hash
 from models import db, User, Entry, Photo, Tag, EntryTag
 from app import app
+from stats import rebuild_user_stats
+from sync import rebuild_change_log
+from geo import GAZETTEER_PATH, encode_geohash
 
 def seed_database():
     with app.app_context():
@@ -85,7 +101,192 @@ def seed_database():
         db.session.add(entry_tag2)
         db.session.commit()
 
+        # Backfill the per-user stats summary tables and the sync change log
+        rebuild_user_stats()
+        rebuild_change_log()
+
         print("Database seeded successfully!")
 
+
+WORDS = ('beach museum market sunset hike old town harbour cathedral street food night train castle river '
+         'mountain lake bridge garden gallery cafe temple festival ferry island vineyard desert canyon').split()
+TAG_WORDS = ('travel nature food city beach hiking history art roadtrip family friends solo winter summer '
+             'spring autumn architecture nightlife wildlife islands mountains culture').split()
+BATCH_SIZE = 10000
+
+
+def _cities():
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as f:
+        return [(f"{row['name']}, {row['country']}", float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(f)]
+
+
+def _entry_counts(rng, users, mean):
+    # Log-normal: most users keep a short journal, a few keep very long ones
+    sigma = 1.0
+    mu = math.log(mean) - sigma ** 2 / 2
+    return [max(1, round(rng.lognormvariate(mu, sigma))) for _ in range(users)]
+
+
+def _poisson(rng, mean):
+    # Knuth's method; the means here are small
+    limit, k, p = math.exp(-mean), 0, rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k
+
+
+def generate_chunk(task):
+    # Rows for one contiguous range of users. Users and entries get explicit
+    # ids (worked out by the parent), photo ids come from the database.
+    first_user_id, entry_counts, first_entry_id, tag_ids, options, seed = task
+    rng = random.Random(seed)
+    cities = _cities()
+    # Zipf-like tag popularity: a handful of tags are on most entries
+    tag_weights = [1 / (rank + 1) for rank in range(len(tag_ids))]
+    cum_weights = [sum(tag_weights[:i + 1]) for i in range(len(tag_weights))]
+    start, span = datetime(2015, 1, 1), (datetime(2025, 1, 1) - datetime(2015, 1, 1)).days
+
+    users, entries, photos, entry_tags = [], [], [], []
+    entry_id = first_entry_id
+    for offset, count in enumerate(entry_counts):
+        user_id = first_user_id + offset
+        users.append({"id": user_id, "username": f'user{user_id}', "email": f'user{user_id}@example.com',
+                      "password_hash": options['password_hash'], "created_at": start})
+        # Entries come in trips: consecutive days in one city
+        remaining = count
+        while remaining:
+            trip_days = min(remaining, rng.randint(1, 10))
+            remaining -= trip_days
+            name, lat, lng = rng.choice(cities)
+            day = start + timedelta(days=rng.randrange(span))
+            for n in range(trip_days):
+                latitude = lat + rng.gauss(0, 0.05)
+                longitude = (lng + rng.gauss(0, 0.05) + 180) % 360 - 180
+                entries.append({
+                    "id": entry_id, "location": name, "date": day + timedelta(days=n, hours=rng.randrange(24)),
+                    "description": ' '.join(rng.choices(WORDS, k=rng.randint(4, 16))), "user_id": user_id,
+                    "created_at": day + timedelta(days=n), "latitude": latitude, "longitude": longitude,
+                    "geohash": encode_geohash(latitude, longitude),
+                })
+                for p in range(_poisson(rng, options['photos_per_entry'])):
+                    photos.append({"entry_id": entry_id, "url": f'https://example.com/photos/{entry_id}-{p}.jpg',
+                                   "uploaded_at": day + timedelta(days=n)})
+                k = min(_poisson(rng, options['tags_per_entry']), len(tag_ids))
+                for tag_id in set(rng.choices(tag_ids, cum_weights=cum_weights, k=k)):
+                    entry_tags.append({"entry_id": entry_id, "tag_id": tag_id})
+                entry_id += 1
+
+    rows = [(User, users), (Entry, entries), (Photo, photos), (EntryTag, entry_tags)]
+    if options.get('database_uri'):
+        # Parallel writers (PostgreSQL): insert here and report counts only
+        engine = create_engine(options['database_uri'])
+        with engine.begin() as connection:
+            _insert(connection, rows)
+        engine.dispose()
+        return [(model, len(chunk)) for model, chunk in rows]
+    return rows
+
+
+def _insert(connection, rows):
+    for model, chunk in rows:
+        for offset in range(0, len(chunk), BATCH_SIZE):
+            connection.execute(insert(model.__table__), chunk[offset:offset + BATCH_SIZE])
+
+
+def _tag_ids(count):
+    names = [TAG_WORDS[i % len(TAG_WORDS)] + (f'-{i // len(TAG_WORDS)}' if i >= len(TAG_WORDS) else '')
+             for i in range(count)]
+    existing = set(db.session.scalars(select(Tag.name).where(Tag.name.in_(names))))
+    new = [{"name": name, "created_at": datetime(2015, 1, 1)} for name in names if name not in existing]
+    if new:
+        db.session.execute(insert(Tag), new)
+    return [tag_id for tag_id, in db.session.execute(select(Tag.id).where(Tag.name.in_(names)).order_by(Tag.id))]
+
+
+def generate(users, entries_per_user=30, photos_per_entry=2.0, tags_per_entry=1.5, tags=200,
+             workers=None, seed=0, reset=False):
+    # Appends `users` generated users with their entries, photos and tags;
+    # returns {table: rows inserted}. Call inside an app context. Only the
+    # primary is written; read replicas follow it.
+    if reset:
+        db.drop_all(bind_key=None)
+    db.create_all(bind_key=None)
+    rng = random.Random(seed)
+    dialect = db.engine.dialect.name
+
+    tag_ids = _tag_ids(tags)
+    first_user_id = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    first_entry_id = (db.session.scalar(select(func.max(Entry.id))) or 0) + 1
+    db.session.commit()
+
+    options = {
+        "password_hash": generate_password_hash('password'),
+        "photos_per_entry": photos_per_entry,
+        "tags_per_entry": tags_per_entry,
+        # SQLite has one writer at a time: workers only generate rows there
+        "database_uri": db.engine.url.render_as_string(hide_password=False) if dialect != 'sqlite' else None,
+    }
+    counts = _entry_counts(rng, users, entries_per_user)
+    tasks, user_id, entry_id, chunk_users = [], first_user_id, first_entry_id, 1000
+    for start in range(0, users, chunk_users):
+        chunk = counts[start:start + chunk_users]
+        tasks.append((user_id, chunk, entry_id, tag_ids, options, rng.getrandbits(64)))
+        user_id += len(chunk)
+        entry_id += sum(chunk)
+
+    totals = {}
+    context = multiprocessing.get_context('fork')
+    with context.Pool(workers or os.cpu_count()) as pool:
+        # Users and entries must land before photos and tags that reference
+        # them, so chunks are written in order
+        for result in pool.imap(generate_chunk, tasks):
+            if options['database_uri'] is None:
+                with db.engine.begin() as connection:
+                    _insert(connection, result)
+                result = [(model, len(chunk)) for model, chunk in result]
+            for model, count in result:
+                totals[model.__tablename__] = totals.get(model.__tablename__, 0) + count
+
+    if dialect == 'postgresql':
+        # Explicit ids leave the sequences behind
+        with db.engine.begin() as connection:
+            for table in ('users', 'entries'):
+                connection.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                ))
+    rebuild_user_stats()
+    rebuild_change_log()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the database named by DATABASE_URI.')
+    parser.add_argument('--users', type=int, default=0, help='generate this many users (default: sample data)')
+    parser.add_argument('--entries-per-user', type=float, default=30, help='mean of a log-normal distribution')
+    parser.add_argument('--photos-per-entry', type=float, default=2.0)
+    parser.add_argument('--tags-per-entry', type=float, default=1.5)
+    parser.add_argument('--tags', type=int, default=200, help='tag vocabulary size')
+    parser.add_argument('--workers', type=int, default=None, help='generator processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed, for repeatable data sets')
+    parser.add_argument('--reset', action='store_true', help='drop all tables first')
+    args = parser.parse_args()
+
+    if not args.users:
+        seed_database()
+        return
+    started = time.perf_counter()
+    with app.app_context():
+        totals = generate(args.users, args.entries_per_user, args.photos_per_entry, args.tags_per_entry,
+                          args.tags, args.workers, args.seed, args.reset)
+    elapsed = time.perf_counter() - started
+    rows = sum(totals.values())
+    print(', '.join(f'{count} {table}' for table, count in totals.items()) +
+          f' in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)')
+
+
 if __name__ == '__main__':
-    seed_database()
+    main()
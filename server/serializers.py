@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+
+def format_datetime(value):
+    # Same text as strftime('%Y-%m-%d %H:%M:%S'), without the format parsing
+    return value.isoformat(' ', 'seconds') if value is not None else None
+
+
+def row_serializer(*fields, offset=0):
+    # Builds, once per row shape, a function turning a column tuple (a Row from
+    # select(Model.a, Model.b, ...)) into a dict. `fields` are (key, converter)
+    # pairs for the columns from `offset` on; converter may be None.
+    keys = tuple(key for key, _ in fields)
+    converters = tuple(converter for _, converter in fields)
+
+    if not any(converters):
+        def serialize(row):
+            return dict(zip(keys, row[offset:]))
+    else:
+        pairs = tuple(zip(keys, converters))
+
+        def serialize(row):
+            values = row[offset:]
+            return {key: convert(value) if convert else value
+                    for (key, convert), value in zip(pairs, values)}
+    return serialize
+
+
+# Row shapes produced by queries.ENTRY_COLUMNS and queries.embed_statements
+serialize_entry_row = row_serializer(
+    ("id", None), ("location", None), ("date", format_datetime), ("description", None), ("user_id", None),
+    ("latitude", None), ("longitude", None)
+)
+serialize_photo_row = row_serializer(
+    ("id", None), ("url", None), ("thumbnail_url", None), ("preview_url", None), offset=1
+)
+serialize_tag_row = row_serializer(("id", None), ("name", None), offset=1)
+EMBED_SERIALIZERS = {"photos": serialize_photo_row, "tags": serialize_tag_row}
+
+
+def serialize_entry_rows(rows, embedded=None):
+    # `embedded` maps 'photos'/'tags' to rows whose first column is entry_id
+    entries = [serialize_entry_row(row) for row in rows]
+    for name, embed_rows in (embedded or {}).items():
+        serialize = EMBED_SERIALIZERS[name]
+        grouped = defaultdict(list)
+        for row in embed_rows:
+            grouped[row[0]].append(serialize(row))
+        for entry in entries:
+            entry[name] = grouped.get(entry["id"], [])
+    return entries
+
+
+def serialize_photo(photo):
+    return {"id": photo.id, "url": photo.url, "thumbnail_url": photo.thumbnail_url, "preview_url": photo.preview_url}
+
+
+def serialize_tag(tag, with_created_at=False):
+    tag_data = {"id": tag.id, "name": tag.name}
+    if with_created_at:
+        tag_data["created_at"] = tag.created_at.isoformat()
+    return tag_data
+
+
+def serialize_entry(entry, include=()):
+    # `include` may name 'photos' and/or 'tags'; callers are expected to have
+    # eager-loaded those relationships so this never triggers a lazy load
+    entry_data = {
+        "id": entry.id,
+        "location": entry.location,
+        "date": format_datetime(entry.date),
+        "description": entry.description,
+        "user_id": entry.user_id,
+        "latitude": entry.latitude,
+        "longitude": entry.longitude
+    }
+    if 'photos' in include:
+        entry_data["photos"] = [serialize_photo(photo) for photo in entry.photos]
+    if 'tags' in include:
+        entry_data["tags"] = [serialize_tag(tag) for tag in entry.tags]
+    return entry_data
@@ -0,0 +1,325 @@
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import Date, bindparam, cast, delete, func, insert, literal, select, union_all, update
+from models import (db, Entry, Photo, Tag, EntryTag, UserStats, UserMonthStats, UserDayStats, UserLocationStats,
+                    UserTagStats)
+from db_utils import upsert_increment, upsert_increment_many
+
+# Incremental maintenance of the per-user summary tables. Every hook runs inside
+# the caller's transaction, before its commit, so stats and data move together.
+
+
+def _month(date):
+    return date.strftime('%Y-%m')
+
+
+def _bump_totals(user_id, entries=0, photos=0, locations=0):
+    upsert_increment(db.session, UserStats, {"user_id": user_id},
+                     {"entry_count": entries, "photo_count": photos, "location_count": locations})
+
+
+def _bump_month(user_id, month, delta):
+    count, = upsert_increment(db.session, UserMonthStats, {"user_id": user_id, "month": month}, {"entry_count": delta})
+    if count <= 0:
+        db.session.execute(delete(UserMonthStats).filter_by(user_id=user_id, month=month))
+
+
+def _bump_day(user_id, day, delta):
+    count, = upsert_increment(db.session, UserDayStats, {"user_id": user_id, "day": day}, {"entry_count": delta})
+    if count <= 0:
+        db.session.execute(delete(UserDayStats).filter_by(user_id=user_id, day=day))
+
+
+def _bump_location(user_id, location, delta):
+    # Returns the change in the user's distinct-location count (-1, 0 or +1)
+    count, = upsert_increment(db.session, UserLocationStats, {"user_id": user_id, "location": location},
+                              {"entry_count": delta})
+    if count <= 0:
+        db.session.execute(delete(UserLocationStats).filter_by(user_id=user_id, location=location))
+        return -1
+    return 1 if count == delta else 0
+
+
+def _bump_tag(user_id, tag_id, delta):
+    count, = upsert_increment(db.session, UserTagStats, {"user_id": user_id, "tag_id": tag_id}, {"entry_count": delta})
+    if count <= 0:
+        db.session.execute(delete(UserTagStats).filter_by(user_id=user_id, tag_id=tag_id))
+
+
+def _bump_tags(user_id, deltas):
+    # _bump_tag for several tags at once: one upsert, plus one delete when any
+    # count may have reached zero
+    upsert_increment_many(db.session, UserTagStats, ('user_id', 'tag_id'), [
+        {"user_id": user_id, "tag_id": tag_id, "entry_count": delta} for tag_id, delta in sorted(deltas.items())
+    ])
+    decreased = [tag_id for tag_id, delta in deltas.items() if delta < 0]
+    if decreased:
+        db.session.execute(delete(UserTagStats).where(
+            UserTagStats.user_id == user_id, UserTagStats.tag_id.in_(decreased), UserTagStats.entry_count <= 0
+        ))
+
+
+def _bump_tag_counts(deltas):
+    # tags.entry_count, which ranks tag suggestions. Tags in id order, so
+    # concurrent writers lock the rows in the same order.
+    tags = Tag.__table__
+    changes = [{"tag": tag_id, "delta": delta} for tag_id, delta in sorted(deltas.items()) if delta]
+    if changes:
+        db.session.execute(update(tags).where(tags.c.id == bindparam('tag'))
+                           .values(entry_count=tags.c.entry_count + bindparam('delta')), changes)
+
+
+def entry_added(user_id, date, location):
+    if user_id is None:
+        return
+    _bump_month(user_id, _month(date), 1)
+    _bump_day(user_id, date.date(), 1)
+    _bump_totals(user_id, entries=1, locations=_bump_location(user_id, location, 1))
+
+
+def entry_changed(user_id, old_date, old_location, new_date, new_location):
+    if user_id is None:
+        return
+    if _month(old_date) != _month(new_date):
+        _bump_month(user_id, _month(old_date), -1)
+        _bump_month(user_id, _month(new_date), 1)
+    if old_date.date() != new_date.date():
+        _bump_day(user_id, old_date.date(), -1)
+        _bump_day(user_id, new_date.date(), 1)
+    if old_location != new_location:
+        locations = _bump_location(user_id, old_location, -1) + _bump_location(user_id, new_location, 1)
+        if locations:
+            _bump_totals(user_id, locations=locations)
+
+
+def entry_removed(entry):
+    # Call before deleting: the entry's photos and tag links go with it
+    if entry.user_id is None:
+        return
+    photo_count = db.session.scalar(select(func.count()).select_from(Photo).filter_by(entry_id=entry.id))
+    tag_ids = db.session.scalars(select(EntryTag.tag_id).filter_by(entry_id=entry.id)).all()
+    if tag_ids:
+        _bump_tags(entry.user_id, {tag_id: -1 for tag_id in tag_ids})
+        _bump_tag_counts({tag_id: -1 for tag_id in tag_ids})
+    _bump_month(entry.user_id, _month(entry.date), -1)
+    _bump_day(entry.user_id, entry.date.date(), -1)
+    _bump_totals(entry.user_id, entries=-1, photos=-photo_count,
+                 locations=_bump_location(entry.user_id, entry.location, -1))
+
+
+def entries_added(user_id, rows):
+    # Batched form of entry_added: one upsert per distinct month, day and location
+    if user_id is None or not rows:
+        return
+    months = Counter(_month(row["date"]) for row in rows)
+    days = Counter(row["date"].date() for row in rows)
+    locations = Counter(row["location"] for row in rows)
+    for month, count in months.items():
+        _bump_month(user_id, month, count)
+    # Counts only grow here, so no row can drop to zero and need deleting
+    upsert_increment_many(db.session, UserDayStats, ('user_id', 'day'), [
+        {"user_id": user_id, "day": day, "entry_count": count} for day, count in sorted(days.items())
+    ])
+    new_locations = sum(_bump_location(user_id, location, count) for location, count in locations.items())
+    _bump_totals(user_id, entries=len(rows), locations=new_locations)
+
+
+def photos_changed(entry_id, delta, user_id=None):
+    if user_id is None:
+        user_id = db.session.scalar(select(Entry.user_id).filter_by(id=entry_id))
+    if user_id is not None and delta:
+        _bump_totals(user_id, photos=delta)
+
+
+def tag_link_changed(entry_id, tag_id, delta, user_id=None):
+    _bump_tag_counts({tag_id: delta})
+    if user_id is None:
+        user_id = db.session.scalar(select(Entry.user_id).filter_by(id=entry_id))
+    if user_id is not None:
+        _bump_tag(user_id, tag_id, delta)
+
+
+def _owners(entry_ids):
+    return dict(db.session.execute(select(Entry.id, Entry.user_id).where(Entry.id.in_(entry_ids))).all())
+
+
+def photos_added(entry_ids):
+    # Batched form of photos_changed; `entry_ids` has one item per new photo
+    owners = _owners(set(entry_ids))
+    per_user = Counter(owners[entry_id] for entry_id in entry_ids if owners.get(entry_id) is not None)
+    upsert_increment_many(db.session, UserStats, ('user_id',), [
+        {"user_id": user_id, "entry_count": 0, "photo_count": count, "location_count": 0}
+        for user_id, count in sorted(per_user.items())
+    ])
+
+
+def tag_links_added(pairs):
+    # Batched form of tag_link_changed for newly inserted (entry_id, tag_id) links
+    owners = _owners({entry_id for entry_id, _ in pairs})
+    per_user_tag = Counter((owners[entry_id], tag_id) for entry_id, tag_id in pairs if owners.get(entry_id) is not None)
+    # Counts only grow here, so no row can drop to zero and need deleting
+    upsert_increment_many(db.session, UserTagStats, ('user_id', 'tag_id'), [
+        {"user_id": user_id, "tag_id": tag_id, "entry_count": count}
+        for (user_id, tag_id), count in sorted(per_user_tag.items())
+    ])
+    _bump_tag_counts(Counter(tag_id for _, tag_id in pairs))
+
+
+def tag_removed(tag_id):
+    db.session.execute(delete(UserTagStats).filter_by(tag_id=tag_id))
+
+
+def get_user_stats(user_id, top_tags=10):
+    totals = db.session.get(UserStats, user_id)
+    months = db.session.execute(
+        select(UserMonthStats.month, UserMonthStats.entry_count)
+        .filter_by(user_id=user_id).order_by(UserMonthStats.month)
+    )
+    tags = db.session.execute(
+        select(Tag.id, Tag.name, UserTagStats.entry_count)
+        .join(Tag, Tag.id == UserTagStats.tag_id)
+        .where(UserTagStats.user_id == user_id)
+        .order_by(UserTagStats.entry_count.desc(), Tag.id)
+        .limit(top_tags)
+    )
+    return {
+        "entry_count": totals.entry_count if totals else 0,
+        "photo_count": totals.photo_count if totals else 0,
+        "location_count": totals.location_count if totals else 0,
+        "entries_per_month": [{"month": month, "count": count} for month, count in months],
+        "top_tags": [{"id": id, "name": name, "count": count} for id, name, count in tags],
+    }
+
+
+def month_expression(date_column):
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.to_char(date_column, 'YYYY-MM')
+    return func.strftime('%Y-%m', date_column)
+
+
+TIMELINE_GRANULARITIES = ('day', 'week', 'month', 'year')
+SQLITE_PERIOD_START = {'day': (), 'week': ('weekday 0', '-6 days'), 'month': ('start of month',),
+                       'year': ('start of year',)}
+
+
+# Buckets sampled per statement; SQLite allows 500 terms in a compound SELECT
+TIMELINE_SAMPLE_BATCH = 200
+
+
+def period_end(granularity, start):
+    # Start of the period after the one starting at `start`
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start.replace(year=start.year + 1)
+
+
+def period_start(granularity, date_column):
+    # First day of the day, week (from Monday), month or year holding the date
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return cast(func.date_trunc(granularity, date_column), Date)
+    return func.date(date_column, *SQLITE_PERIOD_START[granularity])
+
+
+def get_timeline(user_id, granularity, date_from=None, date_until=None, ids_per_bucket=3, use_rollup=True):
+    # Entry counts per period, oldest first, plus the ids of the first
+    # `ids_per_bucket` entries of each (by date). Counts come from
+    # user_day_stats when `use_rollup`, else from grouping the entries; the
+    # ids always come from the entries, through the (user_id, date) index.
+    if use_rollup:
+        start = period_start(granularity, UserDayStats.day)
+        stmt = select(start, func.sum(UserDayStats.entry_count)).where(UserDayStats.user_id == user_id)
+        if date_from:
+            stmt = stmt.where(UserDayStats.day >= date_from.date())
+        if date_until:
+            stmt = stmt.where(UserDayStats.day < date_until.date())
+    else:
+        start = period_start(granularity, Entry.date)
+        stmt = select(start, func.count()).where(Entry.user_id == user_id)
+        if date_from:
+            stmt = stmt.where(Entry.date >= date_from)
+        if date_until:
+            stmt = stmt.where(Entry.date < date_until)
+    buckets = {str(period): {"start": str(period), "count": count, "entry_ids": []}
+               for period, count in db.session.execute(stmt.group_by(start).order_by(start))}
+
+    if ids_per_bucket and buckets:
+        # One LIMITed range scan of (user_id, date, id) per returned bucket,
+        # so the work follows the buckets shown rather than all the entries
+        samples = []
+        for key in buckets:
+            start = datetime.strptime(key[:10], '%Y-%m-%d')
+            low, high = max(start, date_from or start), min(period_end(granularity, start), date_until or datetime.max)
+            sample = (select(Entry.date, Entry.id)
+                      .where(Entry.user_id == user_id, Entry.date >= low, Entry.date < high)
+                      .order_by(Entry.date, Entry.id).limit(ids_per_bucket).subquery())
+            samples.append(select(literal(key).label('period'), sample.c.date, sample.c.id))
+        for batch in range(0, len(samples), TIMELINE_SAMPLE_BATCH):
+            rows = db.session.execute(union_all(*samples[batch:batch + TIMELINE_SAMPLE_BATCH])).all()
+            for period, _, entry_id in sorted(rows):
+                buckets[period]["entry_ids"].append(entry_id)
+    return list(buckets.values())
+
+
+def rebuild_user_stats(user_id=None):
+    # Recomputes the summary tables from entries/photos/entry_tags, for one user
+    # or everyone. Used for the initial backfill and to repair drift.
+    def scoped(stmt, column):
+        return stmt.where(column == user_id) if user_id is not None else stmt
+
+    for model in (UserStats, UserMonthStats, UserDayStats, UserLocationStats, UserTagStats):
+        db.session.execute(scoped(delete(model), model.user_id))
+
+    month = month_expression(Entry.date)
+    db.session.execute(insert(UserMonthStats).from_select(
+        ['user_id', 'month', 'entry_count'],
+        scoped(select(Entry.user_id, month, func.count()), Entry.user_id).group_by(Entry.user_id, month)
+    ))
+    day = period_start('day', Entry.date)
+    db.session.execute(insert(UserDayStats).from_select(
+        ['user_id', 'day', 'entry_count'],
+        scoped(select(Entry.user_id, day, func.count()), Entry.user_id).group_by(Entry.user_id, day)
+    ))
+    db.session.execute(insert(UserLocationStats).from_select(
+        ['user_id', 'location', 'entry_count'],
+        scoped(select(Entry.user_id, Entry.location, func.count()), Entry.user_id)
+        .group_by(Entry.user_id, Entry.location)
+    ))
+    db.session.execute(insert(UserTagStats).from_select(
+        ['user_id', 'tag_id', 'entry_count'],
+        scoped(select(Entry.user_id, EntryTag.tag_id, func.count())
+               .join(EntryTag, EntryTag.entry_id == Entry.id), Entry.user_id)
+        .group_by(Entry.user_id, EntryTag.tag_id)
+    ))
+
+    entry_counts = (scoped(select(Entry.user_id, func.count().label('entries'),
+                                  func.count(Entry.location.distinct()).label('locations')), Entry.user_id)
+                    .group_by(Entry.user_id).subquery())
+    photo_counts = (scoped(select(Entry.user_id, func.count().label('photos'))
+                           .join(Photo, Photo.entry_id == Entry.id), Entry.user_id)
+                    .group_by(Entry.user_id).subquery())
+    db.session.execute(insert(UserStats).from_select(
+        ['user_id', 'entry_count', 'photo_count', 'location_count'],
+        select(entry_counts.c.user_id, entry_counts.c.entries,
+               func.coalesce(photo_counts.c.photos, 0), entry_counts.c.locations)
+        .outerjoin(photo_counts, photo_counts.c.user_id == entry_counts.c.user_id)
+    ))
+
+    if user_id is None:
+        db.session.execute(update(Tag).values(entry_count=(
+            select(func.count()).where(EntryTag.tag_id == Tag.id).scalar_subquery()
+        )))
+    db.session.commit()
+
+
+def stats_config_from_env():
+    return {
+        # GET /api/entries/timeline counts from user_day_stats; 0 groups the entries instead
+        'TIMELINE_ROLLUP': os.getenv('TIMELINE_ROLLUP', '1').lower() in ('1', 'true', 'yes', 'on'),
+        'TIMELINE_MAX_IDS': int(os.getenv('TIMELINE_MAX_IDS', 10)),
+    }
@@ -0,0 +1,96 @@
+import os
+import tempfile
+
+
+class FilesystemStorage:
+    # Stores objects as files under `root`, keyed by relative path. Temporary
+    # upload files live in root/.tmp so finishing an upload is a rename on the
+    # same filesystem rather than a second copy.
+
+    def __init__(self, root, base_url='/media/'):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url
+        self.tmp_dir = os.path.join(self.root, '.tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def put_file(self, key, filename, content_type=None):
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        os.replace(filename, self.path(key))
+
+    def put_bytes(self, key, data, content_type=None):
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.tmp_dir, delete=False) as f:
+            f.write(data)
+        os.replace(f.name, self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        return self.base_url + key
+
+
+class S3Storage:
+    # Works with any client exposing the boto3 S3 calls used below, so MinIO,
+    # a moto server or an in-memory stand-in can take the place of AWS
+    MISSING_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+    def __init__(self, client, bucket, prefix='', base_url='/media/'):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.base_url = base_url
+        self.tmp_dir = None
+
+    def path(self, key):
+        # No local file to hand to sendfile
+        return None
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') in self.MISSING_CODES:
+                return False
+            raise
+        return True
+
+    def put_file(self, key, filename, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        with open(filename, 'rb') as f:
+            self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=f, **extra)
+        os.remove(filename)
+
+    def put_bytes(self, key, data, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data, **extra)
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def url(self, key):
+        return self.base_url + key
+
+
+def storage_from_config(config):
+    if config.get('PHOTO_STORAGE') == 's3':
+        import boto3
+        client = boto3.client('s3', endpoint_url=config.get('PHOTO_S3_ENDPOINT_URL'))
+        return S3Storage(client, config['PHOTO_S3_BUCKET'], config.get('PHOTO_S3_PREFIX', ''),
+                         config.get('PHOTO_BASE_URL', '/media/'))
+    return FilesystemStorage(config.get('PHOTO_ROOT', 'uploads'), config.get('PHOTO_BASE_URL', '/media/'))
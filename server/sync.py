@@ -0,0 +1,228 @@
+import base64
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Boolean, DateTime, Integer, delete, event, func, insert, literal, select
+from models import db, Change, Entry, Photo, Tag, EntryTag
+from queries import ENTRY_COLUMNS
+from serializers import serialize_entry_row, serialize_photo_row
+
+# Change feed for offline clients. Write paths call the hooks below inside
+# their transaction; the changes are inserted as one batch just before it
+# commits. On PostgreSQL that insert takes a transaction-scoped advisory lock,
+# held until the commit, so change ids are handed out in commit order (SQLite
+# has one writer at a time anyway). A client that has seen change N has
+# therefore seen every change at or below N, and GET /api/sync?since=<token>
+# returns what came after.
+
+ADVISORY_LOCK_ID = 7406115  # any constant shared by every writer
+PENDING_KEY = 'sync_changes'
+COLLECTIONS = {'entry': 'entries', 'photo': 'photos', 'tag': 'tags', 'entry_tag': 'entry_tags'}
+
+
+def _record(kind, object_id, user_id=None, parent_id=None, deleted=False):
+    # The last change to an object within a transaction wins
+    db.session.info.setdefault(PENDING_KEY, {})[(kind, object_id, parent_id)] = (user_id, deleted)
+
+
+def _owners(entry_ids):
+    return dict(db.session.execute(select(Entry.id, Entry.user_id).where(Entry.id.in_(entry_ids))).all())
+
+
+def _lock(session):
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(select(func.pg_advisory_xact_lock(ADVISORY_LOCK_ID)))
+
+
+@event.listens_for(db.session, 'before_commit')
+def _write_changes(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    _lock(session)
+    now = datetime.utcnow()
+    session.execute(insert(Change), [
+        {"kind": kind, "object_id": object_id, "parent_id": parent_id, "user_id": user_id,
+         "deleted": deleted, "changed_at": now}
+        for (kind, object_id, parent_id), (user_id, deleted) in pending.items()
+    ])
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def entries_saved(entry_ids, user_id):
+    for entry_id in entry_ids:
+        _record('entry', entry_id, user_id)
+
+
+def entry_removed(entry):
+    # Call before deleting: the entry's photos and tag links go with it
+    _record('entry', entry.id, entry.user_id, deleted=True)
+    for photo in entry.photos:
+        _record('photo', photo.id, entry.user_id, entry.id, deleted=True)
+    for tag_id in db.session.scalars(select(EntryTag.tag_id).filter_by(entry_id=entry.id)):
+        _record('entry_tag', tag_id, entry.user_id, entry.id, deleted=True)
+
+
+def photos_saved(pairs, user_id=None, deleted=False):
+    # `pairs` are (photo id, entry id); owners are looked up when not given
+    owners = _owners({entry_id for _, entry_id in pairs}) if user_id is None else {}
+    for photo_id, entry_id in pairs:
+        _record('photo', photo_id, owners.get(entry_id, user_id), entry_id, deleted)
+
+
+def photos_removed(pairs, user_id=None):
+    photos_saved(pairs, user_id, deleted=True)
+
+
+def tag_saved(tag_id):
+    _record('tag', tag_id)
+
+
+def tag_removed(tag_id):
+    # Call before deleting. Returns the ids of the entries that carried the tag.
+    links = db.session.execute(
+        select(EntryTag.entry_id, Entry.user_id).join(Entry, Entry.id == EntryTag.entry_id)
+        .where(EntryTag.tag_id == tag_id)
+    ).all()
+    for entry_id, user_id in links:
+        _record('entry_tag', tag_id, user_id, entry_id, deleted=True)
+    _record('tag', tag_id, deleted=True)
+    return [entry_id for entry_id, _ in links]
+
+
+def tag_links_saved(pairs, user_id=None, deleted=False):
+    # `pairs` are (entry id, tag id)
+    owners = _owners({entry_id for entry_id, _ in pairs}) if user_id is None else {}
+    for entry_id, tag_id in pairs:
+        _record('entry_tag', tag_id, owners.get(entry_id, user_id), entry_id, deleted)
+
+
+def tag_links_removed(pairs, user_id=None):
+    tag_links_saved(pairs, user_id, deleted=True)
+
+
+def encode_token(change_id, issued_at):
+    # Opaque token: the last change id a client has and when it was issued
+    raw = json.dumps([change_id, int(issued_at)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    # Returns (change id, issued at); raises ValueError for anything we didn't issue
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        change_id, issued_at = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(change_id), int(issued_at)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid sync token")
+
+
+def _epoch(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def changes_since(user_id, since, limit):
+    # One page of the user's journal (their entries, photos and tag links, and
+    # every tag) changed after change id `since`. Objects come in their current
+    # state; one deleted after the change was logged is left out, since its
+    # tombstone follows later in the feed.
+    columns = (Change.id, Change.kind, Change.object_id, Change.parent_id, Change.deleted, Change.changed_at)
+    own, shared = (
+        db.session.execute(select(*columns).where(scope, Change.id > since).order_by(Change.id).limit(limit + 1)).all()
+        for scope in (Change.user_id == user_id, Change.user_id.is_(None))
+    )
+    rows = sorted(own + shared, key=lambda row: row.id)
+    page, has_more = rows[:limit], len(rows) > limit
+
+    latest = {}
+    for row in page:
+        latest[(row.kind, row.object_id, row.parent_id)] = row.deleted
+    upserts = {kind: [] for kind in COLLECTIONS}
+    deleted = {collection: [] for collection in COLLECTIONS.values()}
+    for (kind, object_id, parent_id), is_deleted in latest.items():
+        if not is_deleted:
+            upserts[kind].append((object_id, parent_id))
+        elif kind == 'entry_tag':
+            deleted['entry_tags'].append({"entry_id": parent_id, "tag_id": object_id})
+        else:
+            deleted[COLLECTIONS[kind]].append(object_id)
+
+    result = {collection: [] for collection in COLLECTIONS.values()}
+    if upserts['entry']:
+        result['entries'] = [serialize_entry_row(row) for row in db.session.execute(
+            select(*ENTRY_COLUMNS).where(Entry.id.in_([id for id, _ in upserts['entry']])).order_by(Entry.id)
+        )]
+    if upserts['photo']:
+        result['photos'] = [dict(serialize_photo_row(row), entry_id=row.entry_id) for row in db.session.execute(
+            select(Photo.entry_id, Photo.id, Photo.url, Photo.thumbnail_url, Photo.preview_url)
+            .where(Photo.id.in_([id for id, _ in upserts['photo']])).order_by(Photo.id)
+        )]
+    if upserts['tag']:
+        result['tags'] = [{"id": row.id, "name": row.name} for row in db.session.execute(
+            select(Tag.id, Tag.name).where(Tag.id.in_([id for id, _ in upserts['tag']])).order_by(Tag.id)
+        )]
+    if upserts['entry_tag']:
+        pairs = {(entry_id, tag_id) for tag_id, entry_id in upserts['entry_tag']}
+        pairs &= set(db.session.execute(
+            select(EntryTag.entry_id, EntryTag.tag_id)
+            .where(EntryTag.entry_id.in_({e for e, _ in pairs}), EntryTag.tag_id.in_({t for _, t in pairs}))
+        ).tuples())
+        result['entry_tags'] = [{"entry_id": e, "tag_id": t} for e, t in sorted(pairs)]
+
+    # Tokens expire with the tombstones they might still need: while pages
+    # remain, the next token is as old as the first change not yet delivered
+    issued_at = _epoch(rows[limit].changed_at) if has_more else time.time()
+    result.update(deleted=deleted, has_more=has_more,
+                  next=encode_token(page[-1].id if page else since, issued_at))
+    return result
+
+
+def token_expired(issued_at, tombstone_days):
+    return issued_at < time.time() - tombstone_days * 86400
+
+
+def compact(tombstone_days):
+    # Drops changes superseded by a later change to the same object, then
+    # tombstones older than `tombstone_days`. Returns the number of rows deleted.
+    latest = select(func.max(Change.id)).group_by(Change.kind, Change.object_id, Change.parent_id)
+    superseded = db.session.execute(delete(Change).where(Change.id.not_in(latest))).rowcount
+    cutoff = datetime.utcnow() - timedelta(days=tombstone_days)
+    expired = db.session.execute(delete(Change).where(Change.deleted.is_(True), Change.changed_at < cutoff)).rowcount
+    db.session.commit()
+    return superseded + expired
+
+
+def rebuild_change_log():
+    # Logs every existing entry, photo, tag and tag link as changed, for data
+    # written before the change log existed or by bulk loaders (seed.py).
+    # Clients see them all again on their next sync.
+    now = literal(datetime.utcnow(), DateTime)
+    saved, no_parent = literal(False, Boolean), literal(None, Integer)
+    _lock(db.session)
+    for kind, stmt in (
+        ('tag', select(Tag.id, no_parent, literal(None, Integer))),
+        ('entry', select(Entry.id, no_parent, Entry.user_id)),
+        ('photo', select(Photo.id, Photo.entry_id, Entry.user_id).join(Entry, Entry.id == Photo.entry_id)),
+        ('entry_tag', select(EntryTag.tag_id, EntryTag.entry_id, Entry.user_id)
+         .join(Entry, Entry.id == EntryTag.entry_id)),
+    ):
+        db.session.execute(insert(Change).from_select(
+            ['object_id', 'parent_id', 'user_id', 'kind', 'deleted', 'changed_at'],
+            stmt.add_columns(literal(kind), saved, now)
+        ))
+    db.session.commit()
+
+
+def sync_config_from_env():
+    return {
+        'SYNC_PAGE_SIZE': int(os.getenv('SYNC_PAGE_SIZE', 500)),
+        'SYNC_MAX_PAGE_SIZE': int(os.getenv('SYNC_MAX_PAGE_SIZE', 2000)),
+        # How long tombstones are kept by `flask sync compact`; older tokens get a 410
+        'SYNC_TOMBSTONE_DAYS': int(os.getenv('SYNC_TOMBSTONE_DAYS', 30)),
+    }
@@ -0,0 +1,230 @@
+import heapq
+import os
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from sqlalchemy import func, select
+from models import db, Change, Tag
+
+# Tag autocomplete from memory. Each process keeps every tag name in a sorted
+# array and answers a prefix with two bisections; matches are ranked by how
+# many entries use the tag (tags.entry_count, kept by stats.py). Tags created,
+# deleted or (un)linked by any process reach the other processes through the
+# sync change log, which is polled by id like the token blocklist.
+
+SUGGEST_MAX_LIMIT = 50
+PREFIX_END = '\U0010ffff'
+
+
+def normalize_tag_name(name):
+    # Display form: NFKC, surrounding and repeated whitespace removed
+    return ' '.join(unicodedata.normalize('NFKC', name).split())
+
+
+def tag_key(name):
+    # Comparison form, for lookups and the prefix index
+    return normalize_tag_name(name).casefold()
+
+
+class PrefixIndex:
+    # Tags sorted by key in two parallel arrays. A prefix matching at most
+    # `scan_limit` tags is ranked on the spot; wider prefixes (short ones, at
+    # any size) keep their best SUGGEST_MAX_LIMIT tags precomputed, and those
+    # lists are patched as tags and counts change.
+
+    def __init__(self, scan_limit=1000):
+        self.scan_limit = scan_limit
+        self.keys = []
+        self.ids = []
+        self.names = {}
+        self.counts = {}
+        self._keys_by_id = {}
+        self._top = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rank(self, tag_id):
+        return -self.counts[tag_id], self._keys_by_id[tag_id], tag_id
+
+    def _range(self, key):
+        return bisect_left(self.keys, key), bisect_left(self.keys, key + PREFIX_END)
+
+    def load(self, rows):
+        # Replaces the contents with (id, name, count) rows
+        entries = sorted((tag_key(name), tag_id) for tag_id, name, _ in rows)
+        self.keys = [key for key, _ in entries]
+        self.ids = [tag_id for _, tag_id in entries]
+        self.names = {tag_id: name for tag_id, name, _ in rows}
+        self.counts = {tag_id: count or 0 for tag_id, _, count in rows}
+        self._keys_by_id = {tag_id: key for key, tag_id in entries}
+        self._top = {}
+
+    def lookup(self, name):
+        # Id of a tag whose name matches case-insensitively, or None
+        key = tag_key(name)
+        position = bisect_left(self.keys, key)
+        return self.ids[position] if position < len(self.keys) and self.keys[position] == key else None
+
+    def suggest(self, prefix, limit=10):
+        key = tag_key(prefix)
+        lo, hi = self._range(key)
+        if hi - lo <= self.scan_limit:
+            ranked = heapq.nsmallest(limit, self.ids[lo:hi], key=self._rank)
+        else:
+            ranked = self._top.get(key)
+            if ranked is None:
+                ranked = self._top[key] = heapq.nsmallest(SUGGEST_MAX_LIMIT, self.ids[lo:hi], key=self._rank)
+            ranked = ranked[:limit]
+        return [{"id": tag_id, "name": self.names[tag_id], "count": self.counts[tag_id]} for tag_id in ranked]
+
+    def upsert(self, tag_id, name, count):
+        key = tag_key(name)
+        if self._keys_by_id.get(tag_id) != key:
+            self.remove(tag_id)
+            position = bisect_left(self.keys, key)
+            self.keys.insert(position, key)
+            self.ids.insert(position, tag_id)
+            self._keys_by_id[tag_id] = key
+        self.names[tag_id] = name
+        self.counts[tag_id] = count or 0
+        self._patch_top(tag_id, key)
+
+    def remove(self, tag_id):
+        key = self._keys_by_id.pop(tag_id, None)
+        if key is None:
+            return
+        lo, hi = self._range(key)
+        position = self.ids.index(tag_id, lo, hi)
+        del self.keys[position], self.ids[position]
+        del self.names[tag_id], self.counts[tag_id]
+        for length in range(len(key) + 1):
+            top = self._top.get(key[:length])
+            if top is not None and tag_id in top:
+                # Whatever ranked next is not known here; rebuilt on the next lookup
+                del self._top[key[:length]]
+
+    def _patch_top(self, tag_id, key):
+        rank = self._rank(tag_id)
+        for length in range(len(key) + 1):
+            prefix = key[:length]
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            if tag_id in top:
+                top.remove(tag_id)
+            elif len(top) == SUGGEST_MAX_LIMIT and rank >= self._rank(top[-1]):
+                continue
+            if len(top) == SUGGEST_MAX_LIMIT - 1 and rank > self._rank(top[-1]):
+                # Dropped below the last kept tag: another may now rank higher
+                del self._top[prefix]
+                continue
+            ranks = [self._rank(other) for other in top]
+            top.insert(bisect_left(ranks, rank), tag_id)
+            del top[SUGGEST_MAX_LIMIT:]
+
+
+class TagIndex:
+    # PrefixIndex over the tags table for this process. Loaded on first use
+    # (or by warm()), then brought up to date from the change log at most
+    # every TAG_SUGGEST_SYNC_SECONDS. A backlog longer than one batch of
+    # changes (after `flask sync rebuild`, say) triggers a full reload.
+
+    def __init__(self):
+        self.sync_seconds = 2.0
+        self.batch_size = 5000
+        self.index = PrefixIndex()
+        self._loaded = False
+        self._last_change_id = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.sync_seconds = app.config.get('TAG_SUGGEST_SYNC_SECONDS', self.sync_seconds)
+        self.index = PrefixIndex(app.config.get('TAG_SUGGEST_SCAN_LIMIT', 1000))
+        self._loaded = False
+        app.extensions['tag_index'] = self
+
+    def warm(self):
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        self._last_change_id = db.session.scalar(select(func.max(Change.id))) or 0
+        self.index.load(db.session.execute(select(Tag.id, Tag.name, Tag.entry_count)).all())
+        self._loaded = True
+        self._synced_at = time.monotonic()
+
+    def _sync(self):
+        rows = db.session.execute(
+            select(Change.id, Change.kind, Change.object_id, Change.deleted)
+            .where(Change.id > self._last_change_id, Change.kind.in_(('tag', 'entry_tag')))
+            .order_by(Change.id).limit(self.batch_size + 1)
+        ).all()
+        self._synced_at = time.monotonic()
+        if len(rows) > self.batch_size:
+            self._load()
+            return
+        if not rows:
+            return
+        self._last_change_id = rows[-1].id
+        deleted = {row.object_id for row in rows if row.kind == 'tag' and row.deleted}
+        changed = {row.object_id for row in rows} - deleted
+        current = {}
+        for tag_ids in _chunks(sorted(changed), 1000):
+            current.update((row.id, row) for row in db.session.execute(
+                select(Tag.id, Tag.name, Tag.entry_count).where(Tag.id.in_(tag_ids))
+            ))
+        for tag_id in deleted | (changed - current.keys()):
+            self.index.remove(tag_id)
+        for row in current.values():
+            self.index.upsert(row.id, row.name, row.entry_count)
+
+    def _ready(self):
+        if not self._loaded:
+            self._load()
+        elif time.monotonic() - self._synced_at >= self.sync_seconds:
+            self._sync()
+
+    def suggest(self, prefix, limit=10):
+        with self._lock:
+            self._ready()
+            return self.index.suggest(prefix, limit)
+
+    def lookup(self, name):
+        with self._lock:
+            self._ready()
+            return self.index.lookup(name)
+
+    def added(self, tag_id, name):
+        # This process' own writes show up straight away, the rest on sync
+        with self._lock:
+            if self._loaded:
+                self.index.upsert(tag_id, name, 0)
+
+    def removed(self, tag_id):
+        with self._lock:
+            if self._loaded:
+                self.index.remove(tag_id)
+
+
+def _chunks(items, size):
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+def find_tag(name):
+    # The tag `name` resolves to through the unique key index, or None
+    return db.session.execute(select(Tag.id, Tag.name).where(Tag.key == tag_key(name))).first()
+
+
+def tag_config_from_env():
+    return {
+        'TAG_SUGGEST_SYNC_SECONDS': float(os.getenv('TAG_SUGGEST_SYNC_SECONDS', 2)),
+        'TAG_SUGGEST_SCAN_LIMIT': int(os.getenv('TAG_SUGGEST_SCAN_LIMIT', 1000)),
+    }
+
+
+tag_index = TagIndex()
@@ -0,0 +1,256 @@
+import fnmatch
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+# Modules that build an app at import (app.py, asgi.py) must never reach the
+# database from .env; load_dotenv leaves variables that are already set alone
+os.environ['DATABASE_URI'] = 'sqlite://'
+
+# Settings every test app starts from; a test changes them with
+# @pytest.mark.config(NAME=value) or through app.config afterwards
+TEST_CONFIG = {
+    'TESTING': True,
+    'SECRET_KEY': 'test',
+    'JWT_SECRET_KEY': 'test-jwt-secret-key-of-a-reasonable-length',
+    'PASSWORD_HASH_WORKERS': 0,
+    'RATELIMIT_ENABLED': False,
+    'CACHE_BACKEND': 'memory',
+    'REPLICA_DATABASE_URIS': '',
+    'JOBS_EAGER': True,
+    'GEO_POSTGIS': False,
+}
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'config(**settings): app.config overrides for the app fixture')
+
+
+@pytest.fixture
+def app(request, tmp_path):
+    # A fresh app and SQLite database per test
+    from factory import create_app
+    from models import db
+
+    config = dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+                  PHOTO_ROOT=str(tmp_path / 'uploads'))
+    for marker in request.node.iter_markers('config'):
+        config.update(marker.kwargs)
+    app = create_app(config)
+    with app.app_context():
+        # The primary only: db is shared by every test app, and keeps the
+        # replica binds of earlier ones in db.metadatas
+        db.create_all(bind_key=None)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    # make_user('alice') -> (user id, Authorization header for an access token)
+    from flask_jwt_extended import create_access_token
+    from models import db, User
+
+    def make(username='alice'):
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            return user.id, {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+    return make
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def make_entries(app):
+    # Inserts entries (with `photos` photos and `tags` tag links each) the way
+    # the write routes would, summary tables and change log included
+    from models import db, Entry, Photo, Tag, EntryTag
+    import stats
+    import sync
+
+    def make(user_id, count, photos=0, tags=0, start=datetime(2024, 1, 1), step=timedelta(days=1), location='Paris'):
+        with app.app_context():
+            tag_ids = []
+            for n in range(tags):
+                tag = db.session.execute(db.select(Tag).filter_by(name=f'tag{n}')).scalar()
+                if tag is None:
+                    tag = Tag(name=f'tag{n}')
+                    db.session.add(tag)
+                    db.session.flush()
+                tag_ids.append(tag.id)
+            entries = [Entry(location=location, date=start + step * n, description=f'Entry {n}', user_id=user_id)
+                       for n in range(count)]
+            db.session.add_all(entries)
+            db.session.flush()
+            for entry in entries:
+                db.session.add_all(Photo(entry_id=entry.id, url=f'http://example.com/{entry.id}-{n}.jpg')
+                                   for n in range(photos))
+                db.session.add_all(EntryTag(entry_id=entry.id, tag_id=tag_id) for tag_id in tag_ids)
+            db.session.commit()
+            # Everyone's, so tags.entry_count is recounted too
+            stats.rebuild_user_stats()
+            sync.rebuild_change_log()
+            db.session.commit()
+            return [entry.id for entry in entries]
+    return make
+
+
+@pytest.fixture
+def count_queries(app):
+    # with count_queries() as statements: ... -> the SQL run inside the block
+    from sqlalchemy import event
+    from models import db
+
+    @contextmanager
+    def count():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            for engine in engines:
+                event.remove(engine, 'before_cursor_execute', record)
+    return count
+
+
+class FakeRedis:
+    # The slice of redis-py the cache and rate limit backends use, kept in a
+    # dict; like Redis, it hands values back as bytes
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def get(self, key):
+        value = self.data.get(key)
+        return None if value is None else self._bytes(value)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def decr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) - 1
+        return self.data[key]
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({field: self._bytes(value) for field, value in mapping.items()})
+        return len(mapping)
+
+    def hmget(self, key, *fields):
+        item = self.data.get(key, {})
+        return [item.get(field) for field in fields]
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, pattern):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, pattern)]
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+@pytest.fixture
+def fake_redis():
+    # An empty stand-in for a Redis client, for RedisBackend and RedisRateBackend
+    return FakeRedis()
+
+
+@pytest.fixture(scope='session')
+def asgi_module():
+    # Importing asgi builds app.py's app, which points the shared extensions at
+    # it; session scope makes that happen before any test's app fixture
+    import asgi
+    return asgi
+
+
+@pytest.fixture
+def asgi_get(asgi_module, app, monkeypatch):
+    # asgi_get(path, headers) -> (status, headers, body) from asgi.application,
+    # pointed at the test app and its database
+    import asyncio
+    from asgiref.wsgi import WsgiToAsgi
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+    from database import async_database_uri
+
+    asgi = asgi_module
+
+    # Each call runs in its own event loop, so connections aren't pooled
+    engine = create_async_engine(async_database_uri(app.config['SQLALCHEMY_DATABASE_URI']), poolclass=NullPool)
+    monkeypatch.setattr(asgi, 'app', app)
+    monkeypatch.setattr(asgi, 'wsgi_app', WsgiToAsgi(app))
+    monkeypatch.setattr(asgi, 'Session', async_sessionmaker(engine, expire_on_commit=False))
+
+    def get(path, headers=None, client_addr='127.0.0.1'):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+            'query_string': query.encode(), 'server': ('testserver', 80), 'client': (client_addr, 50000),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in (headers or {}).items()],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(asgi.application(scope, receive, send))
+        start = messages[0]
+        return (start['status'], {name.decode(): value.decode() for name, value in start['headers']},
+                b''.join(message.get('body', b'') for message in messages[1:]))
+
+    yield get
+    asyncio.run(engine.dispose())
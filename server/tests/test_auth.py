@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def tokens(client, username='alice'):
+    client.post('/api/users/register', json={'username': username, 'email': f'{username}@example.com',
+                                             'password_hash': 'secret'})
+    body = client.post('/api/users/login', json={'username': username, 'password': 'secret'}).get_json()
+    return {'Authorization': f"Bearer {body['access_token']}"}, {'Authorization': f"Bearer {body['refresh_token']}"}
+
+
+def test_refresh_and_logout(client):
+    access, refresh = tokens(client)
+    assert client.get('/api/users/profile', headers=access).status_code == 200
+    fresh = client.post('/api/users/refresh', headers=refresh).get_json()['access_token']
+    assert client.get('/api/users/profile', headers={'Authorization': f'Bearer {fresh}'}).status_code == 200
+
+    assert client.post('/api/users/logout', headers=access,
+                       json={'refresh_token': refresh['Authorization'][7:]}).status_code == 200
+    assert client.get('/api/users/profile', headers=access).status_code == 401
+    assert client.post('/api/users/refresh', headers=refresh).status_code == 401
+
+
+def test_blocklist_sees_revocations_from_other_processes(app, client):
+    # Another worker's logout lands in revoked_tokens; this one's Bloom
+    # filter picks it up on its next sync
+    from flask_jwt_extended import decode_token
+    from auth import token_blocklist
+    from models import db, RevokedToken
+
+    access, _ = tokens(client)
+    assert client.get('/api/users/profile', headers=access).status_code == 200
+    with app.app_context():
+        jwt_data = decode_token(access['Authorization'][7:])
+        db.session.add(RevokedToken(jti=jwt_data['jti'], token_type='access', user_id=jwt_data['sub'],
+                                    revoked_at=datetime.utcnow(), expires_at=datetime.utcnow() + timedelta(hours=1)))
+        db.session.commit()
+    token_blocklist.sync_seconds = 0
+    assert client.get('/api/users/profile', headers=access).status_code == 401
+
+
+@pytest.mark.parametrize('path', ['/api/tags', '/api/entries', '/api/entries/1'])
+def test_asgi_routes_authenticate_like_flask(client, asgi_get, make_entries, path):
+    access, refresh = tokens(client)
+    make_entries(1, 1)
+    assert asgi_get(path, access)[0] == client.get(path, headers=access).status_code == 200
+
+    # A refresh token is not an access token
+    assert asgi_get(path, refresh)[0] == client.get(path, headers=refresh).status_code == 422
+
+    # Nor is a token that has been logged out
+    client.post('/api/users/logout', headers=access)
+    assert asgi_get(path, access)[0] == client.get(path, headers=access).status_code == 401
+
+
+def test_asgi_rejects_tokens_of_deleted_users(app, client, asgi_get, make_user):
+    from auth import identity_cache
+    from models import db, User
+
+    user_id, headers = make_user('ghost')
+    with app.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+    identity_cache.invalidate(user_id)
+    assert asgi_get('/api/tags', headers)[0] == client.get('/api/tags', headers=headers).status_code == 401
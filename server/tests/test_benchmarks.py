@@ -0,0 +1,43 @@
+import json
+import random
+
+import pytest
+
+import seed
+from benchmarks.run_benchmarks import compare, dataset, login, routes, run_test_client, summarize
+
+
+@pytest.fixture
+def data(app):
+    with app.app_context():
+        seed.generate(20, tags=20, workers=1, seed=0)
+    return dataset(app)
+
+
+def test_every_route_runs_cleanly_on_generated_data(app, data):
+    assert data['counts']['users'] == 20 and data['username'] == 'user1'
+    headers = login(app, data, 'password')
+    for name, writes, factory in routes(data, random.Random(0)):
+        result = run_test_client(app, factory, 3, headers)
+        assert (name, result['requests'], result['errors']) == (name, 3, 0)
+
+
+def test_summaries_report_milliseconds():
+    result = summarize([n / 1000 for n in range(100, 0, -1)], errors=2, elapsed=2.0)
+    assert result == {'requests': 100, 'rps': 50.0, 'p50': 50.0, 'p95': 95.0, 'p99': 99.0, 'errors': 2}
+
+
+def test_compare_flags_routes_past_the_threshold(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    before = {'rps': 100.0, 'p95': 10.0}
+    baseline.write_text(json.dumps({'commit': 'abc1234', 'created_at': '2026-01-01T00:00:00+00:00', 'results': {
+        'same': before, 'slower': before, 'fewer': before, 'gone': before,
+    }}))
+    results = {
+        'same': {'rps': 95.0, 'p95': 11.0},
+        'slower': {'rps': 100.0, 'p95': 12.5},
+        'fewer': {'rps': 70.0, 'p95': 10.0},
+        'new': {'rps': 1.0, 'p95': 1000.0},
+    }
+    assert compare(results, baseline, threshold=0.2) == ['slower', 'fewer']
+    assert compare(results, baseline, threshold=0.5) == []
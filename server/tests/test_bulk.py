@@ -0,0 +1,43 @@
+def batch(client, headers, path, key, items):
+    response = client.post(path, json={key: items}, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return [result.get('error', 'ok') for result in response.get_json()['results']]
+
+
+def test_entry_batches_report_bad_items_and_keep_the_rest(client, user):
+    results = batch(client, user[1], '/api/entries/batch', 'entries', [
+        {'location': 'Paris', 'date': '2024-01-01'},
+        {'location': 'x' * 101, 'date': '2024-01-01'},
+        {'location': 42, 'date': '2024-01-01'},
+        {'location': 'Rome', 'date': '2024-01-01', 'description': ['not', 'text']},
+        {'location': 'Oslo', 'date': 20240101},
+        'Oslo',
+        {'location': 'x' * 100, 'date': '2024-01-02', 'description': 'Fine'},
+    ])
+    assert results == ['ok', 'Location must be at most 100 characters.', 'Location must be a string.',
+                       'Description must be a string.', "Invalid date format. Use 'YYYY-MM-DD'.",
+                       'Location is required.', 'ok']
+    assert len(client.get('/api/entries').get_json()['entries']) == 2
+
+
+def test_photo_batches_check_urls(client, user):
+    entry_id = client.post('/api/entries', json={'location': 'Paris', 'date': '2024-01-01'},
+                           headers=user[1]).get_json()['id']
+    results = batch(client, user[1], '/api/entries/photos/batch', 'photos', [
+        {'entry_id': entry_id, 'url': 'http://example.com/' + 'a' * 181},
+        {'entry_id': entry_id, 'url': 'http://example.com/' + 'a' * 182},
+        {'entry_id': entry_id, 'url': 7},
+        {'entry_id': entry_id},
+    ])
+    assert results == ['ok', 'Photo URL must be at most 200 characters.', 'Photo URL must be a string.',
+                       'Photo URL is required.']
+
+
+def test_failed_batches_hide_the_exception(client, user, monkeypatch, caplog):
+    def fail(items, user_id):
+        raise RuntimeError('connection to 10.0.0.5 lost')
+
+    monkeypatch.setattr('routes.entries.bulk_create_entries', fail)
+    response = client.post('/api/entries/batch', json={'entries': []}, headers=user[1])
+    assert response.status_code == 500 and response.get_json() == {"error": "Batch failed"}
+    assert 'connection to 10.0.0.5 lost' in caplog.text
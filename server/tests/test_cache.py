@@ -0,0 +1,103 @@
+import pytest
+from sqlalchemy import event
+
+from cache import MemoryBackend, NullBackend, RedisBackend, ResponseCache, cache_config_from_env, entry_key, response_cache
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def backend(request, app, monkeypatch, fake_redis):
+    # The app's response cache on each storing backend
+    if request.param == 'redis':
+        monkeypatch.setattr(response_cache, 'backend', RedisBackend(fake_redis))
+    return response_cache.backend
+
+
+@pytest.fixture
+def entry(client, user):
+    return client.post('/api/entries', json={'location': 'Paris', 'date': '2024-01-01', 'description': 'One'},
+                       headers=user[1]).get_json()['id']
+
+
+def test_etag_round_trip_and_invalidation(client, user, entry, backend, count_queries):
+    first = client.get(f'/api/entries/{entry}')
+    assert first.status_code == 200 and first.headers['ETag']
+    with count_queries() as statements:
+        again = client.get(f'/api/entries/{entry}', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and statements == []
+
+    client.put(f'/api/entries/{entry}', json={'description': 'Two'}, headers=user[1])
+    changed = client.get(f'/api/entries/{entry}', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.get_json()['description'] == 'Two'
+    assert changed.headers['ETag'] != first.headers['ETag']
+
+
+def test_fill_racing_an_invalidation_is_not_kept(app, client, user, entry, backend):
+    # Another worker updates the entry while this one is reading it: the body
+    # read before the update must not outlive the invalidation
+    from models import db
+
+    invalidated = []
+
+    def invalidate_once(*args):
+        if not invalidated:
+            invalidated.append(True)
+            response_cache.invalidate(entry_key(entry))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', invalidate_once)
+    assert client.get(f'/api/entries/{entry}').status_code == 200
+    event.remove(engine, 'before_cursor_execute', invalidate_once)
+    assert invalidated and backend.get(entry_key(entry)) is None
+
+    # The next fill, with no invalidation in between, is kept
+    client.get(f'/api/entries/{entry}')
+    assert backend.get(entry_key(entry)) is not None
+
+
+def test_redis_backend_is_shared_and_stores_plain_fields(fake_redis):
+    worker, job_worker = RedisBackend(fake_redis, prefix='t:'), RedisBackend(fake_redis, prefix='t:')
+    cache = ResponseCache(worker)
+
+    hit, generation = cache.get('entry:1')
+    assert hit is None
+    etag, body = cache.store('entry:1', b'{"id": 1}', generation)
+    # The body as sent, next to its etag: nothing to unpickle
+    assert fake_redis.hmget('t:entry:1', 'etag', 'body', 'gen') == [etag.encode(), b'{"id": 1}', b'0']
+    assert job_worker.get('entry:1') == (etag, b'{"id": 1}')
+
+    # An invalidation in any process reaches every other one
+    ResponseCache(job_worker).invalidate('entry:1')
+    assert worker.get('entry:1') is None
+
+    # A fill that read its generation before that invalidation reads as a miss
+    worker.set('entry:1', (etag, b'stale'), generation)
+    assert worker.get('entry:1') is None
+    cache.store('entry:1', b'fresh', cache.get('entry:1')[1])
+    assert job_worker.get('entry:1')[1] == b'fresh'
+
+
+def test_memory_backend_skips_fills_older_than_a_delete():
+    backend = MemoryBackend(max_entries=2, ttl=60)
+    generation = backend.generation('a')
+    backend.delete('b')
+    backend.set('a', 1, generation)
+    assert backend.get('a') is None
+    backend.set('a', 1, backend.generation('a'))
+    backend.set('b', 2)
+    backend.set('c', 3)
+    assert (backend.get('a'), backend.get('b'), backend.get('c')) == (None, 2, 3)
+
+
+@pytest.mark.config(CACHE_BACKEND='none')
+def test_without_a_cache_responses_still_carry_etags(client, entry, count_queries):
+    assert isinstance(response_cache.backend, NullBackend)
+    first = client.get(f'/api/entries/{entry}')
+    with count_queries() as statements:
+        again = client.get(f'/api/entries/{entry}', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and statements
+
+
+def test_memory_cache_is_opt_in(monkeypatch):
+    monkeypatch.delenv('CACHE_BACKEND', raising=False)
+    assert cache_config_from_env()['CACHE_BACKEND'] == 'none'
@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import datetime
+
+
+def all_pages(client, query):
+    # Follows next_cursor to the end; returns every entry in page order
+    entries, cursor = [], None
+    while True:
+        url = f'/api/entries?{query}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        entries += body['entries']
+        cursor = body['next_cursor']
+        if cursor is None:
+            return entries
+
+
+def test_pages_cover_every_entry_newest_first(client, user, make_entries):
+    ids = make_entries(user[0], 23)
+    entries = all_pages(client, 'limit=5')
+    assert [entry['id'] for entry in entries] == ids[::-1]
+
+
+def test_tag_filter_ignores_case(client, user, make_entries):
+    make_entries(user[0], 3, tags=1)
+    make_entries(user[0], 2)
+    for name in ('tag0', 'TAG0', ' Tag0 '):
+        assert len(client.get(f'/api/entries?tag={name}').get_json()['entries']) == 3
+
+
+def test_location_prefix_pages_by_location(client, user, make_entries):
+    make_entries(user[0], 4, location='Paris', start=datetime(2024, 1, 1))
+    make_entries(user[0], 3, location='Parma', start=datetime(2023, 1, 1))
+    make_entries(user[0], 5, location='Rome')
+    entries = all_pages(client, 'location=Par&limit=2')
+    assert [entry['location'] for entry in entries] == ['Parma'] * 3 + ['Paris'] * 4
+    # Newest first within a location
+    assert entries[3]['date'] > entries[6]['date']
+    # Prefixes are case-sensitive, as with PostgreSQL's LIKE
+    assert client.get('/api/entries?location=par').get_json()['entries'] == []
+
+
+def test_cursors_we_did_not_issue_are_rejected(client, user, make_entries):
+    make_entries(user[0], 3)
+    raw = json.dumps([datetime(2024, 1, 3).isoformat(), 3], separators=(',', ':'))
+    without_location = base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+    for cursor in (without_location, 'nonsense'):
+        assert client.get(f'/api/entries?cursor={cursor}').status_code == 400
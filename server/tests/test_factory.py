@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SERVER_DIR, TEST_CONFIG
+from factory import create_app
+from replicas import replica_router
+from tags import tag_index
+from warmup import open_connections, warm_worker
+
+
+def imported_in_fresh_interpreter(statement, modules):
+    # Which of `modules` a fresh `python -c statement` has loaded, run from server/
+    code = f'import sys; {statement}; print(" ".join(m for m in {modules!r} if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-c', code], cwd=SERVER_DIR, capture_output=True, text=True,
+                            env=dict(os.environ, DATABASE_URI='sqlite://'))
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result.stdout.split()
+
+
+def test_importing_the_factory_loads_nothing_else():
+    assert imported_in_fresh_interpreter('import factory', ['flask', 'sqlalchemy', 'models', 'routes']) == []
+
+
+def test_the_web_app_leaves_tooling_out():
+    # Migrations, image processing and S3 belong to `flask db`, the job worker and S3 deployments
+    assert imported_in_fresh_interpreter('import app', ['alembic', 'flask_migrate', 'PIL', 'boto3']) == []
+
+
+def test_config_overrides_the_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv('SYNC_PAGE_SIZE', '7')
+    monkeypatch.setenv('TAG_SUGGEST_SYNC_SECONDS', '9')
+    app = create_app(dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite://', PHOTO_ROOT=str(tmp_path),
+                          TAG_SUGGEST_SYNC_SECONDS=3))
+    assert app.config['SYNC_PAGE_SIZE'] == 7
+    # Extensions read the settings after the overrides
+    assert app.config['TAG_SUGGEST_SYNC_SECONDS'] == 3 and tag_index.sync_seconds == 3
+
+
+def test_create_app_touches_no_database(tmp_path):
+    # Nothing connects until a request needs to; the directory doesn't exist
+    app = create_app(dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'missing' / 'app.db'}",
+                          PHOTO_ROOT=str(tmp_path / 'uploads')))
+    assert not (tmp_path / 'missing').exists()
+    assert 'sqlalchemy' in app.extensions
+
+
+def test_routes_and_commands_are_registered(app):
+    views = {rule.endpoint.split('.')[0] for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+    assert views == {'users', 'entries', 'photos', 'tags', 'sync', 'metrics'}
+    assert {'/api/entries', '/api/tags/suggest', '/api/sync', '/api/users/login'} <= {
+        rule.rule for rule in app.url_map.iter_rules()}
+    assert {'db', 'stats', 'sync', 'geo', 'auth', 'jobs'} <= set(app.cli.commands)
+
+
+def test_warmup_readies_the_worker_before_its_first_request(app, client, user, count_queries):
+    timings = warm_worker(app)
+    assert list(timings) == ['connections', 'token_blocklist', 'tag_index', 'gazetteer', 'password_hasher']
+    # The first suggestion comes from the loaded index; the only query left
+    # is the caller's identity, cached per user
+    with count_queries() as statements:
+        assert client.get('/api/tags/suggest?prefix=a', headers=user[1]).status_code == 200
+    assert len(statements) == 1 and 'FROM users' in statements[0]
+
+
+@pytest.mark.config(WORKER_WARMUP=False)
+def test_warmup_can_be_turned_off(app):
+    assert warm_worker(app) == {}
+    assert not tag_index._loaded
+
+
+def test_open_connections_fills_every_pool(tmp_path):
+    from models import db
+
+    app = create_app(dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+                          REPLICA_DATABASE_URIS=f"sqlite:///{tmp_path / 'replica.db'}",
+                          REPLICA_CHECK_SECONDS=3600, PHOTO_ROOT=str(tmp_path / 'uploads')))
+    with app.app_context():
+        db.create_all(bind_key=None)
+        assert open_connections(3) == 6
+        assert [engine.pool.checkedin() for engine in db.engines.values()] == [3, 3]
+        timings = warm_worker(app)
+        assert 'replicas' in timings and replica_router.replicas[0].checked_at is not None
+        for engine in db.engines.values():
+            engine.dispose()
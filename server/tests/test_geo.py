@@ -0,0 +1,112 @@
+import importlib.util
+import os
+from datetime import datetime
+
+import pytest
+
+import geo
+
+MIGRATION = os.path.join(os.path.dirname(geo.__file__), 'migrations', 'versions',
+                         'b5e1c9d3a7f2_added_entry_coordinates.py')
+
+
+@pytest.fixture
+def place(app):
+    # place(user_id, lat, lng) inserts an entry at that point; returns its id
+    from models import db, Entry
+
+    def make(user_id, latitude, longitude):
+        with app.app_context():
+            entry = Entry(location='Somewhere', date=datetime(2024, 1, 1), description='', user_id=user_id,
+                          latitude=latitude, longitude=longitude, geohash=geo.encode_geohash(latitude, longitude))
+            db.session.add(entry)
+            db.session.commit()
+            return entry.id
+    return make
+
+
+def nearby(client, query):
+    response = client.get(f'/api/entries/nearby?{query}')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_nearby_is_nearest_first_within_the_radius(client, make_user, place):
+    alice, bob = make_user('alice')[0], make_user('bob')[0]
+    # Roughly 0.1, 1, 5 and 50 km north of the centre
+    ids = [place(alice, 48.86 + km / 111.2, 2.35) for km in (5, 0.1, 50, 1)]
+    other = place(bob, 48.86, 2.35)
+
+    body = nearby(client, 'lat=48.86&lng=2.35&radius_km=10')
+    assert [entry['id'] for entry in body['entries']] == [other, ids[1], ids[3], ids[0]]
+    assert body['entries'][2]['distance_km'] == pytest.approx(1, abs=0.01)
+    assert body['truncated'] is False
+    assert [entry['id'] for entry in nearby(client, f'lat=48.86&lng=2.35&radius_km=10&user_id={bob}')['entries']] == [other]
+    assert [entry['id'] for entry in nearby(client, 'lat=48.86&lng=2.35&radius_km=10&limit=2')['entries']] == [other, ids[1]]
+
+
+def test_nearby_stops_at_the_first_full_ring(client, user, place, count_queries):
+    for n in range(5):
+        place(user[0], 48.86 + n * 0.0001, 2.35)
+    place(user[0], 49.5, 2.35)
+
+    # Five entries within a few metres fill limit=5 in the smallest ring
+    with count_queries() as statements:
+        body = nearby(client, 'lat=48.86&lng=2.35&radius_km=100&limit=5')
+    assert len(body['entries']) == 5
+    assert len([s for s in statements if 'FROM entries' in s]) == 1
+
+    # Asking for more widens ring by ring until the radius
+    with count_queries() as statements:
+        body = nearby(client, 'lat=48.86&lng=2.35&radius_km=100&limit=10')
+    assert len(body['entries']) == 6
+    assert len([s for s in statements if 'FROM entries' in s]) == geo.NEARBY_RINGS
+
+
+def test_nearby_reads_a_bounded_number_of_candidates(client, user, place, count_queries, monkeypatch):
+    monkeypatch.setattr(geo, 'NEARBY_CANDIDATES', 5)
+    for n in range(20):
+        place(user[0], 48.86 + n * 0.00001, 2.35)
+
+    with count_queries() as statements:
+        body = nearby(client, 'lat=48.86&lng=2.35&radius_km=10&limit=10')
+    assert body['truncated'] is True
+    assert len(body['entries']) == 5
+    assert len([s for s in statements if 'FROM entries' in s]) == 1
+    assert 'LIMIT' in statements[-1]
+
+
+def test_nearby_rejects_bad_arguments(client):
+    assert client.get('/api/entries/nearby?lat=95&lng=0').status_code == 400
+    assert client.get(f'/api/entries/nearby?lat=0&lng=0&radius_km={geo.MAX_RADIUS_KM + 1}').status_code == 400
+
+
+def test_bbox_across_the_antimeridian(client, user, place):
+    east, west = place(user[0], -17.7, 178.0), place(user[0], -14.3, -170.7)
+    place(user[0], -17.7, 170.0)
+    body = client.get('/api/entries/bbox?min_lat=-20&max_lat=-10&min_lng=175&max_lng=-165').get_json()
+    assert [entry['id'] for entry in body['entries']] == [east, west]
+
+
+def test_nearby_close_to_a_pole_searches_every_longitude(client, user, place):
+    # At 89.42 degrees the 50 km box is more than 360 degrees of longitude wide
+    ids = [place(user[0], 89.42, 10.0), place(user[0], 89.5, -20.0), place(user[0], 89.6, 40.0)]
+    place(user[0], 89.8, -170.0)
+    body = nearby(client, 'lat=89.42&lng=10&radius_km=50')
+    assert [entry['id'] for entry in body['entries']] == ids
+
+
+def test_migration_backfill_does_not_depend_on_geo():
+    # The migration carries its own copies, which must match what geo.py had
+    # when it was written
+    spec = importlib.util.spec_from_file_location('coordinates_migration', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    assert not any(getattr(value, '__module__', None) == 'geo' for value in vars(migration).values())
+    for latitude, longitude in ((48.8566, 2.3522), (-33.8688, 151.2093), (0, 0), (-90, 180)):
+        assert migration.encode_geohash(latitude, longitude) == geo.encode_geohash(latitude, longitude)
+    places = migration._places()
+    assert places == geo._gazetteer()
+    for location in ('Paris', 'Paris, France', 'Louvre, Paris', 'São Paulo', 'Nowhere', ''):
+        assert migration.geocode(location, places) == geo.geocode(location)
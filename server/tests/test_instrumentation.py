@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from instrumentation import StackSampler, clear_metrics_dir, instrumentation
+
+TOKEN = {'Authorization': 'Bearer scrape-token'}
+
+
+def sample(body, line_start):
+    # The value of the first sample line starting with line_start
+    for line in body.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError(f'{line_start} not in /metrics')
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_server_timing_header(client):
+    timing = client.get('/api/entries').headers['Server-Timing']
+    assert timing.startswith('app;dur=') and 'db;dur=' in timing and 'queries' in timing
+
+
+def test_metrics_are_off_without_a_token(client):
+    assert client.get('/metrics').status_code == 404
+
+
+@pytest.mark.config(METRICS_TOKEN='scrape-token')
+def test_metrics_need_the_token(client):
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    client.get('/api/entries')
+    body = client.get('/metrics', headers=TOKEN).get_data(as_text=True)
+    assert sample(body, 'http_request_duration_seconds_count{route="/api/entries",method="GET"}') == 1
+    assert 'db_pool_size{bind="primary"}' in body
+
+
+@pytest.fixture
+def metrics_dir(tmp_path):
+    return str(tmp_path / 'metrics')
+
+
+@pytest.mark.config(METRICS_TOKEN='scrape-token', METRICS_FLUSH_SECONDS=0)
+def test_metrics_dir_sums_every_worker(app, client, metrics_dir, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'metrics_dir', metrics_dir)
+    os.makedirs(metrics_dir)
+    client.get('/api/entries')
+
+    # Snapshots from two other workers, one still running and one exited
+    route = [['/api/entries', 'GET'], [3] + [0] * 11, 0.006, 3]
+    other = {'latency': [route], 'collected': ['# TYPE db_pool_size gauge', 'db_pool_size{bind="primary"} 5']}
+    for pid in (os.getppid(), exited_pid()):
+        with open(os.path.join(metrics_dir, f'{pid}.json'), 'w') as f:
+            json.dump(other, f)
+
+    body = client.get('/metrics', headers=TOKEN).get_data(as_text=True)
+    assert sample(body, 'http_request_duration_seconds_count{route="/api/entries",method="GET"}') == 7
+    assert sample(body, 'http_request_duration_seconds_bucket{route="/api/entries",method="GET",le="0.005"}') >= 6
+    pool_lines = [line for line in body.splitlines() if line.startswith('db_pool_size{')]
+    assert sorted(line.split(',')[0] for line in pool_lines) == sorted(
+        [f'db_pool_size{{pid="{os.getppid()}"', f'db_pool_size{{pid="{os.getpid()}"'])
+    assert body.count('# TYPE db_pool_size gauge') == 1
+
+    clear_metrics_dir(metrics_dir)
+    assert os.listdir(metrics_dir) == []
+
+
+def test_stack_sampler_starts_its_thread_in_the_serving_process(tmp_path):
+    def samplers():
+        return sum(thread.name == 'stack-sampler' for thread in threading.enumerate())
+
+    before = samplers()
+    sampler = StackSampler(str(tmp_path))
+    # Nothing runs yet, so a preloading gunicorn master has no thread to lose
+    assert samplers() == before
+    for _ in range(2):
+        sampler.start()
+        sampler.discard()
+    assert samplers() == before + 1
+    # As after a fork: the child starts its own
+    sampler._thread_pid = exited_pid()
+    sampler.start()
+    sampler.discard()
+    assert samplers() == before + 2
@@ -0,0 +1,114 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from models import db, Job, Tag
+
+calls = []
+
+
+@jobs.job('test.create_tag')
+def create_tag(name):
+    db.session.add(Tag(name=name))
+    jobs.after_commit(lambda: calls.append(('committed', name)))
+
+
+@jobs.job('test.fail', max_attempts=2)
+def fail():
+    calls.append('fail')
+    raise RuntimeError('boom')
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    calls.clear()
+
+
+@pytest.fixture
+def queued(app):
+    app.config['JOBS_EAGER'] = False
+    with app.app_context():
+        yield
+
+
+def job_rows():
+    return db.session.execute(db.select(Job.name, Job.status, Job.attempts).order_by(Job.id)).all()
+
+
+def test_jobs_run_once_committed_with_their_work(queued):
+    assert jobs.enqueue('test.create_tag', {'name': 'a'}, idempotency_key='tag:a')
+    # The same key again is a no-op, so retried writes don't queue twice
+    assert not jobs.enqueue('test.create_tag', {'name': 'a'}, idempotency_key='tag:a')
+    db.session.commit()
+
+    assert jobs.drain() == 1
+    assert job_rows() == [('test.create_tag', 'done', 1)]
+    assert db.session.execute(db.select(Tag.name)).scalars().all() == ['a']
+    assert calls == [('committed', 'a')]
+    assert jobs.drain() == 0
+
+
+def test_rolled_back_writes_leave_no_job(queued):
+    jobs.enqueue('test.create_tag', {'name': 'b'})
+    db.session.rollback()
+    assert jobs.drain() == 0
+
+
+def test_failures_retry_with_backoff_then_fail(queued):
+    jobs.enqueue('test.fail')
+    db.session.commit()
+
+    assert jobs.run_next(retry_base_seconds=60)
+    status, run_at, error = db.session.execute(db.select(Job.status, Job.run_at, Job.last_error)).one()
+    assert status == 'queued' and 'RuntimeError: boom' in error
+    assert run_at > datetime.utcnow() + timedelta(seconds=25)
+    # Not due yet
+    assert not jobs.run_next()
+
+    db.session.execute(db.update(Job).values(run_at=datetime.utcnow()))
+    db.session.commit()
+    assert jobs.run_next()
+    assert job_rows() == [('test.fail', 'failed', 2)]
+    assert calls == ['fail', 'fail']
+
+
+def test_jobs_of_dead_workers_are_claimed_again(queued):
+    jobs.enqueue('test.create_tag', {'name': 'c'})
+    db.session.commit()
+    claimed = jobs.claim(lease_seconds=300)
+    assert claimed.attempts == 1
+    # Still leased by the worker that claimed it
+    assert jobs.claim(lease_seconds=300) is None
+    db.session.execute(db.update(Job).values(locked_at=datetime.utcnow() - timedelta(seconds=301)))
+    db.session.commit()
+    assert jobs.drain(lease_seconds=300) == 1
+    assert job_rows() == [('test.create_tag', 'done', 2)]
+
+
+def test_eager_jobs_run_inline(app):
+    with app.app_context():
+        jobs.enqueue('test.create_tag', {'name': 'd'})
+        db.session.commit()
+        assert job_rows() == [('test.create_tag', 'done', 1)]
+        assert calls == [('committed', 'd')]
+
+
+def test_unknown_jobs_are_refused(queued):
+    with pytest.raises(ValueError):
+        jobs.enqueue('test.missing')
+
+
+def test_photo_root_does_not_depend_on_the_working_directory(monkeypatch, tmp_path):
+    # The web process runs from server/ and the job worker may not; both
+    # must store and find files in the same place
+    from photos import photo_config_from_env
+
+    server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.delenv('PHOTO_ROOT', raising=False)
+    roots = set()
+    for directory in (tmp_path, server_dir):
+        monkeypatch.chdir(directory)
+        roots.add(photo_config_from_env()['PHOTO_ROOT'])
+    assert roots == {os.path.join(server_dir, 'uploads')}
@@ -0,0 +1,61 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+import passwords
+from passwords import PasswordHasher, default_hash_workers, stored_method
+
+
+@pytest.mark.parametrize('method', ['scrypt', 'scrypt:32768:8:1', 'pbkdf2', 'pbkdf2:sha256', 'pbkdf2:sha256:1000'])
+def test_hashes_made_with_the_configured_method_are_current(method):
+    hasher = PasswordHasher(method, max_workers=0)
+    assert not hasher.needs_rehash(generate_password_hash('secret', method))
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+
+
+def test_other_parameters_need_a_rehash():
+    hasher = PasswordHasher('pbkdf2:sha256:2000', max_workers=0)
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'scrypt:16384:8:1'))
+    assert PasswordHasher('scrypt', max_workers=0).needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+
+
+def test_stored_method_matches_werkzeug():
+    assert stored_method('scrypt') == 'scrypt:32768:8:1'
+    assert stored_method('pbkdf2') == 'pbkdf2:sha256:600000'
+    assert stored_method('pbkdf2:sha512') == 'pbkdf2:sha512:600000'
+    for method in ('md5', 'scrypt:1:2', 'pbkdf2:sha256:many', 'pbkdf2:a:1:2'):
+        with pytest.raises(ValueError):
+            stored_method(method)
+
+
+def test_default_workers_share_the_cores_between_web_workers(monkeypatch):
+    monkeypatch.setattr(passwords.os, 'cpu_count', lambda: 8)
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    assert default_hash_workers() == 8
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    assert default_hash_workers() == 2
+    assert PasswordHasher().max_workers == 2
+    monkeypatch.setenv('WEB_CONCURRENCY', '16')
+    assert default_hash_workers() == 1
+
+
+@pytest.mark.config(PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+def test_login_upgrades_outdated_hashes_once(app, client):
+    from models import db, User
+
+    with app.app_context():
+        db.session.add(User(username='bob', email='bob@example.com',
+                            password_hash=generate_password_hash('secret', 'pbkdf2:sha256:500')))
+        db.session.commit()
+
+    def stored_hash():
+        with app.app_context():
+            return db.session.scalar(db.select(User.password_hash).filter_by(username='bob'))
+
+    login = {'username': 'bob', 'password': 'secret'}
+    assert client.post('/api/users/login', json=login).status_code == 200
+    upgraded = stored_hash()
+    assert upgraded.startswith('pbkdf2:sha256:1000$')
+    assert client.post('/api/users/login', json=login).status_code == 200
+    assert stored_hash() == upgraded
+    assert client.post('/api/users/login', json=dict(login, password='wrong')).status_code == 401
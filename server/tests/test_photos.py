@@ -0,0 +1,172 @@
+import hashlib
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import jobs
+from models import db, Job, Photo
+from photos import THUMBNAIL_SIZES, original_key, photo_pipeline, thumbnail_key
+from storage import S3Storage
+
+
+class MissingKey(Exception):
+    # Shaped like botocore's ClientError for a missing object
+    response = {'Error': {'Code': '404'}}
+
+
+class FakeS3:
+    # The slice of the boto3 S3 client S3Storage uses, kept in a dict
+
+    def __init__(self):
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise MissingKey()
+        return {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Bucket, Key] = Body if isinstance(Body, bytes) else Body.read()
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise MissingKey()
+        # Like a StreamingBody, not seekable
+        return {'Body': io.BufferedReader(io.BytesIO(self.objects[Bucket, Key]))}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@pytest.fixture(params=['filesystem', 's3'])
+def storage(request, app, monkeypatch):
+    # The app's photo storage, on local files and on a fake bucket
+    if request.param == 's3':
+        monkeypatch.setattr(photo_pipeline, 'storage', S3Storage(FakeS3(), 'photos', prefix='tj/'))
+    return photo_pipeline.storage
+
+
+def png(width=8, height=4, color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def upload(client, entry_id, headers, data, filename='photo.png'):
+    return client.post(f'/api/entries/{entry_id}/photos', data={'photo': (io.BytesIO(data), filename)},
+                       headers=headers, content_type='multipart/form-data')
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def stored_keys(content_hash, extension='.png'):
+    return [original_key(content_hash, extension)] + [thumbnail_key(content_hash, size) for _, size in THUMBNAIL_SIZES]
+
+
+def test_uploads_are_stored_once_per_content(client, user, make_entries, storage):
+    first_entry, second_entry = make_entries(user[0], 2)
+    data = png()
+    first = upload(client, first_entry, user[1], data)
+    assert first.status_code == 201, first.get_json()
+    second = upload(client, second_entry, user[1], data, filename='copy.jpg')
+    assert second.status_code == 201
+
+    first, second = first.get_json(), second.get_json()
+    assert first['id'] != second['id'] and first['url'] == second['url']
+    key = original_key(content_hash(data), '.png')
+    assert first['url'] == '/media/' + key and storage.exists(key)
+    if isinstance(storage, S3Storage):
+        assert set(storage.client.objects) == {('photos', 'tj/' + name) for name in stored_keys(content_hash(data))}
+
+    download = client.get(f'/api/entries/{second_entry}/photos/{second["id"]}/file', headers=user[1])
+    assert download.status_code == 200 and download.get_data() == data
+    assert download.headers['Content-Type'] == 'image/png'
+
+
+def test_uploads_are_sniffed_and_size_limited(app, client, user, make_entries, storage, monkeypatch):
+    entry_id, = make_entries(user[0], 1)
+    assert upload(client, entry_id, user[1], b'<svg onload="x"/>', filename='a.png').status_code == 400
+    missing = client.post(f'/api/entries/{entry_id}/photos', data={'other': (io.BytesIO(png()), 'a.png')},
+                          headers=user[1], content_type='multipart/form-data')
+    assert missing.status_code == 400
+    monkeypatch.setattr(photo_pipeline, 'max_upload_bytes', 64)
+    assert upload(client, entry_id, user[1], png(200, 200, 'blue') + bytes(100)).status_code == 413
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(Photo)) == 0
+
+
+def test_thumbnails_are_rendered_once_per_content(client, user, make_entries, storage):
+    first_entry, second_entry = make_entries(user[0], 2)
+    data = png(2000, 1000)
+    first = upload(client, first_entry, user[1], data).get_json()
+    thumb_key = thumbnail_key(content_hash(data), 256)
+    assert first['thumbnail_url'] == '/media/' + thumb_key
+    with storage.open(thumb_key) as f:
+        assert Image.open(io.BytesIO(f.read())).size == (256, 128)
+
+    # The same bytes again reuse the rendered files
+    second = upload(client, second_entry, user[1], data).get_json()
+    assert (second['thumbnail_url'], second['preview_url']) == (first['thumbnail_url'], first['preview_url'])
+    thumbnail = client.get(f'/api/entries/{second_entry}/photos/{second["id"]}/file?size=thumbnail',
+                           headers=user[1])
+    assert thumbnail.status_code == 200 and thumbnail.headers['Content-Type'] == 'image/jpeg'
+
+
+def test_files_are_released_with_the_last_photo(app, client, user, make_entries, storage):
+    first_entry, second_entry = make_entries(user[0], 2)
+    data = png(600, 600)
+    first = upload(client, first_entry, user[1], data).get_json()
+    second = upload(client, second_entry, user[1], data).get_json()
+    keys = stored_keys(content_hash(data))
+
+    assert client.delete(f'/api/entries/{first_entry}/photos/{first["id"]}', headers=user[1]).status_code == 200
+    assert all(storage.exists(key) for key in keys)
+    assert client.delete(f'/api/entries/{second_entry}/photos/{second["id"]}', headers=user[1]).status_code == 200
+    assert not any(storage.exists(key) for key in keys)
+
+    # Uploaded again, the thumbnails are rendered again
+    again = upload(client, first_entry, user[1], data).get_json()
+    assert again['thumbnail_url'] is not None and all(storage.exists(key) for key in keys)
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(Job)
+                                 .filter_by(idempotency_key=f'thumbnails:{content_hash(data)}')) == 1
+
+
+def test_upload_racing_a_release_stores_the_file_again(app, client, user, make_entries, monkeypatch):
+    # A release job has seen no photo left for the content and is about to
+    # delete the files when the same bytes are uploaded again
+    entry_id, = make_entries(user[0], 1)
+    data = png()
+    photo = upload(client, entry_id, user[1], data).get_json()
+    key = original_key(content_hash(data), '.png')
+    app.config['JOBS_EAGER'] = False
+    client.delete(f'/api/entries/{entry_id}/photos/{photo["id"]}', headers=user[1])
+
+    checked = threading.Event()
+    in_use = photo_pipeline._in_use
+
+    def slow_in_use(digest):
+        result = in_use(digest)
+        checked.set()
+        time.sleep(0.5)
+        return result
+    monkeypatch.setattr(photo_pipeline, '_in_use', slow_in_use)
+
+    def release():
+        with app.app_context():
+            jobs.run_next()
+    worker = threading.Thread(target=release)
+    worker.start()
+    assert checked.wait(5)
+    again = upload(client, entry_id, user[1], data)
+    worker.join()
+
+    assert again.status_code == 201
+    assert photo_pipeline.storage.exists(key)
+    download = client.get(f'/api/entries/{entry_id}/photos/{again.get_json()["id"]}/file', headers=user[1])
+    assert download.status_code == 200 and download.get_data() == data
@@ -0,0 +1,63 @@
+import pytest
+
+
+def page_queries(client, count_queries, limit):
+    with count_queries() as statements:
+        response = client.get(f'/api/entries?limit={limit}&include=photos,tags')
+    assert response.status_code == 200
+    assert len(response.get_json()['entries']) == limit
+    return statements
+
+
+@pytest.mark.parametrize('photos, tags', [(0, 0), (1, 1), (4, 3)])
+def test_entry_list_query_count_is_flat(client, user, make_entries, count_queries, photos, tags):
+    # One query for the page plus one IN query per embedded relationship,
+    # however many entries the page holds and however many rows they embed
+    make_entries(user[0], 60, photos=photos, tags=tags)
+    counts = {limit: len(page_queries(client, count_queries, limit)) for limit in (1, 10, 50)}
+    assert set(counts.values()) == {3}, counts
+
+
+def test_entry_list_embeds_photos_and_tags(client, user, make_entries):
+    make_entries(user[0], 3, photos=2, tags=2)
+    entries = client.get('/api/entries?include=photos,tags').get_json()['entries']
+    assert [len(entry['photos']) for entry in entries] == [2, 2, 2]
+    assert [[tag['name'] for tag in entry['tags']] for entry in entries] == [['tag0', 'tag1']] * 3
+    assert 'photos' not in client.get('/api/entries').get_json()['entries'][0]
+
+
+def test_entry_detail_query_count_is_flat(client, user, make_entries, count_queries):
+    # The entry, its photos and its tags: three queries for any number of each
+    # (on a response cache miss; a hit runs none)
+    few, = make_entries(user[0], 1, photos=1, tags=1)
+    many, = make_entries(user[0], 1, photos=20, tags=8)
+    client.get('/api/users/profile', headers=user[1])  # loads the token user into the identity cache
+    counts = []
+    for entry_id in (few, many):
+        with count_queries() as statements:
+            response = client.get(f'/api/entries/{entry_id}', headers=user[1])
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts == [3, 3]
+    assert len(response.get_json()['photos']) == 20
+
+
+def test_tag_links_are_written_by_primary_key(client, user, make_entries, count_queries):
+    entry_id, = make_entries(user[0], 1, tags=8)
+    tag_id = client.post('/api/tags', json={'name': 'new'}, headers=user[1]).get_json()['id']
+
+    with count_queries() as added:
+        assert client.post(f'/api/entries/{entry_id}/tags', json={'tag_id': tag_id},
+                           headers=user[1]).status_code == 200
+    # Adding the same link again changes nothing
+    with count_queries() as again:
+        assert client.post(f'/api/entries/{entry_id}/tags', json={'tag_id': tag_id},
+                           headers=user[1]).status_code == 200
+    with count_queries() as removed:
+        assert client.delete(f'/api/entries/{entry_id}/tags/{tag_id}', headers=user[1]).status_code == 204
+
+    for statements in (added, again, removed):
+        # Never loads the entry's tag collection to test membership
+        assert not any('FROM tags, entry_tags' in s or 'JOIN entry_tags' in s for s in statements), statements
+    tags = client.get(f'/api/entries/{entry_id}', headers=user[1]).get_json()['tags']
+    assert tag_id not in [tag['id'] for tag in tags] and len(tags) == 8
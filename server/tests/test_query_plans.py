@@ -0,0 +1,42 @@
+import pytest
+
+from benchmarks.query_plans import check, issues, seed, shape
+
+
+@pytest.fixture
+def seeded(app):
+    # The check's data set, scaled down. Much below this, SQLite rightly
+    # prefers reading the 50 tags to probing entry_tags by entry
+    from models import db
+
+    with app.app_context():
+        seed(2000)
+        db.session.remove()
+    return app
+
+
+@pytest.mark.config(JOBS_EAGER=False)
+def test_routes_scan_no_whole_tables_and_repeat_no_statements(seeded):
+    results = check(seeded)
+    assert [(label, found) for label, _, _, found, _ in results if found] == []
+    failed = [(label, status) for label, status, _, _, _ in results if status != '' and status >= 400]
+    assert failed == []
+    # The uploaded photo's scenarios ran too (Pillow is installed here)
+    assert 'jobs: render thumbnails' in [label for label, _, _, _, _ in results]
+
+
+def test_checker_flags_full_scans_and_repeated_statements(app):
+    from models import db
+
+    with app.app_context():
+        found, plans = issues('GET /x', [('SELECT entries.id FROM entries WHERE entries.description = ?', ('a',))])
+        assert found == ['full scan of entries: SELECT entries.id FROM entries WHERE entries.description = ?']
+        assert 'SCAN entries' in plans[0]
+        assert issues('GET /api/tags', [('SELECT tags.id, tags.name FROM tags', ())])[0] == []
+
+        by_id = 'SELECT photos.id FROM photos WHERE photos.entry_id IN ({})'
+        batched = [(by_id.format(', '.join('?' * n)), tuple(range(n))) for n in (1, 2, 3)]
+        assert shape(batched[0][0]) == shape(batched[2][0])
+        assert issues('GET /y', batched[:2])[0] == []
+        assert issues('GET /y', batched)[0] == [f'N+1: 3 x {shape(batched[0][0])}']
+        db.session.remove()
@@ -0,0 +1,130 @@
+from contextlib import ExitStack
+
+import pytest
+
+from ratelimit import (MemoryRateBackend, RedisRateBackend, RateLimited, Overloaded, admission, parse_rate,
+                       rate_limiter, sliding_window)
+
+
+def test_parse_rate():
+    assert parse_rate('10/minute') == (10, 60)
+    assert parse_rate(' 100 / 2hours ') == (100, 7200)
+    with pytest.raises(ValueError):
+        parse_rate('ten a minute')
+    # Empty limits and periods would divide by zero in sliding_window
+    for rate in ('0/minute', '5/0hours'):
+        with pytest.raises(ValueError):
+            parse_rate(rate)
+
+
+def test_sliding_window_weighs_the_previous_window():
+    # Halfway through a window, half of the previous window's 10 still count
+    assert sliding_window(4, 10, 30, 60, 10) == (True, 0)
+    allowed, retry_after = sliding_window(5, 10, 30, 60, 10)
+    assert not allowed and retry_after > 0
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def backend(request, fake_redis):
+    return RedisRateBackend(fake_redis) if request.param == 'redis' else MemoryRateBackend()
+
+
+def test_backends_allow_the_limit_per_key(backend):
+    now = 1000 * 60.0
+    assert [backend.hit('a', 3, 60, now)[0] for _ in range(4)] == [True, True, True, False]
+    # Other keys have their own allowance
+    assert backend.hit('b', 3, 60, now)[0]
+    # A rejected request doesn't use up the allowance; two windows later all is forgotten
+    assert backend.hit('a', 3, 60, now + 120)[0]
+
+
+def test_redis_backend_shares_counts_between_processes(fake_redis):
+    workers = [RedisRateBackend(fake_redis), RedisRateBackend(fake_redis)]
+    now = 1000 * 60.0
+    assert [workers[n % 2].hit('a', 4, 60, now)[0] for n in range(6)] == [True] * 4 + [False] * 2
+
+
+@pytest.mark.config(RATELIMIT_ENABLED=True, RATELIMIT_AUTH='2/minute')
+def test_login_limit_is_per_client(client):
+    def login(address):
+        return client.post('/api/users/login', json={'username': 'x', 'password': 'y'},
+                           environ_base={'REMOTE_ADDR': address}).status_code
+
+    assert [login('10.0.0.1') for _ in range(3)] == [401, 401, 429]
+    assert login('10.0.0.2') == 401
+
+
+@pytest.mark.config(RATELIMIT_ENABLED=True, RATELIMIT_AUTH='2/minute', PROXY_FIX_X_FOR=1)
+def test_clients_behind_a_trusted_proxy_are_told_apart(client):
+    def login(forwarded_for):
+        # Every request arrives from the proxy's address
+        response = client.post('/api/users/login', json={'username': 'x', 'password': 'y'},
+                               headers={'X-Forwarded-For': forwarded_for}, environ_base={'REMOTE_ADDR': '10.0.0.9'})
+        return response.status_code
+
+    assert [login('203.0.113.1') for _ in range(3)] == [401, 401, 429]
+    # Only the hop the proxy added counts; a client-supplied value before it doesn't
+    assert login('198.51.100.7, 203.0.113.2') == 401
+    assert login('198.51.100.7, 203.0.113.1') == 429
+
+
+@pytest.mark.config(RATELIMIT_ENABLED=True, RATELIMIT_AUTH='2/minute')
+def test_forwarded_for_is_ignored_without_a_trusted_proxy(client):
+    statuses = [client.post('/api/users/login', json={'username': 'x', 'password': 'y'},
+                            headers={'X-Forwarded-For': f'203.0.113.{n}'}).status_code for n in range(3)]
+    assert statuses == [401, 401, 429]
+
+
+@pytest.mark.config(RATELIMIT_ENABLED=True, RATELIMIT_ANONYMOUS_READ='2/minute')
+def test_anonymous_reads_are_limited(client, user):
+    assert [client.get('/api/entries').status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get('/api/entries').headers['Retry-After'].isdigit()
+    assert client.get('/api/entries', headers=user[1]).status_code == 200
+
+
+def test_admission_sheds_when_full(app, client):
+    admission.max_inflight, admission.max_queue, admission.queue_timeout = 1, 0, 0.0
+    with admission.slot():
+        response = client.get('/api/entries')
+        assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+        with pytest.raises(Overloaded):
+            with admission.slot(wait=False):
+                pass
+    assert client.get('/api/entries').status_code == 200
+
+
+def test_admission_caps_slots_per_client(app, client):
+    admission.clients.limit = 2
+    with ExitStack() as stack:
+        for _ in range(2):
+            stack.enter_context(admission.clients.acquire('10.0.0.1'))
+        assert client.get('/api/entries', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 429
+        assert client.get('/api/entries', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+
+
+@pytest.mark.config(RATELIMIT_ENABLED=True, RATELIMIT_ANONYMOUS_READ='2/minute', PROXY_FIX_X_FOR=1)
+def test_asgi_routes_are_limited_like_flask(asgi_get, user):
+    def get(forwarded_for, headers=None):
+        return asgi_get('/api/entries', dict(headers or {}, **{'X-Forwarded-For': forwarded_for}))
+
+    statuses = [get('203.0.113.1')[0] for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert get('203.0.113.1')[1]['retry-after'].isdigit()
+    assert get('203.0.113.2')[0] == 200
+    assert get('203.0.113.1', user[1])[0] == 200
+
+
+def test_asgi_routes_go_through_admission(asgi_get, user):
+    admission.max_inflight, admission.max_queue = 1, 10
+    with admission.slot():
+        status, headers, _ = asgi_get('/api/tags', user[1])
+    assert status == 503 and headers['retry-after'] == '1'
+    assert asgi_get('/api/tags', user[1])[0] == 200
+
+
+def test_rate_limiter_raises_with_retry_after(app):
+    app.config.update(RATELIMIT_ENABLED=True, RATELIMIT_HEAVY='1/minute')
+    rate_limiter.check('RATELIMIT_HEAVY', 'user:1')
+    with pytest.raises(RateLimited) as error:
+        rate_limiter.check('RATELIMIT_HEAVY', 'user:1')
+    assert error.value.retry_after >= 1
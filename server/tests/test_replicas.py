@@ -0,0 +1,116 @@
+import shutil
+
+import pytest
+
+from conftest import TEST_CONFIG
+from replicas import WRITE_HEADER, replica_router
+
+
+@pytest.fixture
+def app(tmp_path):
+    # A primary and one replica, both SQLite files; replicate() copies the
+    # primary over the replica, and in between the replica lags behind
+    from factory import create_app
+    from models import db
+
+    app = create_app(dict(TEST_CONFIG, SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+                          REPLICA_DATABASE_URIS=f"sqlite:///{tmp_path / 'replica.db'}",
+                          REPLICA_CHECK_SECONDS=3600, PHOTO_ROOT=str(tmp_path / 'uploads')))
+    with app.app_context():
+        db.create_all(bind_key=None)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def replicate(app, tmp_path):
+    from models import db
+
+    def copy():
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+            shutil.copy(tmp_path / 'primary.db', tmp_path / 'replica.db')
+            replica_router.check()
+        assert replica_router.replicas[0].usable(replica_router.max_lag)
+    return copy
+
+
+def listed(app, headers=None):
+    # Entry ids from GET /api/entries, on a client without cookies
+    response = app.test_client().get('/api/entries', headers=headers or {})
+    assert response.status_code == 200, response.get_json()
+    return [entry['id'] for entry in response.get_json()['entries']]
+
+
+def test_writers_read_their_own_writes_on_any_worker(app, make_user, make_entries, replicate, count_queries):
+    alice, bob = make_user('alice'), make_user('bob')
+    old = make_entries(alice[0], 1)
+    replicate()
+
+    response = app.test_client().post('/api/entries', json={'location': 'Rome', 'date': '2024-02-01'},
+                                      headers=alice[1])
+    created, token = response.get_json()['id'], response.headers[WRITE_HEADER]
+    # Anyone else reads the lagging replica, even holding Alice's token
+    assert listed(app) == old
+    assert listed(app, dict(bob[1], **{WRITE_HEADER: token})) == old
+    # Alice's client sends the token back and reads the primary; checking it
+    # takes no query (the health checker's reads of changes aside)
+    with count_queries() as statements:
+        assert listed(app, dict(alice[1], **{WRITE_HEADER: token})) == [created] + old
+    statements = [statement for statement in statements if 'FROM changes' not in statement]
+    assert len(statements) == 1 and 'FROM entries' in statements[0]
+
+    # Once the sticky window has passed, her reads go back to the replica
+    replica_router.sticky_seconds = 0
+    assert listed(app, dict(alice[1], **{WRITE_HEADER: token})) == old
+    assert replica_router.routed['replica1'] == 3 and replica_router.routed['primary'] == 1
+
+
+def test_only_writes_that_change_rows_hand_out_tokens(app, user, make_entries, replicate):
+    entry_id, = make_entries(user[0], 1)
+    replicate()
+    client = app.test_client()
+    tag = client.post('/api/tags', json={'name': 'food'}, headers=user[1])
+    assert tag.status_code == 201 and WRITE_HEADER in tag.headers
+    for response in (
+        client.put('/api/entries/999', json={}, headers=user[1]),  # failed
+        client.post('/api/tags', json={'name': 'FOOD'}, headers=user[1]),  # already there
+        client.delete(f"/api/entries/{entry_id}/tags/{tag.get_json()['id']}", headers=user[1]),  # nothing linked
+        client.post('/api/users/reset-password', json={}),  # anonymous
+    ):
+        assert WRITE_HEADER not in response.headers, response.request.path
+
+
+@pytest.mark.parametrize('token', ['forged', 'tampered'])
+def test_forged_tokens_are_ignored(app, user, make_entries, replicate, token):
+    make_entries(user[0], 1)
+    replicate()
+    if token == 'tampered':
+        # This user's id under the signature made for another
+        with app.test_request_context():
+            value, signature = replica_router.write_token(user[0] + 1).rsplit('.', 1)
+        token = f"{user[0]}:{value.split(':', 1)[1]}.{signature}"
+    listed(app, dict(user[1], **{WRITE_HEADER: token}))
+    assert replica_router.routed['primary'] == 0
+
+
+def test_new_users_authenticate_against_the_primary(app, make_user, replicate):
+    replicate()
+    carol = make_user('carol')  # not on the replica yet
+    client = app.test_client()
+    assert client.get('/api/users/profile', headers=carol[1]).get_json()['username'] == 'carol'
+    assert client.get('/api/entries', headers=carol[1]).status_code == 200
+
+
+def test_revocations_are_checked_on_the_primary(app, user, replicate):
+    replicate()
+    replica_router.sticky_seconds = 0
+    client = app.test_client()
+    assert client.post('/api/users/logout', headers=user[1]).status_code == 200
+    # The replica has no revoked_tokens row, so asking it would let the token in
+    assert client.get('/api/users/profile', headers=user[1]).status_code == 401
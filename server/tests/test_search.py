@@ -0,0 +1,96 @@
+import importlib.util
+import os
+
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import text
+
+import search
+
+MIGRATION = os.path.join(os.path.dirname(search.__file__), 'migrations', 'versions',
+                         'a1d7c3e9f520_entries_fts_update_columns.py')
+
+
+def found(client, q, **params):
+    response = client.get('/api/entries/search', query_string=dict(params, q=q))
+    assert response.status_code == 200, response.get_json()
+    return [entry['id'] for entry in response.get_json()['entries']]
+
+
+def test_search_ranks_location_above_description(client, user):
+    in_description = client.post('/api/entries', json={'location': 'Oslo', 'date': '2024-01-01',
+                                                       'description': 'A day trip to Bergen'}, headers=user[1])
+    in_location = client.post('/api/entries', json={'location': 'Bergen', 'date': '2024-01-02',
+                                                    'description': 'Rain'}, headers=user[1])
+    assert found(client, 'bergen') == [in_location.get_json()['id'], in_description.get_json()['id']]
+    # The last word is a prefix, and FTS5 syntax in the query is quoted away
+    assert found(client, 'Berg') == found(client, 'bergen')
+    assert found(client, 'bergen OR NOT "') == []
+    assert client.get('/api/entries/search').status_code == 400
+
+
+def test_search_follows_updates_and_deletes(client, user):
+    entry_id = client.post('/api/entries', json={'location': 'Lyon', 'date': '2024-01-01',
+                                                 'description': 'Old text'}, headers=user[1]).get_json()['id']
+    client.put(f'/api/entries/{entry_id}', json={'description': 'Fresh text'}, headers=user[1])
+    assert found(client, 'old') == []
+    assert found(client, 'fresh') == [entry_id]
+    client.delete(f'/api/entries/{entry_id}', headers=user[1])
+    assert found(client, 'fresh') == []
+
+
+def test_update_trigger_fires_only_for_indexed_columns(app):
+    from models import db
+
+    with app.app_context():
+        trigger = db.session.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'entries_fts_au'")).scalar()
+    assert 'AFTER UPDATE OF location, description ON entries' in trigger
+
+
+def test_trigger_migration_recreates_the_trigger(app):
+    from models import db
+
+    spec = importlib.util.spec_from_file_location('fts_trigger_migration', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    def trigger_sql(connection):
+        return connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'entries_fts_au'")).scalar()
+
+    with app.app_context(), db.engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.downgrade()
+            assert 'AFTER UPDATE ON entries' in trigger_sql(connection)
+            migration.upgrade()
+            assert 'AFTER UPDATE OF location, description ON entries' in trigger_sql(connection)
+
+
+@pytest.mark.filterwarnings('ignore:.*expression-based index')
+@pytest.mark.parametrize('hook, expected', [(None, True), (search.include_object, False)])
+def test_autogenerate_leaves_search_objects_alone(app, hook, expected):
+    # create_all builds entries_fts and its shadow tables through the
+    # after_create DDL; without the hook autogenerate would drop them
+    from models import db
+
+    with app.app_context(), db.engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={'include_object': hook} if hook else {})
+        diff = compare_metadata(context, db.metadata)
+    dropped = [op[1].name for op in diff if op[0] == 'remove_table']
+    assert any(name.startswith('entries_fts') for name in dropped) is expected
+    if hook:
+        assert diff == []
+
+
+def test_include_object_skips_postgres_search_schema(app):
+    from models import db
+
+    # PostgreSQL-only schema, so it can't be reflected here
+    entries = db.metadata.tables['entries']
+    assert search.include_object(entries.c.location, 'search_vector', 'column', True, None) is False
+    assert search.include_object(entries.c.location, 'location', 'column', True, None) is True
+    assert search.include_object(None, 'ix_entries_search_vector', 'index', True, None) is False
+    assert search.include_object(None, 'ix_entries_location_date_id', 'index', True, None) is True
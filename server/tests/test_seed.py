@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import func, select
+
+import seed
+from geo import encode_geohash
+from models import db, Change, Entry, EntryTag, Photo, Tag, User, UserStats
+
+
+def counts():
+    return {model.__tablename__: db.session.scalar(select(func.count()).select_from(model))
+            for model in (User, Entry, Photo, EntryTag)}
+
+
+def generated(app, users=30, **options):
+    # generate() in the app, then a fingerprint of the rows it wrote
+    with app.app_context():
+        totals = seed.generate(users, tags=20, workers=2, **options)
+        entries = db.session.execute(
+            select(Entry.id, Entry.user_id, Entry.location, Entry.date, Entry.description).order_by(Entry.id)
+        ).all()
+        return totals, entries
+
+
+def test_generated_rows_are_counted_and_consistent(app):
+    totals, entries = generated(app, seed=3)
+    with app.app_context():
+        assert totals == counts()
+        assert totals['users'] == 30 and totals['entries'] == len(entries) > 30
+        assert totals['photos'] > 0 and totals['entry_tags'] > 0
+        assert db.session.scalar(select(func.count()).select_from(Tag)) == 20
+
+        # Every entry is placed, and its geohash matches its coordinates
+        for latitude, longitude, geohash in db.session.execute(select(Entry.latitude, Entry.longitude, Entry.geohash)):
+            assert -90 <= latitude <= 90 and -180 <= longitude < 180
+            assert geohash == encode_geohash(latitude, longitude)
+
+        # Summary tables and the change log are rebuilt for the bulk-loaded rows
+        assert db.session.scalar(select(func.sum(UserStats.entry_count))) == totals['entries']
+        assert db.session.scalar(select(func.sum(UserStats.photo_count))) == totals['photos']
+        assert db.session.scalar(select(func.count()).select_from(Change)
+                                 .where(Change.kind == 'entry')) == totals['entries']
+
+
+def test_tags_are_zipf_distributed(app):
+    generated(app, users=60, seed=5, tags_per_entry=3)
+    with app.app_context():
+        uses = db.session.execute(select(EntryTag.tag_id, func.count()).group_by(EntryTag.tag_id)
+                                  .order_by(EntryTag.tag_id)).all()
+    # The first tag is the most popular, and far ahead of the tail
+    first, tail = uses[0][1], max(count for _, count in uses[10:])
+    assert first == max(count for _, count in uses) and first > 3 * tail
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_the_same_seed_gives_the_same_data(app, tmp_path_factory, workers):
+    from factory import create_app
+    from conftest import TEST_CONFIG
+
+    other = create_app(dict(TEST_CONFIG, PHOTO_ROOT=str(tmp_path_factory.mktemp('other')),
+                            SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path_factory.mktemp('db') / 'other.db'}"))
+    _, entries = generated(app, seed=7)
+    with other.app_context():
+        seed.generate(30, tags=20, workers=workers, seed=7)
+        assert db.session.execute(
+            select(Entry.id, Entry.user_id, Entry.location, Entry.date, Entry.description).order_by(Entry.id)
+        ).all() == entries
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_generated_users_are_appended_and_can_log_in(app, client, make_user):
+    existing = make_user('alice')[0]
+    generated(app, users=5, seed=1)
+    generated(app, users=5, seed=1)
+    with app.app_context():
+        usernames = db.session.scalars(select(User.username).order_by(User.id)).all()
+        assert usernames == ['alice'] + [f'user{existing + n}' for n in range(1, 11)]
+    response = client.post('/api/users/login', json={'username': usernames[-1], 'password': 'password'})
+    assert response.status_code == 200
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import stats
+
+
+def timeline(client, user_id, **params):
+    response = client.get('/api/entries/timeline', query_string=dict(params, user_id=user_id))
+    assert response.status_code == 200, response.get_json()
+    return [(bucket['start'], bucket['count'], bucket['entry_ids']) for bucket in response.get_json()['buckets']]
+
+
+@pytest.mark.parametrize('rollup', [True, False])
+def test_buckets_count_entries_and_sample_the_first_ids(app, client, user, make_entries, rollup):
+    app.config['TIMELINE_ROLLUP'] = rollup
+    # Every 10 days from 2024-01-01 (a Monday) to 2024-04-20, listed out of order
+    late = make_entries(user[0], 6, start=datetime(2024, 3, 2), step=timedelta(days=10))
+    early = make_entries(user[0], 6, start=datetime(2024, 1, 1), step=timedelta(days=10))
+    ids = early + late
+
+    assert timeline(client, user[0], granularity='month', ids=2) == [
+        ('2024-01-01', 4, ids[0:2]), ('2024-02-01', 2, ids[4:6]), ('2024-03-01', 3, ids[6:8]),
+        ('2024-04-01', 3, ids[9:11]),
+    ]
+    assert timeline(client, user[0], granularity='year', ids=1) == [('2024-01-01', 12, ids[:1])]
+    assert timeline(client, user[0], granularity='week', ids=1, date_to='2024-01-14') == [
+        ('2024-01-01', 1, ids[:1]), ('2024-01-08', 1, ids[1:2]),
+    ]
+
+
+def test_samples_stay_inside_the_date_range(client, user, make_entries):
+    ids = make_entries(user[0], 30, start=datetime(2024, 1, 1))
+    # January, from the 11th: the month's first ids are outside the range
+    assert timeline(client, user[0], granularity='month', ids=3, date_from='2024-01-11') == [
+        ('2024-01-01', 20, ids[10:13]),
+    ]
+    assert timeline(client, user[0], granularity='day', ids=0, date_from='2024-01-29') == [
+        ('2024-01-29', 1, []), ('2024-01-30', 1, []),
+    ]
+
+
+def test_samples_read_only_the_returned_buckets(app, client, user, make_user, make_entries):
+    # Index range scans per bucket, never a pass over all the user's entries
+    from sqlalchemy import event
+    from models import db
+
+    make_entries(make_user('bob')[0], 50)
+    make_entries(user[0], 200, start=datetime(2023, 1, 1))
+    make_entries(user[0], 3, start=datetime(2024, 6, 1))
+
+    executed = []
+    with app.app_context():
+        engine = db.engine
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        assert timeline(client, user[0], granularity='month', ids=2, date_from='2024-06-01')[0][1] == 3
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+    statement, parameters = executed[-1]
+    assert 'row_number' not in statement.lower() and 'LIMIT' in statement
+    with engine.connect() as connection:
+        plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+    assert not any(step.startswith('SCAN entries') for step in plan), plan
+    assert any('ix_entries_user_id_date_id' in step for step in plan), plan
+
+
+def test_sample_statements_are_batched(client, user, make_entries, count_queries, monkeypatch):
+    monkeypatch.setattr(stats, 'TIMELINE_SAMPLE_BATCH', 4)
+    ids = make_entries(user[0], 10)
+    with count_queries() as statements:
+        buckets = timeline(client, user[0], granularity='day', ids=1)
+    assert [entry_ids for _, _, entry_ids in buckets] == [[entry_id] for entry_id in ids]
+    assert sum('UNION ALL' in statement or 'LIMIT' in statement for statement in statements) == 3
+
+
+def test_profile_stats_keep_top_tags_in_range(client, user, make_entries):
+    make_entries(user[0], 3, tags=3)
+
+    def top_tags(top):
+        response = client.get('/api/users/profile/stats', query_string={'top': top}, headers=user[1])
+        assert response.status_code == 200
+        return len(response.get_json()['top_tags'])
+
+    # SQLite reads LIMIT -1 as no limit at all, and PostgreSQL rejects it
+    assert [top_tags(top) for top in (-1, 0, 2, 1000)] == [1, 1, 2, 3]
@@ -0,0 +1,120 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import sync
+from models import db, Change, Entry
+
+
+def changes(client, headers, since=None, limit=None):
+    params = {key: value for key, value in (('since', since), ('limit', limit)) if value is not None}
+    response = client.get('/api/sync', query_string=params, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def ids(result, collection):
+    return [item['id'] for item in result[collection]]
+
+
+@pytest.fixture
+def journal(client, user):
+    # An entry with a photo and a tag, written through the API
+    headers = user[1]
+    entry_id = client.post('/api/entries', json={'location': 'Paris', 'date': '2024-01-01'},
+                           headers=headers).get_json()['id']
+    photo_id = client.post(f'/api/entries/{entry_id}/photos', json={'url': 'http://example.com/a.jpg'},
+                           headers=headers).get_json()['id']
+    tag_id = client.post('/api/tags', json={'name': 'food'}, headers=headers).get_json()['id']
+    client.post(f'/api/entries/{entry_id}/tags', json={'tag_id': tag_id}, headers=headers)
+    return entry_id, photo_id, tag_id
+
+
+def test_first_sync_returns_the_journal_and_then_only_changes(client, user, make_user, journal):
+    entry_id, photo_id, tag_id = journal
+    first = changes(client, user[1])
+    assert (ids(first, 'entries'), ids(first, 'photos'), ids(first, 'tags')) == ([entry_id], [photo_id], [tag_id])
+    assert first['entry_tags'] == [{'entry_id': entry_id, 'tag_id': tag_id}]
+    assert first['photos'][0]['entry_id'] == entry_id and not first['has_more']
+    assert changes(client, user[1], first['next'])['entries'] == []
+
+    # Someone else's writes stay out of the feed; shared tags come through
+    bob = make_user('bob')
+    client.post('/api/entries', json={'location': 'Oslo', 'date': '2024-02-01'}, headers=bob[1])
+    bob_tag = client.post('/api/tags', json={'name': 'fjords'}, headers=bob[1]).get_json()['id']
+    client.put(f'/api/entries/{entry_id}', json={'description': 'Louvre'}, headers=user[1])
+    client.delete(f'/api/entries/{entry_id}/photos/{photo_id}', headers=user[1])
+
+    delta = changes(client, user[1], first['next'])
+    assert [entry['description'] for entry in delta['entries']] == ['Louvre']
+    assert ids(delta, 'tags') == [bob_tag] and delta['photos'] == []
+    assert delta['deleted'] == {'entries': [], 'photos': [photo_id], 'tags': [], 'entry_tags': []}
+
+
+def test_deletes_leave_tombstones_for_what_went_with_them(client, user, journal):
+    entry_id, photo_id, tag_id = journal
+    token = changes(client, user[1])['next']
+    client.delete(f'/api/tags/{tag_id}', headers=user[1])
+    client.delete(f'/api/entries/{entry_id}', headers=user[1])
+
+    delta = changes(client, user[1], token)
+    assert delta['deleted'] == {'entries': [entry_id], 'photos': [photo_id], 'tags': [tag_id],
+                                'entry_tags': [{'entry_id': entry_id, 'tag_id': tag_id}]}
+    assert (delta['entries'], delta['photos'], delta['tags'], delta['entry_tags']) == ([], [], [], [])
+
+
+def test_pages_deliver_every_change_once(client, user, make_entries):
+    created = make_entries(user[0], 7, photos=1)
+    seen, token, pages = [], None, 0
+    while True:
+        page = changes(client, user[1], token, limit=3)
+        seen += ids(page, 'entries') + [('photo', photo_id) for photo_id in ids(page, 'photos')]
+        token, pages = page['next'], pages + 1
+        if not page['has_more']:
+            break
+    assert pages == 5
+    assert sorted(item for item in seen if isinstance(item, int)) == created
+    assert len(seen) == len(set(seen)) == 14
+
+
+def test_rolled_back_writes_log_nothing(app, user):
+    with app.app_context():
+        entry = Entry(location='Rome', date=datetime(2024, 1, 1), user_id=user[0])
+        db.session.add(entry)
+        db.session.flush()
+        sync.entries_saved([entry.id], user[0])
+        db.session.rollback()
+        db.session.add(Change(kind='tag', object_id=1, deleted=False, changed_at=datetime.utcnow()))
+        db.session.commit()
+        assert db.session.scalars(db.select(Change.kind)).all() == ['tag']
+
+
+def test_bad_and_expired_tokens(client, user):
+    assert client.get('/api/sync?since=not-a-token', headers=user[1]).status_code == 400
+    expired = sync.encode_token(0, time.time() - 31 * 86400)
+    assert client.get(f'/api/sync?since={expired}', headers=user[1]).status_code == 410
+    assert sync.decode_token(sync.encode_token(42, 1700000000)) == (42, 1700000000)
+    assert client.get('/api/sync').status_code == 401
+
+
+def test_compaction_keeps_the_latest_change_per_object(app, client, user, journal):
+    entry_id, photo_id, _ = journal
+    for n in range(3):
+        client.put(f'/api/entries/{entry_id}', json={'description': f'Edit {n}'}, headers=user[1])
+    client.delete(f'/api/entries/{entry_id}/photos/{photo_id}', headers=user[1])
+    before = changes(client, user[1])
+    before.pop('next')
+
+    with app.app_context():
+        assert sync.compact(30) == 4  # three older entry edits, the photo's insert
+        after = changes(client, user[1])
+        after.pop('next')
+        assert after == before
+
+        # Tombstones past the retention window go too
+        db.session.execute(db.update(Change).where(Change.deleted.is_(True))
+                           .values(changed_at=datetime.utcnow() - timedelta(days=31)))
+        db.session.commit()
+        assert sync.compact(30) == 1
+    assert changes(client, user[1])['deleted']['photos'] == []
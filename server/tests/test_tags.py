@@ -0,0 +1,177 @@
+import importlib.util
+import os
+import random
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import text
+
+import sync
+import tags
+from models import db, Tag
+from tags import PrefixIndex, tag_index, tag_key
+
+MIGRATION = os.path.join(os.path.dirname(tags.__file__), 'migrations', 'versions', 'd9f2b6e4a815_added_tag_key.py')
+
+
+def expected(tag_rows, prefix, limit):
+    # What suggest() should return, worked out the slow way
+    key = tag_key(prefix)
+    matches = [(tag_id, name, count) for tag_id, (name, count) in tag_rows.items() if tag_key(name).startswith(key)]
+    matches.sort(key=lambda row: (-row[2], tag_key(row[1]), row[0]))
+    return [{"id": tag_id, "name": name, "count": count} for tag_id, name, count in matches[:limit]]
+
+
+@pytest.mark.parametrize('scan_limit', [0, 3, 1000])
+def test_prefix_index_matches_a_full_scan_through_updates(monkeypatch, scan_limit):
+    # scan_limit 0 answers every prefix from the patched top lists, kept
+    # short here so they fill up and overflow
+    monkeypatch.setattr(tags, 'SUGGEST_MAX_LIMIT', 4)
+    rng = random.Random(scan_limit)
+    names = ['Paris', 'park', 'Parma', 'PARADE', 'pasta', 'pastry', 'Peru', 'ski', 'Skiing', 'snow', 'sun']
+    rows = {tag_id: (name, rng.randrange(5)) for tag_id, name in enumerate(names, 1)}
+    index = PrefixIndex(scan_limit)
+    index.load([(tag_id, name, count) for tag_id, (name, count) in rows.items()])
+    prefixes = ['', 'p', 'P', 'pa', 'par', 'pas', 's', 'ski', 'x']
+
+    for step in range(400):
+        action = rng.random()
+        tag_id = rng.randrange(1, len(names) + 6)
+        if action < 0.8 and tag_id in rows:
+            rows[tag_id] = (rows[tag_id][0], max(rows[tag_id][1] + rng.choice((-2, -1, 1, 2)), 0))
+            index.upsert(tag_id, *rows[tag_id])
+        elif action < 0.95:
+            rows[tag_id] = (rng.choice(['pa', 'Sk', 'po']) + str(step), rng.randrange(4))
+            index.upsert(tag_id, *rows[tag_id])
+        else:
+            rows.pop(tag_id, None)
+            index.remove(tag_id)
+        prefix = rng.choice(prefixes)
+        assert index.suggest(prefix, 3) == expected(rows, prefix, 3), (step, prefix)
+    assert len(index) == len(rows)
+
+
+def test_lookup_ignores_case_and_width():
+    index = PrefixIndex()
+    index.load([(1, 'Café', 0), (2, 'ＮＹＣ', 0)])
+    assert index.lookup('CAFÉ') == 1 and index.lookup(' nyc ') == 2 and index.lookup('caf') is None
+    assert index.suggest('ny') == [{"id": 2, "name": 'ＮＹＣ', "count": 0}]
+
+
+def suggest(client, headers, prefix, limit=10):
+    response = client.get('/api/tags/suggest', query_string={'prefix': prefix, 'limit': limit}, headers=headers)
+    assert response.status_code == 200
+    return [(tag['name'], tag['count']) for tag in response.get_json()]
+
+
+def test_create_tag_normalizes_and_reuses_names(client, user):
+    created = client.post('/api/tags', json={'name': '  Road   Trip '}, headers=user[1])
+    assert created.status_code == 201 and created.get_json()['name'] == 'Road Trip'
+    again = client.post('/api/tags', json={'name': 'ROAD TRIP'}, headers=user[1])
+    assert again.status_code == 200 and again.get_json() == created.get_json()
+    assert client.post('/api/tags', json={'name': '   '}, headers=user[1]).status_code == 400
+    assert suggest(client, user[1], 'road') == [('Road Trip', 0)]
+
+
+def test_names_beyond_ascii_resolve_to_one_tag(client, user, make_entries):
+    # SQL lower() leaves 'É' alone on SQLite; the key is casefolded in Python
+    created = client.post('/api/tags', json={'name': 'Été'}, headers=user[1])
+    assert created.status_code == 201
+    for name in ('Été', 'ÉTÉ', 'été', 'Straße'):
+        response = client.post('/api/tags', json={'name': name}, headers=user[1])
+        assert response.status_code == (201 if name == 'Straße' else 200), name
+    assert client.post('/api/tags', json={'name': 'STRASSE'}, headers=user[1]).get_json()['name'] == 'Straße'
+
+    entry_id = make_entries(user[0], 1)[0]
+    client.post(f'/api/entries/{entry_id}/tags', json={'tag_id': created.get_json()['id']}, headers=user[1])
+    listed = client.get('/api/entries', query_string={'tag': 'ÉTÉ'}).get_json()['entries']
+    assert [entry['id'] for entry in listed] == [entry_id]
+
+
+def test_a_tag_created_meanwhile_is_returned(app, client, user, monkeypatch):
+    # As if another request inserted the tag after this one looked it up
+    import routes.tags
+
+    lookups = []
+
+    def find_after_the_race(name):
+        lookups.append(name)
+        return tags.find_tag(name) if len(lookups) > 1 else None
+
+    with app.app_context():
+        db.session.add(Tag(name='Été'))
+        db.session.commit()
+    monkeypatch.setattr(routes.tags, 'find_tag', find_after_the_race)
+    response = client.post('/api/tags', json={'name': 'ÉTÉ'}, headers=user[1])
+    assert response.status_code == 200 and response.get_json()['name'] == 'Été'
+
+
+def test_suggestions_rank_by_usage(client, user, make_entries):
+    # tag0 is on every entry, tag1 and tag2 on the first three and two
+    first = make_entries(user[0], 3, tags=3)
+    make_entries(user[0], 2, tags=1)
+    client.delete(f'/api/entries/{first[0]}/tags/3', headers=user[1])
+    assert suggest(client, user[1], 'TAG') == [('tag0', 5), ('tag1', 3), ('tag2', 2)]
+    assert suggest(client, user[1], 'tag', limit=1) == [('tag0', 5)]
+    assert suggest(client, user[1], 'tags') == []
+
+
+@pytest.mark.config(TAG_SUGGEST_SYNC_SECONDS=0)
+def test_other_processes_writes_arrive_through_the_change_log(app, client, user, monkeypatch):
+    assert suggest(client, user[1], '') == []
+
+    def write_elsewhere(*names):
+        # As another worker would: the change log, but not this index
+        with app.app_context():
+            added = [Tag(name=name) for name in names]
+            db.session.add_all(added)
+            db.session.flush()
+            for tag in added:
+                sync.tag_saved(tag.id)
+            db.session.commit()
+            return [tag.id for tag in added]
+
+    beach, = write_elsewhere('beach')
+    assert suggest(client, user[1], 'b') == [('beach', 0)]
+    with app.app_context():
+        sync.tag_removed(beach)
+        db.session.execute(db.delete(Tag).where(Tag.id == beach))
+        db.session.commit()
+    assert suggest(client, user[1], 'b') == []
+
+    # A backlog longer than a batch reloads everything instead
+    monkeypatch.setattr(tag_index, 'batch_size', 1)
+    write_elsewhere('bay', 'bike')
+    assert suggest(client, user[1], 'b') == [('bay', 0), ('bike', 0)]
+
+
+def test_key_migration_merges_names_that_differ_beyond_ascii(app, make_user):
+    spec = importlib.util.spec_from_file_location('tag_key_migration', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    assert migration.tag_key(' Road  TRIP ') == tag_key(' Road  TRIP ')
+    alice, bob = make_user('alice')[0], make_user('bob')[0]
+
+    with app.app_context(), db.engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.downgrade()
+            connection.execute(text(
+                f"INSERT INTO entries (id, location, date, user_id) VALUES "
+                f"(1, 'P', '2024-01-01', {alice}), (2, 'Q', '2024-01-01', {alice}), (3, 'R', '2024-01-01', {bob})"))
+            connection.execute(text("INSERT INTO tags (id, name, entry_count) VALUES "
+                                    "(1, 'Été', 2), (2, 'été', 2), (3, 'ÉTÉ ', 1), (4, 'ski', 0)"))
+            connection.execute(text("INSERT INTO entry_tags VALUES (1, 1), (2, 1), (2, 2), (3, 2), (1, 3)"))
+            migration.upgrade()
+
+            def rows(sql):
+                return [tuple(row) for row in connection.execute(text(sql))]
+
+            assert rows("SELECT id, key, entry_count FROM tags ORDER BY id") == [(1, 'été', 3), (4, 'ski', 0)]
+            assert rows("SELECT entry_id, tag_id FROM entry_tags ORDER BY entry_id") == [(1, 1), (2, 1), (3, 1)]
+            assert rows("SELECT user_id, entry_count FROM user_tag_stats ORDER BY user_id") == [(alice, 2), (bob, 1)]
+            # Sync clients drop the merged tags and see bob's entry move over
+            assert rows("SELECT kind, object_id, parent_id, deleted FROM changes WHERE deleted = 0") == [
+                ('entry_tag', 1, 3, False)]
+            assert sorted(rows("SELECT kind, object_id FROM changes WHERE deleted = 1")) == [
+                ('entry_tag', 2), ('entry_tag', 2), ('entry_tag', 3), ('tag', 2), ('tag', 3)]
@@ -0,0 +1,66 @@
+import os
+import time
+
+from models import db
+from auth import token_blocklist
+from passwords import password_hasher
+from replicas import replica_router
+from tags import tag_index
+import geo
+
+# Per-process setup that would otherwise land on a worker's first requests:
+# database connections (replicas included, with their first health check),
+# the revoked-token filter, the tag index, the gazetteer and the password
+# hashing pool. gunicorn.conf.py runs it in each worker before the worker
+# accepts connections.
+
+
+def warm_worker(app):
+    # Returns {step: seconds} for the log line
+    if not app.config.get('WORKER_WARMUP', True):
+        return {}
+    timings = {}
+
+    def step(name, fn):
+        started = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - started
+
+    with app.app_context():
+        step('connections', lambda: open_connections(app.config.get('WORKER_WARMUP_CONNECTIONS') or None))
+        if replica_router.replicas:
+            step('replicas', replica_router.check)
+        step('token_blocklist', token_blocklist.warm)
+        step('tag_index', tag_index.warm)
+        step('gazetteer', geo.warm)
+        step('password_hasher', password_hasher.warm)
+        db.session.remove()
+    return timings
+
+
+def open_connections(count=None):
+    # Checks out `count` connections at once from every bind's pool (default:
+    # the pool size) and returns them, so the pools start full. Pools
+    # inherited from a preloading parent process are dropped first, without
+    # closing the parent's sockets.
+    opened = 0
+    for engine in db.engines.values():
+        engine.dispose(close=False)
+        size = getattr(engine.pool, 'size', None)
+        connections = []
+        try:
+            for _ in range(count or (size() if callable(size) else 1)):
+                connections.append(engine.connect())
+        finally:
+            for connection in connections:
+                connection.close()
+        opened += len(connections)
+    return opened
+
+
+def warmup_config_from_env():
+    return {
+        'WORKER_WARMUP': os.getenv('WORKER_WARMUP', '1').lower() in ('1', 'true', 'yes', 'on'),
+        # Connections to open per worker; 0 means the pool size (DB_POOL_SIZE)
+        'WORKER_WARMUP_CONNECTIONS': int(os.getenv('WORKER_WARMUP_CONNECTIONS', 0)),
+    }